@@ -72,23 +72,68 @@ def login(api_key):
         st.error(f"❌ Erro de conexão: {e}")
         return None, None, None
 
+def format_timestamp(value):
+    """ISO 8601 em UTC do collector ("...Z") -> horário local do dashboard, com o fuso explícito"""
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, TypeError, ValueError):
+        return value or "N/A"
+    return moment.astimezone().strftime("%Y-%m-%d %H:%M:%S %Z")
+
+def fetch_incremental(path, role, limit):
+    """
+    Leitura incremental do collector (porta 4318): a primeira busca traz as
+    `limit` linhas mais recentes e o X-Watermark; as seguintes pedem só
+    since=<watermark> com If-None-Match (304 quando nada mudou) e juntam as
+    linhas novas ao cache da sessão. Devolve None se o collector falhar.
+    """
+    url = f"http://localhost:4318{path}"
+    cache = st.session_state.setdefault("telemetry_cache", {})
+    entry = cache.get(path)
+    if entry is not None and entry["role"] == role:
+        new_rows = []
+        while True:
+            response = requests.get(url, params={"role": role, "since": entry["watermark"], "limit": 5000},
+                                    headers={"If-None-Match": entry["etag"]}, timeout=10)
+            if response.status_code == 304:
+                # Corpo igual (ex.: só entraram linhas de outro time), mas o watermark pode ter andado
+                entry["watermark"] = response.headers.get("X-Watermark", entry["watermark"])
+                break
+            if response.status_code != 200:
+                cache.pop(path, None)
+                return None
+            page = response.json()
+            new_rows.extend(page)
+            entry["watermark"] = response.headers["X-Watermark"]
+            entry["etag"] = response.headers.get("ETag", "")
+            if len(page) < 5000:
+                break
+        if new_rows:
+            # Mesmo formato ISO em UTC: a ordem do texto é a ordem do tempo
+            rows = sorted(new_rows + entry["rows"], key=lambda item: item["timestamp"], reverse=True)
+            entry["rows"] = rows[:limit]
+        return entry["rows"]
+
+    response = requests.get(url, params={"role": role, "limit": limit}, timeout=10)
+    if response.status_code != 200:
+        print(f"🔍 DEBUG: Status {response.status_code} ao buscar {path}")
+        return None
+    rows = response.json()
+    if "X-Watermark" in response.headers:
+        cache[path] = {"role": role, "rows": rows, "watermark": response.headers["X-Watermark"],
+                       "etag": response.headers.get("ETag", "")}
+    return rows
+
 def fetch_secure_metrics(token, role):
     """Busca métricas do collector FastAPI (porta 4318)"""
     try:
         # Busca do collector OTLP, não do backend Java
-        response = requests.get(
-            "http://localhost:4318/api/metrics",
-            params={"role": role},
-            timeout=10
-        )
-        if response.status_code == 200:
-            data = response.json()
-            print(f"🔍 DEBUG: Recebidas {len(data)} métricas do collector")
+        data = fetch_incremental("/api/metrics", role, 500)
+        if data is not None:
+            print(f"🔍 DEBUG: {len(data)} métricas em cache do collector")
             if data:
                 print(f"🔍 DEBUG: Primeira métrica: {data[0]}")
             return data
-        else:
-            print(f"🔍 DEBUG: Status {response.status_code} ao buscar métricas")
         return []
     except Exception as e:
         print(f"Erro ao buscar métricas: {e}")
@@ -98,14 +143,7 @@ def fetch_secure_traces(token, role):
     """Busca traces do collector FastAPI (porta 4318)"""
     try:
         # Busca do collector OTLP, não do backend Java
-        response = requests.get(
-            "http://localhost:4318/api/traces",
-            params={"role": role},
-            timeout=10
-        )
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return fetch_incremental("/api/traces", role, 100) or []
     except Exception as e:
         print(f"Erro ao buscar traces: {e}")
         return []
@@ -114,14 +152,7 @@ def fetch_secure_logs(token, role):
     """Busca logs do collector FastAPI (porta 4318)"""
     try:
         # Busca do collector OTLP, não do backend Java
-        response = requests.get(
-            "http://localhost:4318/api/logs",
-            params={"role": role},
-            timeout=10
-        )
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return fetch_incremental("/api/logs", role, 100) or []
     except Exception as e:
         print(f"Erro ao buscar logs: {e}")
         return []
@@ -392,12 +423,12 @@ with tab1:
         st.warning("⚠️ Nenhuma métrica disponível no momento.")
     else:
         # O collector retorna dados já processados do SQLite
-        # Formato: [{"timestamp": "...", "service_name": "...", "metric_name": "...", "value": 123, "unit": "...", "attributes": "{}"}]
+        # Formato: [{"timestamp": "...", "service_name": "...", "metric_name": "...", "value": 123, "unit": "...", "attributes": {}}]
         flat_metrics = []
         for item in metrics_data:
             try:
-                # Parse attributes JSON
-                attributes = json.loads(item.get('attributes', '{}'))
+                # attributes já vem como objeto JSON do collector
+                attributes = item.get('attributes') or {}
                 team = attributes.get('team', 'UNKNOWN')
                 
                 flat_metrics.append({
@@ -405,7 +436,7 @@ with tab1:
                     'service_name': item.get('service_name'),
                     'value': float(item.get('value', 0)),
                     'unit': item.get('unit', ''),
-                    'timestamp': pd.to_datetime(item.get('timestamp')),
+                    'timestamp': item.get('timestamp'),
                     'teamTag': team
                 })
             except Exception as e:
@@ -420,6 +451,8 @@ with tab1:
             st.warning("⚠️ Nenhuma métrica válida encontrada.")
         else:
             df = pd.DataFrame(flat_metrics)
+            # Timestamps ISO 8601 em UTC: uma conversão vetorizada para a coluna inteira
+            df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
             st.success(f"✅ {len(df)} métricas carregadas")
             print(f"🔍 DEBUG: DataFrame criado com {len(df)} linhas")
             print(f"🔍 DEBUG: Colunas do DataFrame: {df.columns.tolist()}")
@@ -700,13 +733,13 @@ with tab2:
         st.info("ℹ️ Nenhum trace capturado. Execute operações na aplicação.")
     else:
         # O collector retorna dados já processados do SQLite
-        # Formato: [{"timestamp": "...", "trace_id": "...", "span_id": "...", "service_name": "...", "operation_name": "...", "duration_ms": 123, "attributes": "{}"}]
+        # Formato: [{"timestamp": "...", "trace_id": "...", "span_id": "...", "service_name": "...", "operation_name": "...", "duration_ms": 123, "attributes": {}}]
         
         # Agrupar por team extraindo dos attributes
         traces_by_team = {"IA": [], "IOT": [], "UNKNOWN": []}
         for trace in traces_data:
             try:
-                attributes = json.loads(trace.get('attributes', '{}'))
+                attributes = trace.get('attributes') or {}
                 team = attributes.get('team', 'UNKNOWN')
                 traces_by_team[team].append(trace)
             except:
@@ -728,7 +761,7 @@ with tab2:
                 'Operação': t.get('operation_name', 'N/A'),
                 'Serviço': t.get('service_name', 'N/A'),
                 'Duração (ms)': f"{float(t.get('duration_ms', 0)):.2f}",
-                'Timestamp': t.get('timestamp', 'N/A')[:19]
+                'Timestamp': format_timestamp(t.get('timestamp'))
             }
             for t in traces_data[:50]
         ])
@@ -744,7 +777,7 @@ with tab3:
         st.info("ℹ️ Nenhum log capturado. Verifique a configuração do logback.")
     else:
         # O collector retorna dados já processados do SQLite
-        # Formato: [{"timestamp": "...", "service_name": "...", "severity_text": "INFO", "body": "...", "attributes": "{}"}]
+        # Formato: [{"timestamp": "...", "service_name": "...", "severity_text": "INFO", "body": "...", "attributes": {}}]
         
         # Agrupar por team e severidade
         logs_by_team = {"IA": [], "IOT": [], "UNKNOWN": []}
@@ -752,7 +785,7 @@ with tab3:
         
         for log in logs_data:
             try:
-                attributes = json.loads(log.get('attributes', '{}'))
+                attributes = log.get('attributes') or {}
                 team = attributes.get('team', 'UNKNOWN')
                 logs_by_team[team].append(log)
                 
@@ -810,7 +843,7 @@ with tab3:
                     <span>{icon}</span>
                     <strong style="color: {color};">{severity}</strong>
                     <span style="color: #8b92a8; margin-left: auto; font-size: 0.9rem;">
-                        {log.get('service_name', 'N/A')} | {log.get('timestamp', 'N/A')[:19]}
+                        {log.get('service_name', 'N/A')} | {format_timestamp(log.get('timestamp'))}
                     </span>
                 </div>
                 <p style="margin: 0; color: white; font-family: monospace; font-size: 0.9rem;">
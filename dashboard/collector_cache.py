@@ -0,0 +1,119 @@
+"""
+Cache de respostas da API do dashboard (/api/metrics, /api/traces, /api/logs)
+
+Várias sessões do dashboard com auto-refresh pedem a mesma consulta a cada 5 s.
+A resposta já serializada fica em memória chaveada por (sinal, role,
+parâmetros) junto com o watermark de ingestão do sinal (collector_sequence)
+em que foi calculada: enquanto o watermark não anda, a mesma chave devolve os
+mesmos bytes sem tocar no SQLite; quando anda, a entrada é recalculada. A
+retenção limpa o cache inteiro quando remove linhas (clear).
+
+O ETag é forte: hash do corpo. Um cliente com If-None-Match igual recebe 304
+mesmo depois de o watermark andar, se a consulta dele não mudou (ex.: linhas
+novas de outro time). Pedidos simultâneos da mesma chave fazem uma consulta só:
+os demais esperam o primeiro terminar.
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_QUERY_CACHE_MB   memória máxima das respostas (padrão: 64; 0 desliga)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def strong_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+class CachedResponse:
+    __slots__ = ("watermark", "body", "headers", "etag")
+
+    def __init__(self, watermark, body, headers):
+        self.watermark = watermark
+        self.body = body
+        self.headers = headers
+        self.etag = strong_etag(body)
+
+
+class QueryCache:
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            float(os.getenv("COLLECTOR_QUERY_CACHE_MB", "64")) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()    # chave -> CachedResponse (LRU)
+        self._inflight = {}              # chave -> threading.Event do cálculo em andamento
+        self._bytes = 0
+        self._generation = 0             # muda a cada clear()
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "evictions": 0, "not_modified": 0}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key, watermark, compute):
+        """
+        Resposta de `key` no `watermark` atual; `compute()` -> (corpo em bytes,
+        headers) só roda quando não há entrada válida. Exceções de compute
+        passam direto e não ficam no cache.
+        """
+        if not self.enabled:
+            return CachedResponse(watermark, *compute())
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.watermark == watermark:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry
+                flight = self._inflight.get(key)
+                if flight is None:
+                    flight = self._inflight[key] = threading.Event()
+                    generation = self._generation
+                    self._stats["misses"] += 1
+                    break
+                self._stats["waits"] += 1
+            # Outra thread está calculando a mesma chave: espera e confere de novo
+            flight.wait(10)
+        try:
+            entry = CachedResponse(watermark, *compute())
+            self._store(key, entry, generation)
+            return entry
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.set()
+
+    def _store(self, key, entry, generation):
+        size = len(entry.body)
+        if size > self.max_bytes // 4:
+            return  # Respostas enormes não expulsam o cache inteiro
+        with self._lock:
+            if generation != self._generation:
+                return  # Calculada antes de um clear(): pode conter linhas já removidas
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self._stats["evictions"] += 1
+
+    def not_modified(self):
+        with self._lock:
+            self._stats["not_modified"] += 1
+
+    def clear(self):
+        """Descarta tudo (a retenção removeu linhas sem mudar o watermark)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes}
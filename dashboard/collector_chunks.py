@@ -0,0 +1,326 @@
+"""
+Motor opcional de chunks comprimidos para métricas gauge (estilo Gorilla)
+
+Gauges de sensores (temperature, humidity, ...) chegam em intervalos regulares
+e mudam devagar: gravados linha a linha, cada ponto custa dezenas de bytes.
+Com o motor ligado, os pontos dessas métricas também são acumulados em memória
+por série e, a cada `chunk_points` pontos (ou quando o buffer cobre mais de
+`max_span` segundos), selados num chunk comprimido gravado como BLOB em
+`metrics_chunks`, ao lado das partições brutas (que continuam sendo a fonte das
+consultas da API):
+
+- timestamps: delta-of-delta em ns, com prefixos de tamanho variável (um bit
+  quando o intervalo se repete);
+- valores: XOR com o valor anterior, guardando só os bits significativos
+  (reaproveita a janela de zeros à esquerda/direita do ponto anterior).
+
+A leitura (ChunkStore.read) decodifica os chunks direto em arrays NumPy
+(int64 para timestamps, float64 para valores). O buffer em memória segue o
+lote do BatchWriter: só é trocado depois do commit (publish) e é descartado
+se o lote falha. Num encerramento normal os buffers abertos são selados;
+numa queda eles se perdem, mas os pontos continuam nas partições brutas.
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_CHUNKS             1 liga o motor (padrão: 0)
+  COLLECTOR_CHUNK_METRICS      métricas gauge em chunks (padrão: temperature,humidity,air_quality_ppm,luminosity_lux)
+  COLLECTOR_CHUNK_POINTS       pontos por chunk (padrão: 240)
+  COLLECTOR_CHUNK_MAX_SPAN_S   intervalo máximo coberto por um chunk (padrão: 7200)
+"""
+
+import os
+import struct
+import threading
+
+import numpy as np
+
+from collector_time import NS_PER_SECOND
+
+DEFAULT_METRICS = "temperature,humidity,air_quality_ppm,luminosity_lux"
+
+CREATE_STATEMENTS = [
+    '''CREATE TABLE IF NOT EXISTS metrics_chunks
+       (series_id INTEGER NOT NULL,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        data BLOB NOT NULL)''',
+    "CREATE INDEX IF NOT EXISTS idx_metrics_chunks_series_end ON metrics_chunks (series_id, end_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_metrics_chunks_end ON metrics_chunks (end_ts)",
+]
+
+# versão do formato, pontos, primeiro timestamp, primeiro valor
+_HEADER = struct.Struct("<BIqd")
+_FORMAT_VERSION = 1
+
+# Delta-of-delta != 0: (prefixo, bits do prefixo, bits do valor com sinal);
+# em ns, 14 bits cobrem ±8 µs, 24 bits ±8 ms e 34 bits ±8,5 s de jitter
+_DOD_BUCKETS = ((0b10, 2, 14), (0b110, 3, 24), (0b1110, 4, 34))
+_DOD_FALLBACK = (0b1111, 4, 64)
+_DOD_SIZES = [size for _, _, size in _DOD_BUCKETS] + [_DOD_FALLBACK[2]]
+
+
+class _BitWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, n):
+        self._acc = (self._acc << n) | (value & ((1 << n) - 1))
+        self._bits += n
+        while self._bits >= 8:
+            self._bits -= 8
+            self.out.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self):
+        if self._bits:
+            return bytes(self.out) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self.out)
+
+
+def encode_chunk(timestamps, values):
+    """Pontos ordenados por timestamp (ns, float) -> bytes"""
+    bits = np.asarray(values, dtype=np.float64).view(np.uint64).tolist()
+    writer = _BitWriter()
+    write = writer.write
+    prev_ts, prev_delta, prev_bits = timestamps[0], 0, bits[0]
+    leading, trailing = 64, 0  # sem janela anterior
+    for i in range(1, len(bits)):
+        ts = timestamps[i]
+        delta = ts - prev_ts
+        dod = delta - prev_delta
+        prev_ts, prev_delta = ts, delta
+        if dod == 0:
+            write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                if -(1 << (value_bits - 1)) <= dod < (1 << (value_bits - 1)):
+                    break
+            else:
+                prefix, prefix_bits, value_bits = _DOD_FALLBACK
+            write(prefix, prefix_bits)
+            write(dod, value_bits)
+
+        xor = bits[i] ^ prev_bits
+        prev_bits = bits[i]
+        if xor == 0:
+            write(0, 1)
+            continue
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+        if lead >= leading and trail >= trailing:
+            # Cabe na janela do ponto anterior: só os bits significativos
+            write(0b10, 2)
+            write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = lead, trail
+            length = 64 - lead - trail
+            write(0b11, 2)
+            write(lead, 5)
+            write(length, 6)  # 64 vira 0 em 6 bits
+            write(xor >> trail, length)
+    header = _HEADER.pack(_FORMAT_VERSION, len(bits), timestamps[0], values[0])
+    return header + writer.getvalue()
+
+
+def decode_chunk(data):
+    """bytes -> (timestamps int64, valores float64) em arrays NumPy"""
+    version, count, first_ts, first_value = _HEADER.unpack_from(data)
+    if version != _FORMAT_VERSION:
+        raise ValueError(f"formato de chunk desconhecido: {version}")
+    # Leitura de bits inline (é o laço quente da varredura): `acc` guarda os
+    # próximos `avail` bits e é reabastecido 24 bytes por vez; os zeros no fim
+    # garantem que o último reabastecimento sempre lê 24 bytes
+    payload = bytes(data[_HEADER.size:]) + bytes(48)
+    pos = acc = avail = 0
+    dods = [0] * count
+    bits = [0] * count
+    prev_bits = bits[0] = struct.unpack("<Q", struct.pack("<d", first_value))[0]
+    leading = trailing = 0
+    prefix_sizes = _DOD_SIZES[:-1]
+    for i in range(1, count):
+        if avail < 160:  # um ponto ocupa no máximo 145 bits
+            acc = ((acc & ((1 << avail) - 1)) << 192) | int.from_bytes(payload[pos:pos + 24], "big")
+            pos += 24
+            avail += 192
+        avail -= 1
+        if (acc >> avail) & 1:
+            # Cada "1" a mais no prefixo passa para o próximo tamanho
+            size = _DOD_SIZES[-1]
+            for candidate in prefix_sizes:
+                avail -= 1
+                if not (acc >> avail) & 1:
+                    size = candidate
+                    break
+            avail -= size
+            dod = (acc >> avail) & ((1 << size) - 1)
+            if dod >> (size - 1):
+                dod -= 1 << size
+            dods[i] = dod
+
+        avail -= 1
+        if (acc >> avail) & 1:
+            avail -= 1
+            if (acc >> avail) & 1:
+                avail -= 11
+                window = (acc >> avail) & 0x7FF
+                leading = window >> 6
+                trailing = 64 - leading - ((window & 63) or 64)
+            n = 64 - leading - trailing
+            avail -= n
+            prev_bits ^= ((acc >> avail) & ((1 << n) - 1)) << trailing
+        bits[i] = prev_bits
+
+    # ts[i] = t0 + soma dos deltas, delta[i] = soma dos delta-of-deltas
+    timestamps = np.cumsum(np.cumsum(np.array(dods, dtype=np.int64)))
+    timestamps += first_ts
+    return timestamps, np.array(bits, dtype=np.uint64).view(np.float64)
+
+
+class ChunkStore:
+    def __init__(self, metrics=None, chunk_points=None, max_span_s=None):
+        names = metrics if metrics is not None else os.getenv("COLLECTOR_CHUNK_METRICS", DEFAULT_METRICS).split(",")
+        self.metrics = {name.strip() for name in names if name.strip()}
+        self.chunk_points = chunk_points or int(os.getenv("COLLECTOR_CHUNK_POINTS", "240"))
+        self.max_span = int((max_span_s or float(os.getenv("COLLECTOR_CHUNK_MAX_SPAN_S", "7200"))) * NS_PER_SECOND)
+
+        self._lock = threading.Lock()
+        self._heads = {}          # series_id -> ([timestamps], [valores]) ainda não selados
+        self._eligible = {}       # series_id -> gauge configurada?
+        self._pending = {}
+        self._pending_eligible = {}
+        self._pending_sealed = [0, 0, 0]
+        # Estatísticas expostas em /internal/stats (desde a subida do processo)
+        self._sealed = {"chunks_sealed": 0, "points_sealed": 0, "bytes_sealed": 0}
+
+    # --- Escrita (thread do BatchWriter, dentro da transação do lote) ---
+
+    def _is_eligible(self, conn, series_id):
+        eligible = self._eligible.get(series_id)
+        if eligible is None:
+            eligible = self._pending_eligible.get(series_id)
+        if eligible is None:
+            row = conn.execute(
+                "SELECT s.metric_name, m.type FROM series s LEFT JOIN metric_meta m ON m.metric_name = s.metric_name "
+                "WHERE s.id = ?", (series_id,)).fetchone()
+            eligible = row is not None and row[0] in self.metrics and row[1] in (None, "gauge")
+            self._pending_eligible[series_id] = eligible
+        return eligible
+
+    def _seal(self, conn, series_id, timestamps, values):
+        data = encode_chunk(timestamps, values)
+        conn.execute("INSERT INTO metrics_chunks (series_id, start_ts, end_ts, count, data) VALUES (?, ?, ?, ?, ?)",
+                     (series_id, timestamps[0], timestamps[-1], len(timestamps), data))
+        sealed = self._pending_sealed
+        sealed[0] += 1
+        sealed[1] += len(timestamps)
+        sealed[2] += len(data)
+
+    def append(self, conn, rows):
+        """Pontos (timestamp, series_id, value) gravados no lote; sela os chunks completos"""
+        touched = self._pending
+        for ts, series_id, value in rows:
+            if value is None or not self._is_eligible(conn, series_id):
+                continue
+            head = touched.get(series_id)
+            if head is None:
+                timestamps, values = self._heads.get(series_id, ((), ()))
+                head = touched[series_id] = (list(timestamps), list(values))
+            head[0].append(ts)
+            head[1].append(value)
+
+        for series_id, (timestamps, values) in touched.items():
+            if len(timestamps) < self.chunk_points and timestamps[-1] - timestamps[0] < self.max_span:
+                continue
+            # Chunks exigem ordem; pontos atrasados entram no próximo chunk da série
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+            timestamps[:] = [timestamps[i] for i in order]
+            values[:] = [values[i] for i in order]
+            while len(timestamps) >= self.chunk_points:
+                self._seal(conn, series_id, timestamps[:self.chunk_points], values[:self.chunk_points])
+                del timestamps[:self.chunk_points], values[:self.chunk_points]
+            if timestamps and timestamps[-1] - timestamps[0] >= self.max_span:
+                self._seal(conn, series_id, timestamps, values)
+                timestamps.clear()
+                values.clear()
+
+    def publish(self):
+        """Chamado após o commit do lote"""
+        with self._lock:
+            for series_id, head in self._pending.items():
+                if head[0]:
+                    self._heads[series_id] = head
+                else:
+                    self._heads.pop(series_id, None)
+            self._eligible.update(self._pending_eligible)
+            for key, n in zip(("chunks_sealed", "points_sealed", "bytes_sealed"), self._pending_sealed):
+                self._sealed[key] += n
+        self._pending = {}
+        self._pending_eligible = {}
+        self._pending_sealed = [0, 0, 0]
+
+    def discard(self):
+        """Chamado quando o lote falha (rollback): nada do lote foi gravado"""
+        self._pending = {}
+        self._pending_eligible = {}
+        self._pending_sealed = [0, 0, 0]
+
+    def flush(self, storage):
+        """Sela os buffers abertos (encerramento, depois do BatchWriter parar)"""
+        try:
+            with storage.writing() as conn:
+                with self._lock:
+                    heads = list(self._heads.items())
+                for series_id, (timestamps, values) in heads:
+                    order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+                    self._seal(conn, series_id, [timestamps[i] for i in order], [values[i] for i in order])
+        except Exception:
+            self.discard()
+            raise
+        with self._lock:
+            self._heads = {}
+        self.publish()
+
+    # --- Leitura ---
+
+    def read(self, conn, series_id, start=None, end=None):
+        """Pontos da série em [start, end) (ns) como arrays NumPy ordenados por timestamp"""
+        sql = "SELECT data FROM metrics_chunks WHERE series_id = ?"
+        params = [series_id]
+        if start is not None:
+            sql += " AND end_ts >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND start_ts < ?"
+            params.append(end)
+        parts = [decode_chunk(data) for (data,) in conn.execute(sql + " ORDER BY start_ts", params)]
+        with self._lock:
+            head = self._heads.get(series_id)
+        if head is not None:
+            parts.append((np.array(head[0], dtype=np.int64), np.array(head[1], dtype=np.float64)))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        timestamps = np.concatenate([p[0] for p in parts])
+        values = np.concatenate([p[1] for p in parts])
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps < end
+        timestamps, values = timestamps[mask], values[mask]
+        # Chunks de pontos atrasados podem se sobrepor no tempo
+        if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+            order = np.argsort(timestamps, kind="stable")
+            timestamps, values = timestamps[order], values[order]
+        return timestamps, values
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._sealed)
+            s["series_buffered"] = len(self._heads)
+            s["points_buffered"] = sum(len(head[0]) for head in self._heads.values())
+        s["bytes_per_point"] = round(s["bytes_sealed"] / s["points_sealed"], 2) if s["points_sealed"] else 0.0
+        s["metrics"] = sorted(self.metrics)
+        s["chunk_points"] = self.chunk_points
+        return s
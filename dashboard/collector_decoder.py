@@ -0,0 +1,404 @@
+"""
+Decodificador OTLP unificado (JSON e protobuf) para linhas do SQLite
+
+Um único módulo para os três sinais (metrics, traces, logs):
+- protobuf: percorre diretamente as mensagens Export*ServiceRequest, sem
+  MessageToDict (que monta um dict aninhado enorme, codifica IDs em base64 e
+  transforma int64 em string);
+- JSON: aceita tanto camelCase (padrão OTLP/JSON, usado pelos simuladores)
+  quanto snake_case.
+
+Valores AnyValue suportados: string, int, double, bool, bytes, array e kvlist.
+Os atributos do resource são decodificados e serializados uma única vez por
+resource; cada ponto só serializa os próprios atributos.
+
+As funções decode_* devolvem (linhas, rejeitados): tuplas já na ordem das
+colunas das tabelas (incluindo o time dono da linha, resolvido aqui para o
+RBAC) e quantos itens foram descartados por serem inválidos ou não suportados
+(usado no partial_success da resposta OTLP). O timestamp de cada linha é o
+time_unix_nano do OTLP, em ns (ver collector_time). Pontos de métrica são
+(timestamp, valor, chave da série) — ver collector_series; pontos
+consecutivos com os mesmos atributos compartilham a mesma tupla de chave, sem
+reserializar o JSON. Valores NaN/±inf contam como rejeitados.
+"""
+
+import base64
+import json
+import time
+from math import isfinite
+
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2
+from opentelemetry.proto.collector.logs.v1 import logs_service_pb2
+from opentelemetry.proto.trace.v1 import trace_pb2
+
+from collector_rbac import resolve_team
+
+_dumps = json.dumps
+
+# content_type usado pelo receiver gRPC (collector_grpc)
+GRPC = "application/grpc"
+
+
+# --- AnyValue / atributos ---
+
+def any_value(v):
+    """Converte um AnyValue protobuf no valor Python equivalente"""
+    kind = v.WhichOneof("value")
+    if kind is None:
+        return None
+    if kind == "array_value":
+        return [any_value(x) for x in v.array_value.values]
+    if kind == "kvlist_value":
+        return attributes(v.kvlist_value.values)
+    if kind == "bytes_value":
+        return v.bytes_value.hex()
+    return getattr(v, kind)
+
+
+def attributes(kvs):
+    return {kv.key: any_value(kv.value) for kv in kvs}
+
+
+def _json_int(raw):
+    # OTLP/JSON serializa int64 como string
+    return int(raw)
+
+
+def _json_bytes(raw):
+    # OTLP/JSON codifica bytes em base64; guardamos em hex, como os IDs
+    return base64.b64decode(raw).hex()
+
+
+def _json_array(raw):
+    return [json_any_value(x) for x in raw.get("values", ())]
+
+
+def _json_kvlist(raw):
+    return json_attributes(raw.get("values", ()))
+
+
+def _identity(raw):
+    return raw
+
+
+# Tabela de despacho: cada AnyValue JSON tem exatamente uma chave, nas duas grafias
+_JSON_VALUE_DECODERS = {
+    "stringValue": _identity, "string_value": _identity,
+    "intValue": _json_int, "int_value": _json_int,
+    "doubleValue": float, "double_value": float,
+    "boolValue": bool, "bool_value": bool,
+    "bytesValue": _json_bytes, "bytes_value": _json_bytes,
+    "arrayValue": _json_array, "array_value": _json_array,
+    "kvlistValue": _json_kvlist, "kvlist_value": _json_kvlist,
+}
+
+
+def json_any_value(v):
+    """Converte um AnyValue OTLP/JSON (camelCase ou snake_case) no valor Python"""
+    for key, raw in v.items():
+        decoder = _JSON_VALUE_DECODERS.get(key)
+        if decoder is not None:
+            return decoder(raw)
+    return None
+
+
+def json_attributes(kvs):
+    return {kv.get("key"): json_any_value(kv.get("value") or {}) for kv in kvs}
+
+
+def _get(d, camel, snake, default=None):
+    v = d.get(camel)
+    if v is None:
+        v = d.get(snake, default)
+    return v
+
+
+# --- Resource e serialização dos atributos ---
+
+class _Resource:
+    """Atributos de um resource decodificados e serializados uma única vez"""
+
+    __slots__ = ("attrs", "json", "service_name")
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.json = _dumps(attrs)
+        self.service_name = attrs.get("service.name", "unknown")
+
+    def _lookup(self, point_attrs, key):
+        # Atributo do ponto tem precedência sobre o do resource (mesma regra do merge)
+        if key in point_attrs:
+            return point_attrs[key]
+        return self.attrs.get(key)
+
+    def team(self, point_attrs, metric_name=None):
+        return resolve_team(self._lookup(point_attrs, "team"), self.service_name, metric_name)
+
+    def log_team(self, point_attrs):
+        return resolve_team(self._lookup(point_attrs, "team"), self.service_name,
+                            device_id=self._lookup(point_attrs, "device.id"),
+                            module=self._lookup(point_attrs, "module"))
+
+    def merged_json(self, point_attrs):
+        """JSON de {**resource, **ponto} reaproveitando a serialização do resource"""
+        if not point_attrs:
+            return self.json
+        if not self.attrs:
+            return _dumps(point_attrs)
+        if self.attrs.keys() & point_attrs.keys():
+            # O ponto sobrescreve chaves do resource: serializa o merge completo
+            return _dumps({**self.attrs, **point_attrs})
+        # Mesmo resultado de json.dumps do dict mesclado (separadores padrão ", ")
+        return self.json[:-1] + ", " + _dumps(point_attrs)[1:]
+
+
+class _MetricSeries:
+    """Chaves de série de uma métrica; reaproveita a última enquanto os atributos do ponto se repetem"""
+
+    __slots__ = ("res", "metric_name", "unit", "description", "kind", "team", "_last_attrs", "_last_key")
+
+    def __init__(self, res, metric_name, unit, description, kind):
+        self.res = res
+        self.metric_name = metric_name
+        self.unit = unit
+        self.description = description
+        self.kind = kind
+        # Time resolvido uma vez por métrica; só muda se o ponto trouxer "team"
+        self.team = res.team({}, metric_name)
+        self._last_attrs = None
+        self._last_key = None
+
+    def key(self, point_attrs):
+        if point_attrs == self._last_attrs:
+            return self._last_key
+        res = self.res
+        team = res.team(point_attrs, self.metric_name) if "team" in point_attrs else self.team
+        self._last_attrs = point_attrs
+        self._last_key = (self.metric_name, res.service_name, self.unit, res.merged_json(point_attrs), team,
+                          self.description, self.kind)
+        return self._last_key
+
+
+def _status_code(code):
+    # Spans sem status explícito ficam como UNSET
+    if isinstance(code, str):
+        return code
+    return trace_pb2.Status.StatusCode.Name(code) if code else "UNSET"
+
+
+def _log_body(body_val):
+    if body_val is None:
+        return ""
+    if isinstance(body_val, str):
+        return body_val
+    return _dumps(body_val)
+
+
+_METRIC_KINDS = ("gauge", "sum", "histogram")
+_UNSUPPORTED_JSON_KINDS = ("summary", "exponentialHistogram", "exponential_histogram")
+
+
+# --- Protobuf ---
+
+def decode_metrics_proto(body):
+    request = metrics_service_pb2.ExportMetricsServiceRequest()
+    request.ParseFromString(body)
+
+    rows = []
+    append = rows.append
+    rejected = 0
+    now_nano = time.time_ns()
+    for resource_metric in request.resource_metrics:
+        res = _Resource(attributes(resource_metric.resource.attributes))
+
+        for scope_metric in resource_metric.scope_metrics:
+            for metric in scope_metric.metrics:
+                kind = metric.WhichOneof("data")
+                if kind not in _METRIC_KINDS:
+                    # summary / exponential_histogram ainda não são armazenados
+                    if kind is not None:
+                        rejected += len(getattr(metric, kind).data_points)
+                    continue
+                metric_name = metric.name
+                series = _MetricSeries(res, metric_name, metric.unit, metric.description, kind)
+
+                for dp in getattr(metric, kind).data_points:
+                    if kind == "histogram":
+                        value = dp.sum
+                    else:
+                        value = dp.as_double if dp.WhichOneof("value") == "as_double" else dp.as_int
+                    if not isfinite(value):
+                        rejected += 1  # NaN/±inf: sem valor armazenável nem agregável
+                        continue
+                    append((dp.time_unix_nano or now_nano, value, series.key(attributes(dp.attributes))))
+    return rows, rejected
+
+
+def decode_traces_proto(body):
+    request = trace_service_pb2.ExportTraceServiceRequest()
+    request.ParseFromString(body)
+
+    rows = []
+    append = rows.append
+    rejected = 0
+    for resource_span in request.resource_spans:
+        res = _Resource(attributes(resource_span.resource.attributes))
+        service_name = res.service_name
+        resource_team = res.team({})
+
+        for scope_span in resource_span.scope_spans:
+            for span in scope_span.spans:
+                if not span.trace_id or not span.span_id:
+                    rejected += 1
+                    continue
+                start_time = span.start_time_unix_nano
+                duration_ms = (span.end_time_unix_nano - start_time) / 1e6
+                span_attrs = attributes(span.attributes)
+                team = res.team(span_attrs) if "team" in span_attrs else resource_team
+                append((start_time, span.trace_id.hex(), span.span_id.hex(), span.parent_span_id.hex(),
+                        service_name, span.name, duration_ms, _status_code(span.status.code),
+                        res.merged_json(span_attrs), team))
+    return rows, rejected
+
+
+def decode_logs_proto(body):
+    request = logs_service_pb2.ExportLogsServiceRequest()
+    request.ParseFromString(body)
+
+    rows = []
+    append = rows.append
+    rejected = 0
+    for resource_log in request.resource_logs:
+        res = _Resource(attributes(resource_log.resource.attributes))
+        service_name = res.service_name
+
+        for scope_log in resource_log.scope_logs:
+            for log_record in scope_log.log_records:
+                time_nano = log_record.time_unix_nano or log_record.observed_time_unix_nano
+                log_attrs = attributes(log_record.attributes)
+                append((time_nano, service_name, log_record.severity_text or "INFO",
+                        _log_body(any_value(log_record.body)),
+                        res.merged_json(log_attrs), res.log_team(log_attrs)))
+    return rows, rejected
+
+
+# --- JSON (camelCase ou snake_case) ---
+
+def decode_metrics_json(data):
+    rows = []
+    append = rows.append
+    rejected = 0
+    now_nano = time.time_ns()
+    for resource_metric in _get(data, "resourceMetrics", "resource_metrics", ()):
+        res = _Resource(json_attributes((resource_metric.get("resource") or {}).get("attributes", ())))
+
+        for scope_metric in _get(resource_metric, "scopeMetrics", "scope_metrics", ()):
+            for metric in scope_metric.get("metrics", ()):
+                metric_name = metric.get("name") or ""
+
+                for kind in _METRIC_KINDS:
+                    if kind in metric:
+                        break
+                else:
+                    for kind in _UNSUPPORTED_JSON_KINDS:
+                        if kind in metric:
+                            rejected += len(_get(metric[kind], "dataPoints", "data_points", ()))
+                    continue
+                data_points = _get(metric[kind], "dataPoints", "data_points", ())
+                series = _MetricSeries(res, metric_name, metric.get("unit", ""), metric.get("description", ""), kind)
+
+                for dp in data_points:
+                    ts_val = _get(dp, "timeUnixNano", "time_unix_nano")
+                    ts_nano = int(ts_val) if ts_val else now_nano
+
+                    if kind == "histogram":
+                        value = float(dp.get("sum", 0))
+                    else:
+                        val_double = _get(dp, "asDouble", "as_double")
+                        val_int = _get(dp, "asInt", "as_int")
+                        if val_double is not None:
+                            value = float(val_double)
+                        elif val_int is not None:
+                            value = int(val_int)
+                        else:
+                            value = 0
+                    if not isfinite(value):
+                        rejected += 1  # NaN/±inf: sem valor armazenável nem agregável
+                        continue
+                    append((ts_nano, value, series.key(json_attributes(dp.get("attributes", ())))))
+    return rows, rejected
+
+
+def decode_traces_json(data):
+    rows = []
+    append = rows.append
+    rejected = 0
+    for resource_span in _get(data, "resourceSpans", "resource_spans", ()):
+        res = _Resource(json_attributes((resource_span.get("resource") or {}).get("attributes", ())))
+        service_name = res.service_name
+        resource_team = res.team({})
+
+        for scope_span in _get(resource_span, "scopeSpans", "scope_spans", ()):
+            for span in scope_span.get("spans", ()):
+                trace_id = _get(span, "traceId", "trace_id")
+                span_id = _get(span, "spanId", "span_id")
+                if not trace_id or not span_id:
+                    rejected += 1
+                    continue
+                start_time = int(_get(span, "startTimeUnixNano", "start_time_unix_nano", 0))
+                end_time = int(_get(span, "endTimeUnixNano", "end_time_unix_nano", 0))
+                status = span.get("status") or {}
+                span_attrs = json_attributes(span.get("attributes", ()))
+                team = res.team(span_attrs) if "team" in span_attrs else resource_team
+                append((start_time, trace_id, span_id,
+                        _get(span, "parentSpanId", "parent_span_id", ""), service_name, span.get("name"),
+                        (end_time - start_time) / 1e6, _status_code(status.get("code", 0)),
+                        res.merged_json(span_attrs), team))
+    return rows, rejected
+
+
+def decode_logs_json(data):
+    rows = []
+    append = rows.append
+    rejected = 0
+    for resource_log in _get(data, "resourceLogs", "resource_logs", ()):
+        res = _Resource(json_attributes((resource_log.get("resource") or {}).get("attributes", ())))
+        service_name = res.service_name
+
+        for scope_log in _get(resource_log, "scopeLogs", "scope_logs", ()):
+            for log_record in _get(scope_log, "logRecords", "log_records", ()):
+                time_nano = int(_get(log_record, "timeUnixNano", "time_unix_nano", 0)
+                                or _get(log_record, "observedTimeUnixNano", "observed_time_unix_nano", 0))
+                body_val = log_record.get("body")
+                log_attrs = json_attributes(log_record.get("attributes", ()))
+                append((time_nano, service_name,
+                        _get(log_record, "severityText", "severity_text") or "INFO",
+                        _log_body(json_any_value(body_val) if body_val else None),
+                        res.merged_json(log_attrs), res.log_team(log_attrs)))
+    return rows, rejected
+
+
+# --- Ponto de entrada por sinal ---
+
+_DECODERS = {
+    "metrics": (decode_metrics_proto, decode_metrics_json),
+    "traces": (decode_traces_proto, decode_traces_json),
+    "logs": (decode_logs_proto, decode_logs_json),
+}
+
+
+def decode(signal, body, content_type=""):
+    """Decodifica o corpo (já descomprimido) de /v1/<signal> em (linhas, rejeitados)"""
+    decode_proto, decode_json = _DECODERS[signal]
+    if content_type == GRPC:
+        # gRPC é sempre protobuf: sem fallback, o erro devolvido é o do parser protobuf
+        return decode_proto(body)
+    # Protobuf é o padrão do OTel HTTP; JSON sempre começa com '{'
+    if "application/x-protobuf" in content_type or not body.startswith(b"{"):
+        try:
+            return decode_proto(body)
+        except Exception as e:
+            print(f"Erro ao parsear Protobuf: {e}")
+    # JSON direto ou fallback quando o Protobuf falha
+    return decode_json(json.loads(body))
@@ -1,411 +1,468 @@
-import sqlite3
-from fastapi import FastAPI, Request, HTTPException, Depends
-from pydantic import BaseModel
+import os
+import queue
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
-import json
-import time
-import gzip
+import orjson
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2
-from opentelemetry.proto.collector.trace.v1 import trace_service_pb2
-from opentelemetry.proto.collector.logs.v1 import logs_service_pb2
-from google.protobuf.json_format import MessageToDict
-
-app = FastAPI(title="Humainze OTLP Collector & API")
-
-# Configuração do Banco de Dados SQLite
-DB_NAME = "humainze_metrics.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # Tabela simples para armazenar métricas achatadas
-    c.execute('''CREATE TABLE IF NOT EXISTS metrics
-                 (timestamp DATETIME, 
-                  service_name TEXT, 
-                  metric_name TEXT, 
-                  value REAL, 
-                  unit TEXT, 
-                  attributes TEXT)''')
-    
-    # Tabela para Traces (Spans)
-    c.execute('''CREATE TABLE IF NOT EXISTS traces
-                 (timestamp DATETIME, 
-                  trace_id TEXT,
-                  span_id TEXT,
-                  parent_span_id TEXT,
-                  service_name TEXT, 
-                  operation_name TEXT, 
-                  duration_ms REAL, 
-                  status_code TEXT,
-                  attributes TEXT)''')
-
-    # Tabela para Logs
-    c.execute('''CREATE TABLE IF NOT EXISTS logs
-                 (timestamp DATETIME, 
-                  service_name TEXT, 
-                  severity_text TEXT, 
-                  body TEXT, 
-                  attributes TEXT)''')
-
-    conn.commit()
-    conn.close()
-
-init_db()
-
-def save_metric(timestamp, service_name, metric_name, value, unit, attributes):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)", 
-              (timestamp, service_name, metric_name, value, unit, json.dumps(attributes)))
-    conn.commit()
-    conn.close()
-
-def save_trace(timestamp, trace_id, span_id, parent_span_id, service_name, operation_name, duration_ms, status_code, attributes):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO traces VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-              (timestamp, trace_id, span_id, parent_span_id, service_name, operation_name, duration_ms, status_code, json.dumps(attributes)))
-    conn.commit()
-    conn.close()
-
-def save_log(timestamp, service_name, severity_text, body, attributes):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO logs VALUES (?, ?, ?, ?, ?)", 
-              (timestamp, service_name, severity_text, body, json.dumps(attributes)))
-    conn.commit()
-    conn.close()
+from typing import List, Optional
+from collector_grpc import GrpcReceiver
+from collector_pipeline import DecodePool
+from collector_stats import CollectorStats
+from collector_responses import IngestRejected, InvalidPayload, encode, export_response, status_message, wants_json
+from google.rpc import code_pb2
+from collector_query import (MAX_LIMIT, InvalidQuery, build_aggregate, build_select, fetch_aggregate, iter_page,
+                             iter_since, page_boundary, page_rows, parse_attribute_filters, parse_duration,
+                             parse_percentiles, resolve_resolution, since_boundary, since_rows)
+from collector_formats import MEDIA_TYPES, encode_rows, encode_rows_stream, negotiate
+from collector_storage import ReadersBusy, Storage
+from collector_writer import BatchWriter
+from collector_rollups import apply_rollups
+from collector_retention import RetentionManager
+from collector_chunks import ChunkStore
+from collector_hotwindow import HotWindow
+from collector_cache import QueryCache
+from collector_live import LiveHub, TooManySubscribers
+from collector_time import NS_PER_SECOND, now_ns, to_iso, to_ns
+
+# Configuração do Banco de Dados SQLite (WAL + conexões persistentes)
+storage = Storage()
+
+# Auto-telemetria em memória (/internal/stats e /metrics)
+stats = CollectorStats()
+
+# --- Escrita em lote (write-behind) ---
+# Os receivers só enfileiram linhas; a thread do BatchWriter grava com executemany
+# na partição diária de cada linha ({table}), com a sequência de ingestão como rowid
+INSERT_STATEMENTS = {
+    "metrics": "INSERT INTO {table} (rowid, timestamp, series_id, value) VALUES (?, ?, ?, ?)",
+    "traces": "INSERT INTO {table} (rowid, timestamp, trace_id, span_id, parent_span_id, service_name, "
+              "operation_name, duration_ms, status_code, attributes, team) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "logs": "INSERT INTO {table} (rowid, timestamp, service_name, severity_text, body, attributes, team) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+}
+
+# --- Cache de respostas da API (por role/parâmetros, invalidado pelo watermark) ---
+query_cache = QueryCache()
+
+# --- Janela quente: últimos minutos de cada série em memória para /api/metrics ---
+hot_window = HotWindow()
+
+# --- Live tail (SSE): linhas novas empurradas para os assinantes após o commit ---
+live = LiveHub(storage)
+live_metrics = live.hook("metrics")
+
+# --- Chunks comprimidos das gauges (opcional, COLLECTOR_CHUNKS=1) ---
+# Gravados ao lado das partições brutas, na mesma transação do lote
+chunks = ChunkStore() if os.getenv("COLLECTOR_CHUNKS", "0") == "1" else None
+
+def after_metrics_write(conn, rows, rowids):
+    apply_rollups(conn, rows)
+    hot_window.stage(conn, rows, rowids)
+    live_metrics(conn, rows)
+    if chunks is not None:
+        chunks.append(conn, rows)
+
+writer = BatchWriter(
+    storage,
+    INSERT_STATEMENTS,
+    max_batch_rows=int(os.getenv("COLLECTOR_BATCH_ROWS", "2000")),
+    flush_interval=float(os.getenv("COLLECTOR_FLUSH_INTERVAL_MS", "250")) / 1000,
+    max_queue_rows=int(os.getenv("COLLECTOR_QUEUE_MAX_ROWS", "200000")),
+    on_insert=stats.record_insert,
+    # Pontos de métrica chegam com a chave da série e são gravados com o series_id
+    before_write={"metrics": storage.series.intern_rows},
+    # Rollups 1m/5m/1h (e chunks) atualizados na mesma transação do lote bruto
+    after_write={"metrics": after_metrics_write, "traces": live.hook("traces"), "logs": live.hook("logs")},
+    participants=[hot_window, live, *([chunks] if chunks is not None else [])],
+)
+
+# --- Decodificação fora do event loop ---
+# Descompressão e parsing rodam num pool de threads ou processos (COLLECTOR_DECODE_MODE)
+decoder_pool = DecodePool()
+
+async def ingest_bytes(signal, body, content_encoding='', content_type=''):
+    """Caminho comum de ingestão para HTTP e gRPC; devolve (aceitos, rejeitados)"""
+    try:
+        if not writer.running:
+            raise IngestRejected("collector encerrando, tente novamente", status_code=503, retry_after=5)
+        rows, rejected, timings = await decoder_pool.run(signal, body, content_encoding, content_type)
+        # Não bloqueia o loop: com a fila de escrita cheia, recusa a requisição inteira
+        try:
+            writer.submit(signal, rows, timeout=0)
+        except queue.Full as e:
+            raise IngestRejected(str(e), status_code=429, retry_after=decoder_pool.retry_after)
+    except IngestRejected:
+        stats.record_rejected_request(signal)
+        raise
+    except Exception:
+        stats.record_error(signal)
+        raise
+    stats.record_request(signal, len(body), len(rows), rejected, timings)
+    return len(rows), rejected
+
+# Receiver OTLP/gRPC (porta 4317) alimentando o mesmo pipeline
+grpc_receiver = GrpcReceiver(ingest_bytes)
+
+# --- Retenção (TTL por sinal/severidade, DELETE em pedaços + incremental_vacuum) ---
+retention = RetentionManager(storage, on_expire=lambda: query_cache.clear())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    storage.open()
+    # Aquecida antes do BatchWriter: nada é gravado entre a leitura e a primeira publicação
+    hot_window.load(storage)
+    writer.start()
+    decoder_pool.start()
+    retention.start()
+    await grpc_receiver.start()
+    yield
+    await grpc_receiver.stop()
+    retention.stop()
+    decoder_pool.stop()
+    # Descarrega tudo que ainda está na fila antes de encerrar
+    writer.stop()
+    if chunks is not None:
+        chunks.flush(storage)
+    storage.close()
+
+app = FastAPI(title="Humainze OTLP Collector & API", lifespan=lifespan)
+
+@app.exception_handler(ReadersBusy)
+async def readers_busy(request: Request, exc: ReadersBusy):
+    # Sobrecarga de leitura, como na ingestão: 503 + Retry-After em vez de 500
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
 
 # --- OTLP Receiver ---
+# Respostas seguem a especificação OTLP/HTTP: Export*ServiceResponse com
+# partial_success em caso de sucesso, 429/503 + Retry-After em sobrecarga
+# (o exporter faz backoff e reenvia) e 400 com google.rpc.Status só em erro de
+# parsing; falhas internas viram 503 + Retry-After para o dado não ser perdido.
 
-@app.post("/v1/metrics")
-async def receive_metrics(request: Request):
+async def ingest(signal, request: Request):
+    content_type = request.headers.get('content-type', '')
+    as_json = wants_json(content_type)
     try:
+        # Recusa antes de ler o corpo quando o Content-Length já estoura o orçamento
+        try:
+            content_length = int(request.headers.get('content-length') or 0)
+        except ValueError:
+            content_length = 0
+        if not decoder_pool.has_room(content_length):
+            stats.record_rejected_request(signal)
+            raise decoder_pool.reject(content_length)
+
+        # O event loop só recebe os bytes; GZIP e Protobuf/JSON são tratados no pool
         body = await request.body()
-        
-        # 1. Decompress GZIP if needed
-        if 'gzip' in request.headers.get('content-encoding', ''):
-            try:
-                body = gzip.decompress(body)
-            except Exception as e:
-                print(f"Erro ao descomprimir GZIP: {e}")
-        
-        # 2. Detectar Formato (Protobuf vs JSON)
-        content_type = request.headers.get('content-type', '')
-        data = {}
-
-        # Tenta Protobuf primeiro (padrão do OTel HTTP)
-        if 'application/x-protobuf' in content_type or not body.startswith(b'{'):
-            try:
-                request_proto = metrics_service_pb2.ExportMetricsServiceRequest()
-                request_proto.ParseFromString(body)
-                data = MessageToDict(request_proto, preserving_proto_field_name=True)
-            except Exception as e:
-                print(f"Erro ao parsear Protobuf: {e}")
-                # Fallback para JSON
-                try:
-                    data = json.loads(body.decode('utf-8'))
-                except:
-                    raise e
-        else:
-            # JSON direto
-            try:
-                data = json.loads(body)
-            except:
-                data = json.loads(body.decode('utf-8'))
-        
-        # Parser simplificado de OTLP JSON (funciona para ambos agora)
-        for resource_metric in data.get('resource_metrics', data.get('resourceMetrics', [])):
-            # Extrair atributos do recurso (ex: service.name)
-            resource_attrs = {}
-            # Protobuf converte para 'attributes', JSON as vezes usa 'attributes'
-            res = resource_metric.get('resource', {})
-            attrs = res.get('attributes', [])
-            
-            for attr in attrs:
-                key = attr.get('key')
-                val = attr.get('value', {})
-                # Tenta pegar stringValue, intValue, boolValue, etc.
-                # MessageToDict usa snake_case (string_value), JSON usa camelCase (stringValue)
-                resource_attrs[key] = val.get('string_value') or val.get('stringValue') or \
-                                      str(val.get('int_value')) or str(val.get('intValue')) or \
-                                      str(val.get('bool_value')) or str(val.get('boolValue')) or ''
-            
-            service_name = resource_attrs.get('service.name', 'unknown')
-
-            for scope_metric in resource_metric.get('scope_metrics', resource_metric.get('scopeMetrics', [])):
-                for metric in scope_metric.get('metrics', []):
-                    metric_name = metric.get('name')
-                    unit = metric.get('unit', '')
-                    
-                    # Lidar com diferentes tipos de dados (Gauge, Sum, etc)
-                    data_points = []
-                    if 'gauge' in metric:
-                        data_points = metric['gauge'].get('data_points', metric['gauge'].get('dataPoints', []))
-                    elif 'sum' in metric:
-                        data_points = metric['sum'].get('data_points', metric['sum'].get('dataPoints', []))
-                    elif 'histogram' in metric:
-                        data_points = metric['histogram'].get('data_points', metric['histogram'].get('dataPoints', []))
-                    
-                    for dp in data_points:
-                        # Timestamp OTLP é em nanosegundos
-                        # MessageToDict pode converter int64 para string, então garantimos int
-                        ts_val = dp.get('time_unix_nano') or dp.get('timeUnixNano')
-                        ts_nano = int(ts_val) if ts_val else int(time.time() * 1e9)
-                        timestamp = datetime.fromtimestamp(ts_nano / 1e9)
-                        
-                        # Valor pode ser asDouble ou asInt
-                        val_double = dp.get('as_double') or dp.get('asDouble')
-                        val_int = dp.get('as_int') or dp.get('asInt')
-                        value = val_double if val_double is not None else (val_int if val_int is not None else 0)
-                        
-                        # Atributos específicos do datapoint
-                        dp_attrs = {}
-                        for attr in dp.get('attributes', []):
-                            key = attr.get('key')
-                            val = attr.get('value', {})
-                            dp_attrs[key] = val.get('string_value') or val.get('stringValue') or \
-                                            str(val.get('int_value')) or str(val.get('intValue')) or \
-                                            str(val.get('bool_value')) or str(val.get('boolValue')) or ''
-                        
-                        # Mesclar atributos
-                        full_attributes = {**resource_attrs, **dp_attrs}
-                        
-                        save_metric(timestamp, service_name, metric_name, value, unit, full_attributes)
-
-        return {"status": "success"}
+        accepted, rejected = await ingest_bytes(
+            signal, body, request.headers.get('content-encoding', ''), content_type)
+    except IngestRejected as e:
+        payload, media_type = encode(status_message(str(e), code_pb2.UNAVAILABLE), as_json)
+        return Response(payload, status_code=e.status_code, media_type=media_type,
+                        headers={"Retry-After": str(e.retry_after)})
+    except InvalidPayload as e:
+        print(f"Erro ao processar {signal}: {e}")
+        payload, media_type = encode(status_message(str(e)), as_json)
+        return Response(payload, status_code=400, media_type=media_type)
     except Exception as e:
-        print(f"Erro ao processar métrica: {e}")
-        # Não retorna 500 para não spamar o log do Java, apenas loga o erro
-        return {"status": "error", "message": str(e)}
+        print(f"❌ Erro interno ao processar {signal}: {e}")
+        payload, media_type = encode(status_message(str(e), code_pb2.UNAVAILABLE), as_json)
+        return Response(payload, status_code=503, media_type=media_type,
+                        headers={"Retry-After": str(decoder_pool.retry_after)})
+
+    payload, media_type = encode(export_response(signal, rejected), as_json)
+    return Response(payload, media_type=media_type)
+
+@app.post("/v1/metrics")
+async def receive_metrics(request: Request):
+    return await ingest("metrics", request)
 
 @app.post("/v1/traces")
 async def receive_traces(request: Request):
-    try:
-        body = await request.body()
-        if 'gzip' in request.headers.get('content-encoding', ''):
-            body = gzip.decompress(body)
-        
-        content_type = request.headers.get('content-type', '')
-        data = {}
-
-        if 'application/x-protobuf' in content_type or not body.startswith(b'{'):
-            try:
-                request_proto = trace_service_pb2.ExportTraceServiceRequest()
-                request_proto.ParseFromString(body)
-                data = MessageToDict(request_proto, preserving_proto_field_name=True)
-            except:
-                data = json.loads(body.decode('utf-8'))
-        else:
-            try:
-                data = json.loads(body)
-            except:
-                data = json.loads(body.decode('utf-8'))
-
-        for resource_span in data.get('resource_spans', []):
-            resource_attrs = {}
-            res = resource_span.get('resource', {})
-            for attr in res.get('attributes', []):
-                key = attr.get('key')
-                val = attr.get('value', {})
-                resource_attrs[key] = val.get('string_value') or val.get('stringValue') or str(val)
-            
-            service_name = resource_attrs.get('service.name', 'unknown')
-
-            for scope_span in resource_span.get('scope_spans', []):
-                for span in scope_span.get('spans', []):
-                    trace_id = span.get('trace_id')
-                    span_id = span.get('span_id')
-                    parent_span_id = span.get('parent_span_id', '')
-                    name = span.get('name')
-                    
-                    start_time = int(span.get('start_time_unix_nano', 0))
-                    end_time = int(span.get('end_time_unix_nano', 0))
-                    duration_ms = (end_time - start_time) / 1e6
-                    timestamp = datetime.fromtimestamp(start_time / 1e9)
-                    
-                    status = span.get('status', {})
-                    status_code = status.get('code', 'UNSET')
-                    
-                    span_attrs = {}
-                    for attr in span.get('attributes', []):
-                        key = attr.get('key')
-                        val = attr.get('value', {})
-                        span_attrs[key] = val.get('string_value') or val.get('stringValue') or str(val)
-                    
-                    full_attributes = {**resource_attrs, **span_attrs}
-                    
-                    save_trace(timestamp, trace_id, span_id, parent_span_id, service_name, name, duration_ms, status_code, full_attributes)
-
-        return {"status": "success"}
-    except Exception as e:
-        print(f"Erro ao processar trace: {e}")
-        return {"status": "error", "message": str(e)}
+    return await ingest("traces", request)
 
 @app.post("/v1/logs")
 async def receive_logs(request: Request):
+    return await ingest("logs", request)
+
+# --- API para o Dashboard (com filtro de Role) ---
+# RBAC (Zero Trust) aplicado no SQL: o time de cada linha já foi resolvido na
+# ingestão (collector_rbac). Traces e logs filtram pelo índice (team, timestamp);
+# em metrics o time é da série, e role/métrica/serviço/atributos viram os
+# series_id lidos pelo índice (series_id, timestamp) (collector_query).
+# Filtros viram predicados SQL; a próxima página vem no header X-Next-Cursor
+# (keyset sobre timestamp/rowid, sem OFFSET) e o corpo continua sendo a lista.
+# Só as partições diárias que cruzam o intervalo (e o cursor) são consultadas.
+# start/end sem fuso são UTC; o timestamp devolvido é ISO 8601 em UTC (sufixo Z).
+# Leitura incremental: toda resposta traz X-Watermark (sequência de ingestão do
+# sinal, collector_sequence); com since=<watermark> voltam só as linhas gravadas
+# depois dele, em ordem de ingestão, e X-Watermark é o próximo since.
+# Respostas ficam no cache por (sinal, role, parâmetros) até o watermark andar
+# (collector_cache); o ETag é forte (hash do corpo) e If-None-Match igual -> 304.
+# HEAD devolve só os headers. format=json|columns|arrow (ou Accept com o media
+# type do Arrow) escolhe o corpo, ver collector_formats.
+
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+def run_query(table, role, start, end, attr, cursor, limit, since, upto, columns, fmt="json"):
+    """(corpo em bytes no formato `fmt`, headers) de uma consulta da API, limitada ao watermark `upto`"""
     try:
-        body = await request.body()
-        if 'gzip' in request.headers.get('content-encoding', ''):
-            body = gzip.decompress(body)
-        
-        content_type = request.headers.get('content-type', '')
-        data = {}
-
-        if 'application/x-protobuf' in content_type or not body.startswith(b'{'):
-            try:
-                request_proto = logs_service_pb2.ExportLogsServiceRequest()
-                request_proto.ParseFromString(body)
-                data = MessageToDict(request_proto, preserving_proto_field_name=True)
-            except:
-                data = json.loads(body.decode('utf-8'))
+        attributes = parse_attribute_filters(attr)
+        # Páginas cobertas pela janela quente não tocam no SQLite
+        page = None
+        if table == "metrics" and since is None and fmt == "json":
+            page = hot_window.query(role, start=start, end=end, columns=columns, attributes=attributes,
+                                    cursor=cursor, limit=limit, upto=upto)
+        if page is None:
+            query = build_select(table, role, storage.partitions, start=start, end=end, columns=columns,
+                                 attributes=attributes, cursor=cursor, limit=limit, since=since, upto=upto,
+                                 series=storage.series)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Watermark": str(upto)}
+    rows, next_cursor = [], None
+    if page is not None:
+        items, next_cursor = page
+    elif query is not None:  # None: role desconhecida não vê nada
+        with storage.reader() as conn:
+            if since is not None:
+                rows, watermark = since_rows(conn, query, upto)
+                headers["X-Watermark"] = str(watermark)
+            else:
+                rows, next_cursor = page_rows(conn, query)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if page is not None:
+        return orjson.dumps(items), headers
+    return encode_rows(table, rows, fmt), headers
+
+
+def stream_query(table, role, start, end, attr, cursor, limit, since, upto, columns, fmt):
+    """
+    (gerador de pedaços, headers) de uma leitura grande: os headers saem de uma
+    passada só pelas chaves e as linhas vêm do cursor enquanto o corpo é enviado,
+    as duas no mesmo snapshot
+    """
+    try:
+        query = build_select(table, role, storage.partitions, start=start, end=end, columns=columns,
+                             attributes=parse_attribute_filters(attr), cursor=cursor, limit=limit, since=since,
+                             upto=upto, series=storage.series)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Watermark": str(upto)}
+    if query is None:
+        return encode_rows_stream(table, (), fmt), headers
+    snapshot = storage.snapshot()
+    try:
+        if since is not None:
+            watermark = since_boundary(snapshot.conn, query, upto)
+            headers["X-Watermark"] = str(watermark)
+            rows = iter_since(snapshot.conn, query, watermark)
         else:
-            try:
-                data = json.loads(body)
-            except:
-                data = json.loads(body.decode('utf-8'))
-
-        for resource_log in data.get('resource_logs', []):
-            resource_attrs = {}
-            res = resource_log.get('resource', {})
-            for attr in res.get('attributes', []):
-                key = attr.get('key')
-                val = attr.get('value', {})
-                resource_attrs[key] = val.get('string_value') or val.get('stringValue') or str(val)
-            
-            service_name = resource_attrs.get('service.name', 'unknown')
-
-            for scope_log in resource_log.get('scope_logs', []):
-                for log_record in scope_log.get('log_records', []):
-                    time_nano = int(log_record.get('time_unix_nano', 0))
-                    timestamp = datetime.fromtimestamp(time_nano / 1e9)
-                    
-                    severity_text = log_record.get('severity_text', 'INFO')
-                    
-                    body_val = log_record.get('body', {})
-                    log_body = body_val.get('string_value') or body_val.get('stringValue') or str(body_val)
-                    
-                    log_attrs = {}
-                    for attr in log_record.get('attributes', []):
-                        key = attr.get('key')
-                        val = attr.get('value', {})
-                        log_attrs[key] = val.get('string_value') or val.get('stringValue') or str(val)
-                    
-                    full_attributes = {**resource_attrs, **log_attrs}
-                    
-                    save_log(timestamp, service_name, severity_text, log_body, full_attributes)
-
-        return {"status": "success"}
-    except Exception as e:
-        print(f"Erro ao processar log: {e}")
-        return {"status": "error", "message": str(e)}
+            next_cursor = page_boundary(snapshot.conn, query)
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+            rows = iter_page(snapshot.conn, query)
+    except BaseException:
+        snapshot.close()
+        raise
+    return close_after(snapshot, encode_rows_stream(table, rows, fmt)), headers
 
-# --- API para o Dashboard (com filtro de Role) ---
 
-@app.get("/api/metrics")
-def get_metrics(role: str):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    
-    # Query base
-    query = "SELECT * FROM metrics ORDER BY timestamp DESC LIMIT 500"
-    cursor = conn.execute(query)
-    rows = cursor.fetchall()
-    conn.close()
-    
-    data = [dict(row) for row in rows]
-    
-    # Filtragem de Segurança (RBAC) no lado da API Python
-    filtered_data = []
-    
-    for row in data:
-        attributes = json.loads(row['attributes'])
-        service_name = row.get('service_name', '')
-        metric_name = row['metric_name']
-        team = attributes.get('team', '')
-        
-        # Lógica de Zero Trust / RBAC
-        if role == "ROLE_ADMIN":
-            filtered_data.append(row)  # Admin vê TUDO (IA + IoT + Java)
-            
-        elif role == "ROLE_IOT":
-            # IoT vê apenas métricas de serviços IoT ou sensores físicos
-            if (team == "IOT" or 
-                "humainze-iot" in service_name or
-                metric_name in ["temperature", "humidity", "air_quality_ppm", "luminosity_lux"]):
-                filtered_data.append(row)
-                
-        elif role == "ROLE_IA":
-            # IA vê apenas métricas de serviços IA ou ML
-            if (team == "IA" or 
-                "humainze-ia" in service_name or
-                metric_name in ["mobile_dashboard_views", "prediction_count", "anomalies_detected", "model_inference_duration_ms"]):
-                filtered_data.append(row)
-    
-    return filtered_data
-
-@app.get("/api/traces")
-def get_traces(role: str):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.execute("SELECT * FROM traces ORDER BY timestamp DESC LIMIT 100")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    data = [dict(row) for row in rows]
-    filtered_data = []
-    
-    for row in data:
-        attributes = json.loads(row['attributes'])
-        service_name = row.get('service_name', '')
-        team = attributes.get('team', '')
-        
-        # RBAC Logic
-        if role == "ROLE_ADMIN":
-            filtered_data.append(row)  # Admin vê TODOS os traces
-        elif role == "ROLE_IOT":
-            # IoT vê apenas traces de dispositivos IoT
-            if team == "IOT" or "humainze-iot" in service_name:
-                filtered_data.append(row)
-        elif role == "ROLE_IA":
-            # IA vê apenas traces de operações de ML
-            if team == "IA" or "humainze-ia" in service_name:
-                filtered_data.append(row)
-                
-    return filtered_data
-
-@app.get("/api/logs")
-def get_logs(role: str):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.execute("SELECT * FROM logs ORDER BY timestamp DESC LIMIT 100")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    data = [dict(row) for row in rows]
-    filtered_data = []
-    
-    for row in data:
-        attributes = json.loads(row['attributes'])
-        service_name = row.get('service_name', '')
-        team = attributes.get('team', '')
-        
-        # RBAC Logic
-        if role == "ROLE_ADMIN":
-            filtered_data.append(row)  # Admin vê TODOS os logs
-        elif role == "ROLE_IOT":
-            # IoT vê apenas logs de dispositivos IoT
-            if team == "IOT" or "humainze-iot" in service_name or attributes.get('device.id'):
-                filtered_data.append(row)
-        elif role == "ROLE_IA":
-            # IA vê apenas logs de operações de ML
-            if team == "IA" or "humainze-ia" in service_name or attributes.get('module') in ['ml.inference', 'api.mobile', 'cache.manager', 'db.connector']:
-                filtered_data.append(row)
-                
-    return filtered_data
+def close_after(snapshot, chunks):
+    """Fecha a conexão do snapshot ao fim do corpo (ou quando o cliente desconecta)"""
+    try:
+        yield from chunks
+    finally:
+        snapshot.close()
+
+
+def query_api(table, request, role, limit, cursor, start, end, attr, since, format, **columns):
+    try:
+        fmt = negotiate(format, request.headers.get("accept"), stream=limit > MAX_LIMIT)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type = MEDIA_TYPES[fmt]
+    # Lido antes da consulta: linhas de lotes commitados depois ficam para o próximo since
+    upto = storage.sequence.watermark(table)
+    if limit > MAX_LIMIT:
+        # Leituras grandes (até MAX_STREAM_LIMIT): sem cache nem ETag, linhas codificadas conforme saem do cursor
+        if request.method == "HEAD":
+            return Response(headers={"X-Watermark": str(upto)}, media_type=media_type)
+        chunks, headers = stream_query(table, role, start, end, attr, cursor, limit, since, upto, columns, fmt)
+        return StreamingResponse(chunks, headers=headers, media_type=media_type)
+    key = (table, role, to_ns(start) if start is not None else None, to_ns(end) if end is not None else None,
+           tuple(attr), cursor, limit, since, tuple(sorted(columns.items())), fmt)
+    cached = query_cache.get(key, upto, lambda: run_query(table, role, start, end, attr, cursor, limit, since,
+                                                          upto, columns, fmt))
+    headers = {**cached.headers, "ETag": cached.etag}
+    if etag_matches(request, cached.etag):
+        query_cache.not_modified()
+        return Response(status_code=304, headers=headers)
+    if request.method == "HEAD":
+        return Response(headers=headers, media_type=media_type)
+    return Response(content=cached.body, headers=headers, media_type=media_type)
+
+@app.api_route("/api/metrics", methods=["GET", "HEAD"])
+def get_metrics(request: Request, role: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None, metric_name: Optional[str] = None,
+                service_name: Optional[str] = None, attr: List[str] = Query(default=[]),
+                cursor: Optional[str] = None, since: Optional[int] = None, limit: int = 500,
+                format: Optional[str] = None):
+    return query_api("metrics", request, role, limit, cursor, start, end, attr, since, format,
+                     metric_name=metric_name, service_name=service_name)
+
+# Percentis só existem na tabela bruta: até esta janela ela é usada quando pedidos
+RAW_PERCENTILE_WINDOW_S = int(os.getenv("COLLECTOR_RAW_PERCENTILE_WINDOW_S", str(6 * 3600)))
+
+@app.get("/api/metrics/aggregate")
+def aggregate_metrics(role: str, metric_name: str, step: str = "1m", window: str = "1h",
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      group_by: List[str] = Query(default=[]), percentiles: str = "50,90,99",
+                      service_name: Optional[str] = None, attr: List[str] = Query(default=[]),
+                      resolution: str = "auto"):
+    """
+    Série agregada por bucket de `step`; janela = [start, end) ou os últimos `window`.
+    resolution=auto escolhe o rollup (1m/5m/1h) mais grosso que divide o step,
+    ou a tabela bruta (raw) quando há percentis numa janela curta.
+    """
+    try:
+        step_s = parse_duration(step)
+        end = to_ns(end) if end is not None else now_ns()
+        start = to_ns(start) if start is not None else end - parse_duration(window) * NS_PER_SECOND
+        wanted = parse_percentiles(percentiles)
+        source = resolve_resolution(resolution, step_s, (end - start) / NS_PER_SECOND, bool(wanted),
+                                    RAW_PERCENTILE_WINDOW_S)
+        query = build_aggregate(role, metric_name, step_s, start, end, storage.partitions, group_by=group_by,
+                                percentiles=wanted, service_name=service_name,
+                                attributes=parse_attribute_filters(attr), resolution=source)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    series = []
+    if query is not None:
+        with storage.reader() as conn:
+            series = fetch_aggregate(conn, *query, group_by=group_by)
+    return Response(orjson.dumps({"metric_name": metric_name, "step_seconds": step_s, "start": to_iso(start),
+                                  "end": to_iso(end), "group_by": group_by,
+                                  "source": f"rollup_{source}" if source else "raw", "series": series}),
+                    media_type="application/json")
+
+@app.api_route("/api/traces", methods=["GET", "HEAD"])
+def get_traces(request: Request, role: str, start: Optional[datetime] = None,
+               end: Optional[datetime] = None, service_name: Optional[str] = None,
+               trace_id: Optional[str] = None, attr: List[str] = Query(default=[]),
+               cursor: Optional[str] = None, since: Optional[int] = None, limit: int = 100,
+               format: Optional[str] = None):
+    return query_api("traces", request, role, limit, cursor, start, end, attr, since, format,
+                     service_name=service_name, trace_id=trace_id)
+
+@app.api_route("/api/logs", methods=["GET", "HEAD"])
+def get_logs(request: Request, role: str, start: Optional[datetime] = None,
+             end: Optional[datetime] = None, service_name: Optional[str] = None,
+             severity: Optional[str] = None, attr: List[str] = Query(default=[]),
+             cursor: Optional[str] = None, since: Optional[int] = None, limit: int = 100,
+             format: Optional[str] = None):
+    return query_api("logs", request, role, limit, cursor, start, end, attr, since, format,
+                     service_name=service_name, severity_text=severity)
+
+# Filtros do live tail -> coluna de cada sinal (o filtro só vale para os sinais que têm a coluna)
+STREAM_FILTERS = {
+    "metrics": ("metric_name", "service_name"),
+    "traces": ("service_name", "trace_id"),
+    "logs": ("service_name", "severity_text"),
+}
+
+@app.get("/api/stream")
+async def stream(request: Request, role: str, signals: str = "metrics,traces,logs",
+                 metric_name: Optional[str] = None, service_name: Optional[str] = None,
+                 trace_id: Optional[str] = None, severity: Optional[str] = None,
+                 attr: List[str] = Query(default=[])):
+    """
+    Live tail por Server-Sent Events: linhas novas de `signals` (mesmo formato
+    de /api/metrics, /api/traces e /api/logs) assim que o lote é commitado.
+    """
+    tables = [s.strip() for s in signals.split(",") if s.strip()]
+    if not tables or any(t not in STREAM_FILTERS for t in tables):
+        raise HTTPException(status_code=400, detail="signals deve conter metrics, traces e/ou logs")
+    given = {"metric_name": metric_name, "service_name": service_name, "trace_id": trace_id,
+             "severity_text": severity}
+    columns = {t: {c: given[c] for c in STREAM_FILTERS[t] if given[c] is not None} for t in tables}
+    try:
+        subscriber = live.subscribe(role, tables, columns, parse_attribute_filters(attr))
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if subscriber is None:
+        raise HTTPException(status_code=403, detail="Role sem acesso a dados")
+    return StreamingResponse(live.events(subscriber, request.is_disconnected), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Health checks ---
+# Respondem em O(1): nenhum acesso a tabela, só estado em memória do processo
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Acima desta fração da fila de escrita o collector se declara não pronto
+READY_QUEUE_RATIO = float(os.getenv("COLLECTOR_READY_QUEUE_RATIO", "0.9"))
+
+@app.get("/readyz")
+def readyz():
+    checks = {
+        "writer_running": writer.running,
+        "writer_queue_ok": writer.queue_depth() < writer.max_queue_rows * READY_QUEUE_RATIO,
+        "last_flush_ok": writer.last_error is None,
+        "decoder_running": decoder_pool.running,
+        "db_writable": storage.writable(),
+    }
+    ready = all(checks.values())
+    body = {"status": "ready" if ready else "not_ready", "checks": checks, "queue_rows": writer.queue_depth()}
+    if writer.last_error:
+        body["last_error"] = writer.last_error
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+# --- Estatísticas internas do collector ---
+
+@app.get("/internal/stats")
+def internal_stats():
+    return {
+        **stats.snapshot(),
+        "writer": writer.stats(),
+        "decode": decoder_pool.stats(),
+        "storage": {"db_path": storage.db_path, "profile": storage.profile, **storage.db_stats(),
+                    "partitions": storage.partitions.stats(), **storage.series.stats()},
+        "retention": retention.stats(),
+        "chunks": chunks.stats() if chunks is not None else {"enabled": False},
+        "hot_window": hot_window.stats(),
+        "live": live.stats(),
+        "sequence": storage.sequence.stats(),
+        "query_cache": query_cache.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    db = storage.db_stats()
+    gauges = {
+        "queue_rows": (writer.queue_depth(), "Linhas aguardando gravação no BatchWriter"),
+        "decode_in_flight": (decoder_pool.queue_depth(), "Requisições em decodificação"),
+        "decode_in_flight_bytes": (decoder_pool.stats()["in_flight_bytes"], "Bytes em decodificação"),
+        "sqlite_page_count": (db["page_count"], "Páginas do arquivo SQLite"),
+        "sqlite_freelist_count": (db["freelist_count"], "Páginas livres do arquivo SQLite"),
+        "sqlite_db_bytes": (db["db_bytes"], "Tamanho do banco SQLite em bytes"),
+        "sqlite_wal_bytes": (db["wal_bytes"], "Tamanho do arquivo WAL em bytes"),
+        "retention_rows_deleted": (retention.totals["rows_deleted"], "Linhas removidas pela retenção (acumulado)"),
+        "retention_bytes_reclaimed": (retention.totals["bytes_reclaimed"], "Bytes devolvidos pela retenção (acumulado)"),
+    }
+    return stats.prometheus(gauges)
 
 if __name__ == '__main__':
-    print("🚀 Humainze Collector & API rodando na porta 4318...")
-    uvicorn.run(app, host='0.0.0.0', port=4318)
+    print("🚀 Humainze Collector & API rodando na porta 4318 (HTTP) e 4317 (gRPC)...")
+    # Conexões de live tail não terminam sozinhas: sem o limite, o shutdown esperaria por elas
+    uvicorn.run(app, host='0.0.0.0', port=4318, timeout_graceful_shutdown=5)
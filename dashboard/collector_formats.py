@@ -0,0 +1,144 @@
+"""
+Formatos de resposta de /api/metrics, /api/traces e /api/logs
+
+  json     lista de objetos (padrão)
+  columns  JSON colunar: {"timestamp": [...], "service_name": [...], ...} — cada
+           nome de coluna aparece uma vez e pd.DataFrame(corpo) monta o frame
+           sem percorrer linhas
+  arrow    Apache Arrow IPC stream (application/vnd.apache.arrow.stream):
+           timestamp como timestamp[ns, UTC] (o INTEGER do banco, sem texto nem perda dos ns),
+           value/duration_ms float64 e colunas repetitivas (serviço, métrica,
+           time, attributes das séries...) como dictionary, que viram
+           Categorical no pandas. Leitura: pyarrow.ipc.open_stream(corpo).read_pandas()
+
+O formato vem de ?format= ou do header Accept. Os três saem das mesmas linhas
+cruas do SQLite (page_rows/since_rows), transpostas por coluna com zip. No
+modo transmitido (limit > MAX_LIMIT) as linhas chegam do cursor
+(iter_page/iter_since) e json e arrow são codificados a cada
+STREAM_CHUNK_ROWS linhas (um record batch Arrow por pedaço); columns precisa
+da página inteira para transpor e fica restrito a limit <= MAX_LIMIT.
+"""
+
+import io
+from itertools import chain
+
+import orjson
+import pyarrow as pa
+
+from collector_query import MAX_LIMIT, InvalidQuery, attributes_fragment, batched, encode_chunks, row_items
+from collector_time import to_iso
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MEDIA_TYPES = {"json": "application/json", "columns": "application/json", "arrow": ARROW_MEDIA_TYPE}
+
+# Colunas devolvidas por tabela (ordem dos SELECTs de collector_query, sem o _rowid)
+RESULT_COLUMNS = {
+    "metrics": ("timestamp", "service_name", "metric_name", "value", "unit", "attributes", "team"),
+    "traces": ("timestamp", "trace_id", "span_id", "parent_span_id", "service_name", "operation_name",
+               "duration_ms", "status_code", "attributes", "team"),
+    "logs": ("timestamp", "service_name", "severity_text", "body", "attributes", "team"),
+}
+
+# Colunas com poucos valores distintos: dictionary no Arrow
+DICTIONARY_COLUMNS = {
+    "metrics": {"service_name", "metric_name", "unit", "attributes", "team"},
+    "traces": {"service_name", "operation_name", "status_code", "team"},
+    "logs": {"service_name", "severity_text", "team"},
+}
+
+FLOAT_COLUMNS = {"value", "duration_ms"}
+
+
+def negotiate(fmt, accept, stream=False):
+    """?format= tem precedência; sem ele, Accept com o media type do Arrow pede arrow"""
+    if fmt is None:
+        return "arrow" if accept and ARROW_MEDIA_TYPE in accept else "json"
+    if fmt not in MEDIA_TYPES:
+        raise InvalidQuery(f"formato inválido: {fmt!r} (use {', '.join(MEDIA_TYPES)})")
+    if stream and fmt == "columns":
+        raise InvalidQuery(f"format=columns aceita limit até {MAX_LIMIT}; use arrow para leituras maiores")
+    return fmt
+
+
+def _columns(table, rows):
+    """Linhas cruas (com _rowid) -> (nomes, colunas) sem o _rowid"""
+    names = tuple(rows[0].keys()[1:]) if rows else RESULT_COLUMNS[table]
+    columns = list(zip(*rows))[1:] if rows else [() for _ in names]
+    return names, columns
+
+
+# --- JSON colunar ---
+
+def encode_columns(table, rows):
+    names, columns = _columns(table, rows)
+    body = {}
+    for name, values in zip(names, columns):
+        if name == "timestamp":
+            values = [to_iso(value) for value in values]
+        elif name == "attributes":
+            values = [attributes_fragment(value) for value in values]
+        body[name] = values
+    return orjson.dumps(body)
+
+
+# --- Arrow IPC ---
+
+def arrow_schema(table, names):
+    fields = []
+    for name in names:
+        if name == "timestamp":
+            kind = pa.timestamp("ns", tz="UTC")
+        elif name in FLOAT_COLUMNS:
+            kind = pa.float64()
+        elif name in DICTIONARY_COLUMNS[table]:
+            kind = pa.dictionary(pa.int32(), pa.string())
+        else:
+            kind = pa.string()
+        fields.append(pa.field(name, kind))
+    return pa.schema(fields)
+
+
+def _record_batch(schema, columns):
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.record_batch(arrays, schema=schema)
+
+
+def arrow_chunks(table, rows):
+    """Stream IPC: schema e depois um record batch a cada STREAM_CHUNK_ROWS linhas (lista ou cursor)"""
+    batches = batched(rows)
+    first = next(batches, [])
+    names, _ = _columns(table, first)
+    schema = arrow_schema(table, names)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    for batch in chain((first,) if first else (), batches):
+        _, columns = _columns(table, batch)
+        writer.write_batch(_record_batch(schema, columns))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+# --- Entrada usada pela API ---
+
+def encode_rows(table, rows, fmt):
+    """Corpo inteiro em bytes (respostas do cache)"""
+    if fmt == "columns":
+        return encode_columns(table, rows)
+    if fmt == "arrow":
+        return b"".join(arrow_chunks(table, rows))
+    return orjson.dumps(list(row_items(rows)))
+
+
+def encode_rows_stream(table, rows, fmt):
+    """Corpo em pedaços a partir de um iterável de linhas cruas (limit > MAX_LIMIT): json ou arrow"""
+    if fmt == "arrow":
+        return arrow_chunks(table, rows)
+    return encode_chunks(rows)
@@ -0,0 +1,89 @@
+"""
+Receiver OTLP/gRPC do collector (porta 4317)
+
+Expõe MetricsService, TraceService e LogsService do opentelemetry-proto num
+servidor grpc.aio que roda no mesmo event loop do FastAPI. As mensagens chegam
+como bytes crus (sem desserializar no gRPC) e seguem exatamente o mesmo caminho
+do HTTP/protobuf: DecodePool -> BatchWriter.
+
+Sobrecarga e falhas internas viram UNAVAILABLE (sempre reenviável pela
+especificação OTLP/gRPC), corpo inválido vira INVALID_ARGUMENT e itens
+descartados pelo decodificador voltam em partial_success.
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_GRPC_PORT               porta do receiver gRPC (padrão: 4317; 0 desativa)
+  COLLECTOR_GRPC_MAX_MESSAGE_BYTES  tamanho máximo de uma mensagem (padrão: 16 MiB)
+"""
+
+import os
+
+import grpc
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2
+from opentelemetry.proto.collector.logs.v1 import logs_service_pb2
+
+from collector_decoder import GRPC
+from collector_responses import RESPONSES, IngestRejected, InvalidPayload, export_response
+
+# sinal -> serviço gRPC
+SERVICES = {
+    "metrics": metrics_service_pb2.DESCRIPTOR.services_by_name["MetricsService"],
+    "traces": trace_service_pb2.DESCRIPTOR.services_by_name["TraceService"],
+    "logs": logs_service_pb2.DESCRIPTOR.services_by_name["LogsService"],
+}
+
+
+def _identity(raw):
+    return raw
+
+
+class GrpcReceiver:
+    def __init__(self, ingest, port=None, max_message_bytes=None):
+        # ingest: async (signal, body, content_encoding, content_type) -> (aceitos, rejeitados)
+        self.ingest = ingest
+        self.port = int(os.getenv("COLLECTOR_GRPC_PORT", "4317")) if port is None else port
+        self.max_message_bytes = max_message_bytes or int(os.getenv("COLLECTOR_GRPC_MAX_MESSAGE_BYTES", str(16 * 1024 * 1024)))
+        self._server = None
+
+    def _handler(self, signal):
+        response_cls = RESPONSES[signal][0]
+
+        async def export(body, context):
+            try:
+                _, rejected = await self.ingest(signal, body, "", GRPC)
+            except IngestRejected as e:
+                await context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+            except InvalidPayload as e:
+                print(f"Erro ao processar {signal} via gRPC: {e}")
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+            except Exception as e:
+                # Falha interna: UNAVAILABLE para o exporter reenviar em vez de descartar
+                print(f"❌ Erro interno ao processar {signal} via gRPC: {e}")
+                await context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+            return export_response(signal, rejected)
+
+        # _identity como request_deserializer entrega os bytes crus; o decodificador nativo faz o resto
+        return grpc.unary_unary_rpc_method_handler(
+            export,
+            request_deserializer=_identity,
+            response_serializer=response_cls.SerializeToString,
+        )
+
+    async def start(self):
+        if not self.port or self._server is not None:
+            return
+        self._server = grpc.aio.server(options=[
+            ("grpc.max_receive_message_length", self.max_message_bytes),
+        ])
+        for signal, service in SERVICES.items():
+            self._server.add_generic_rpc_handlers((
+                grpc.method_handlers_generic_handler(service.full_name, {"Export": self._handler(signal)}),
+            ))
+        self._server.add_insecure_port(f"0.0.0.0:{self.port}")
+        await self._server.start()
+        print(f"📡 Receiver OTLP/gRPC rodando na porta {self.port}...")
+
+    async def stop(self, grace=5.0):
+        if self._server is not None:
+            await self._server.stop(grace)
+            self._server = None
@@ -0,0 +1,309 @@
+"""
+Janela quente em memória para /api/metrics
+
+O dashboard atualiza a cada 5 s e quase sempre pede os pontos mais recentes.
+Cada série mantém em memória os pontos dos últimos `window` segundos em arrays
+NumPy (timestamps, rowids e valores, ordenados por timestamp): novos pontos
+entram no fim, os expirados saem pelo início (o início avança e o array é
+compactado quando a parte descartada passa da metade), como um ring buffer
+que aceita busca binária.
+
+A janela é aquecida do SQLite na subida e alimentada pelo BatchWriter: os
+pontos do lote (com o rowid que receberam na partição) só entram depois do
+commit, como os demais estados em memória. A partir de `covered_from` a
+memória tem exatamente o que está no banco, então uma consulta é respondida
+sem tocar no SQLite quando:
+  - start >= covered_from; ou
+  - a página (limite, filtros e cursor aplicados) se completa só com pontos
+    da janela — tudo fora dela é mais antigo.
+Caso contrário HotWindow.query devolve None e a consulta vai para o SQLite.
+A resposta (linhas, ordem e cursor) é a mesma do caminho SQL; com o watermark
+lido pela API (`upto`), a memória só responde se estiver exatamente nele.
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_HOT_WINDOW_S   segundos mantidos em memória por série (padrão: 900; 0 desliga)
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from collector_query import MAX_LIMIT, attributes_fragment, decode_cursor, encode_cursor, json_text
+from collector_rbac import ROLE_ADMIN, ROLE_TEAMS
+from collector_time import NS_PER_SECOND, now_ns, to_iso, to_ns
+
+# Expiração no máximo uma vez por segundo (roda na thread de escrita)
+_EVICT_EVERY_NS = NS_PER_SECOND
+
+
+class _SeriesWindow:
+    __slots__ = ("ts", "rowid", "values", "lo", "hi")
+
+    def __init__(self, capacity=64):
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.rowid = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.lo = self.hi = 0
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def _reserve(self, n):
+        size = self.hi - self.lo
+        if self.hi + n <= len(self.ts):
+            return
+        capacity = len(self.ts)
+        while size + n > capacity // 2:
+            capacity *= 2
+        if capacity == len(self.ts):
+            # Só compacta: descarta o início já expirado
+            arrays = (self.ts, self.rowid, self.values)
+            for array in arrays:
+                array[:size] = array[self.lo:self.hi]
+        else:
+            for name in self.__slots__[:3]:
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:size] = old[self.lo:self.hi]
+                setattr(self, name, new)
+        self.lo, self.hi = 0, size
+
+    def extend(self, ts, rowid, values):
+        """Pontos ordenados por (timestamp, rowid)"""
+        n = len(ts)
+        self._reserve(n)
+        lo, hi = self.lo, self.hi
+        if hi > lo and ts[0] < self.ts[hi - 1]:
+            # Pontos atrasados: refaz a ordem da janela inteira
+            all_ts = np.concatenate((self.ts[lo:hi], ts))
+            all_rowid = np.concatenate((self.rowid[lo:hi], rowid))
+            all_values = np.concatenate((self.values[lo:hi], values))
+            order = np.lexsort((all_rowid, all_ts))
+            self.ts[lo:hi + n] = all_ts[order]
+            self.rowid[lo:hi + n] = all_rowid[order]
+            self.values[lo:hi + n] = all_values[order]
+        else:
+            self.ts[hi:hi + n] = ts
+            self.rowid[hi:hi + n] = rowid
+            self.values[hi:hi + n] = values
+        self.hi = hi + n
+
+    def evict(self, cutoff):
+        self.lo += int(np.searchsorted(self.ts[self.lo:self.hi], cutoff, "left"))
+
+    def page(self, start, end, position, limit):
+        """Cópia dos até `limit` pontos mais novos em [start, end) e antes do cursor"""
+        ts = self.ts[self.lo:self.hi]
+        lo = int(np.searchsorted(ts, start, "left")) if start is not None else 0
+        hi = int(np.searchsorted(ts, end, "left")) if end is not None else len(ts)
+        if position is not None:
+            cursor_ts, cursor_rowid = position
+            left = int(np.searchsorted(ts, cursor_ts, "left"))
+            right = int(np.searchsorted(ts, cursor_ts, "right"))
+            # Mesmo timestamp: rowids em ordem crescente dentro do bloco
+            left += int(np.searchsorted(self.rowid[self.lo + left:self.lo + right], cursor_rowid, "left"))
+            hi = min(hi, left)
+        lo = max(lo, hi - limit)
+        if hi <= lo:
+            return None
+        a, b = self.lo + lo, self.lo + hi
+        return self.ts[a:b].copy(), self.rowid[a:b].copy(), self.values[a:b].copy()
+
+
+class HotWindow:
+    def __init__(self, window_s=None):
+        self.window = int((window_s if window_s is not None
+                           else float(os.getenv("COLLECTOR_HOT_WINDOW_S", "900"))) * NS_PER_SECOND)
+        self._lock = threading.Lock()
+        self._series = {}         # series_id -> _SeriesWindow
+        self._meta = {}           # series_id -> (metric_name, service_name, unit, attributes, team, attrs)
+        self._covered_from = None  # None = ainda não aquecida
+        self._last_evict = 0
+        self._seq = None          # watermark de metrics que a memória reflete (collector_sequence)
+        self._pending = []
+        self._pending_meta = {}
+        self._pending_seq = None
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    # --- Aquecimento ---
+
+    def _meta_row(self, row):
+        metric_name, service_name, unit, attributes, team = row
+        try:
+            attrs = json.loads(attributes) if attributes else {}
+        except (TypeError, ValueError):
+            attrs = {}
+        return metric_name, service_name, unit, attributes, team, attrs if isinstance(attrs, dict) else {}
+
+    def load(self, storage):
+        """Carrega os pontos da janela das partições (antes do BatchWriter começar a gravar)"""
+        if not self.enabled:
+            return
+        covered_from = now_ns() - self.window
+        by_series = {}
+        with storage.reader() as conn:
+            for name in storage.partitions.tables("metrics", start=covered_from, newest_first=False):
+                for rowid, ts, series_id, value in conn.execute(
+                        f"SELECT rowid, timestamp, series_id, value FROM {name} WHERE timestamp >= ?", (covered_from,)):
+                    by_series.setdefault(series_id, []).append((ts, rowid, value))
+            ids = list(by_series)
+            meta = {}
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ", ".join("?" for _ in chunk)
+                for series_id, *row in conn.execute(
+                        f"SELECT id, metric_name, service_name, unit, attributes, team FROM series WHERE id IN ({marks})",
+                        chunk):
+                    meta[series_id] = self._meta_row(row)
+        series = {}
+        for series_id, points in by_series.items():
+            points.sort()
+            window = series[series_id] = _SeriesWindow()
+            ts, rowid, values = zip(*points)
+            window.extend(np.array(ts, dtype=np.int64), np.array(rowid, dtype=np.int64),
+                          np.array(values, dtype=np.float64))
+        with self._lock:
+            self._series = series
+            self._meta = meta
+            self._covered_from = covered_from
+            self._seq = storage.sequence.watermark("metrics")
+        print(f"🔥 Janela quente: {sum(len(w) for w in series.values())} pontos de {len(series)} séries "
+              f"(últimos {self.window // NS_PER_SECOND}s)")
+
+    # --- Escrita (thread do BatchWriter, dentro da transação do lote) ---
+
+    def stage(self, conn, rows, rowids):
+        """Pontos (timestamp, series_id, value) recém-inseridos e os rowids que o BatchWriter atribuiu"""
+        if not self.enabled or not rows:
+            return
+        self._pending_seq = max(rowids[-1], self._pending_seq or 0)
+        for (ts, series_id, value), rowid in zip(rows, rowids):
+            self._pending.append((series_id, ts, rowid, value))
+            if series_id not in self._meta and series_id not in self._pending_meta:
+                row = conn.execute("SELECT metric_name, service_name, unit, attributes, team FROM series "
+                                   "WHERE id = ?", (series_id,)).fetchone()
+                self._pending_meta[series_id] = self._meta_row(tuple(row))
+
+    def publish(self):
+        """Chamado após o commit do lote"""
+        pending, pending_meta, pending_seq = self._pending, self._pending_meta, self._pending_seq
+        self._pending, self._pending_meta, self._pending_seq = [], {}, None
+        if not self.enabled or self._covered_from is None:
+            return
+        by_series = {}
+        for series_id, ts, rowid, value in pending:
+            by_series.setdefault(series_id, []).append((ts, rowid, value))
+        now = now_ns()
+        with self._lock:
+            self._meta.update(pending_meta)
+            if pending_seq is not None:
+                self._seq = pending_seq
+            covered_from = self._covered_from
+            if now - self._last_evict >= _EVICT_EVERY_NS and now - self.window > covered_from:
+                covered_from = self._covered_from = now - self.window
+                self._last_evict = now
+                for series_id in list(self._series):
+                    window = self._series[series_id]
+                    window.evict(covered_from)
+                    if not len(window):
+                        del self._series[series_id]
+            for series_id, points in by_series.items():
+                # Pontos anteriores à cobertura ficam só no banco
+                points = sorted(p for p in points if p[0] >= covered_from)
+                if not points:
+                    continue
+                window = self._series.get(series_id)
+                if window is None:
+                    window = self._series[series_id] = _SeriesWindow()
+                ts, rowid, values = zip(*points)
+                window.extend(np.array(ts, dtype=np.int64), np.array(rowid, dtype=np.int64),
+                              np.array(values, dtype=np.float64))
+
+    def discard(self):
+        """Chamado quando o lote falha (rollback)"""
+        self._pending = []
+        self._pending_meta = {}
+        self._pending_seq = None
+
+    # --- Leitura ---
+
+    def _matches(self, meta, team, columns, attributes):
+        metric_name, service_name, _, _, series_team, attrs = meta
+        if team is not None and series_team != team:
+            return False
+        for column, value in columns.items():
+            if value is not None and (metric_name if column == "metric_name" else service_name) != value:
+                return False
+        return all(json_text(attrs.get(key)) == value for key, value in attributes)
+
+    def query(self, role, start=None, end=None, columns=None, attributes=(), cursor=None, limit=100, upto=None):
+        """
+        (linhas, próximo cursor) de /api/metrics respondidos da memória, ou None
+        quando a janela não cobre a consulta. Mesmos parâmetros de build_select;
+        com `upto`, só responde se a memória estiver exatamente nesse watermark.
+        """
+        if not self.enabled or (role != ROLE_ADMIN and role not in ROLE_TEAMS):
+            return None
+        team = ROLE_TEAMS.get(role)
+        start = to_ns(start) if start is not None else None
+        end = to_ns(end) if end is not None else None
+        position = decode_cursor(cursor) if cursor else None
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        columns = columns or {}
+
+        parts = []
+        with self._lock:
+            covered_from = self._covered_from
+            if covered_from is None or (upto is not None and self._seq != upto):
+                return None
+            for series_id, window in self._series.items():
+                meta = self._meta.get(series_id)
+                if meta is None or not self._matches(meta, team, columns, attributes):
+                    continue
+                page = window.page(start, end, position, limit)
+                if page is not None:
+                    parts.append((meta, page))
+
+        total = sum(len(page[0]) for _, page in parts)
+        if total < limit and (start is None or start < covered_from):
+            with self._lock:
+                self._misses += 1
+            return None
+
+        data = []
+        if parts:
+            ts = np.concatenate([page[0] for _, page in parts])
+            rowid = np.concatenate([page[1] for _, page in parts])
+            values = np.concatenate([page[2] for _, page in parts])
+            owner = np.repeat(np.arange(len(parts)), [len(page[0]) for _, page in parts])
+            # Mesma ordem do SQL: timestamp DESC, rowid DESC
+            order = np.lexsort((rowid, ts))[::-1][:limit]
+            for i in order.tolist():
+                metric_name, service_name, unit, attributes_json, series_team, _ = parts[owner[i]][0]
+                value = float(values[i])
+                data.append({"timestamp": to_iso(int(ts[i])), "service_name": service_name,
+                             "metric_name": metric_name, "value": None if value != value else value,
+                             "unit": unit, "attributes": attributes_fragment(attributes_json), "team": series_team})
+            last = order[-1]
+        next_cursor = encode_cursor(int(ts[last]), int(rowid[last])) if data and len(data) >= limit else None
+        with self._lock:
+            self._hits += 1
+        return data, next_cursor
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_s": self.window // NS_PER_SECOND,
+                "series": len(self._series),
+                "points": sum(len(w) for w in self._series.values()),
+                "covered_from": to_iso(self._covered_from),
+                "hits": self._hits,
+                "misses": self._misses,
+            }
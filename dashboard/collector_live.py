@@ -0,0 +1,231 @@
+"""
+Live tail: linhas recém-gravadas empurradas por Server-Sent Events
+
+Em vez de o dashboard baixar de novo os N mais recentes a cada 5 s, o cliente
+abre GET /api/stream (uma conexão SSE por role e filtro) e recebe só as linhas
+novas, no mesmo formato de /api/metrics, /api/traces e /api/logs, assim que o
+lote que as gravou é commitado pelo BatchWriter (publish).
+
+Cada assinante tem um buffer limitado (`buffer_rows` linhas). Um consumidor
+lento não segura o BatchWriter nem os outros assinantes: quando o buffer
+enche, as linhas mais antigas são descartadas e o cliente recebe um evento
+`dropped` com a quantidade perdida (deve reconsultar a API para preencher o
+buraco). Eventos:
+
+  event: metrics | traces | logs   data: [linhas em JSON]
+  event: dropped                   data: {"rows": n}
+  : ping                           (comentário a cada `heartbeat` segundos)
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_LIVE_BUFFER_ROWS      linhas pendentes por assinante (padrão: 5000)
+  COLLECTOR_LIVE_MAX_SUBSCRIBERS  conexões simultâneas (padrão: 100)
+  COLLECTOR_LIVE_HEARTBEAT_S      intervalo do ping (padrão: 15)
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+
+import orjson
+
+from collector_query import COLUMN_FILTERS, InvalidQuery, attributes_fragment, json_text
+from collector_rbac import ROLE_ADMIN, ROLE_TEAMS
+from collector_time import to_iso
+
+# Colunas de traces/logs na ordem das linhas do decoder (e de SELECT *)
+ROW_COLUMNS = {
+    "traces": ("timestamp", "trace_id", "span_id", "parent_span_id", "service_name", "operation_name",
+               "duration_ms", "status_code", "attributes", "team"),
+    "logs": ("timestamp", "service_name", "severity_text", "body", "attributes", "team"),
+}
+
+
+class TooManySubscribers(Exception):
+    """Limite de conexões de live tail atingido (vira HTTP 503)"""
+
+
+class Subscriber:
+    def __init__(self, loop, tables, team, columns, attributes, buffer_rows):
+        self.loop = loop
+        self.tables = tables
+        self.team = team            # None = ROLE_ADMIN
+        self.columns = columns      # {tabela: {coluna: valor}}
+        self.attributes = attributes
+        self.dropped = 0
+        self._rows = deque()        # (tabela, linha)
+        self._max_rows = buffer_rows
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+
+    def matches(self, table, row, attributes, attrs_cache):
+        if table not in self.tables:
+            return False
+        if self.team is not None and row["team"] != self.team:
+            return False
+        for column, value in self.columns[table].items():
+            if row[column] != value:
+                return False
+        if self.attributes:
+            attrs = attrs_cache.get(attributes)
+            if attrs is None:
+                try:
+                    attrs = json.loads(attributes) if attributes else {}
+                except (TypeError, ValueError):
+                    attrs = {}
+                attrs = attrs_cache[attributes] = attrs if isinstance(attrs, dict) else {}
+            return all(json_text(attrs.get(key)) == value for key, value in self.attributes)
+        return True
+
+    def offer(self, items):
+        """Thread de escrita: enfileira sem bloquear; descarta as mais antigas se o buffer estiver cheio"""
+        with self._lock:
+            self._rows.extend(items)
+            overflow = len(self._rows) - self._max_rows
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._rows.popleft()
+                self.dropped += overflow
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def drain(self):
+        self._wakeup.clear()
+        with self._lock:
+            rows, self._rows = self._rows, deque()
+            dropped, self.dropped = self.dropped, 0
+        return rows, dropped
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class LiveHub:
+    def __init__(self, storage, buffer_rows=None, max_subscribers=None, heartbeat=None):
+        self.storage = storage
+        self.buffer_rows = buffer_rows or int(os.getenv("COLLECTOR_LIVE_BUFFER_ROWS", "5000"))
+        self.max_subscribers = max_subscribers or int(os.getenv("COLLECTOR_LIVE_MAX_SUBSCRIBERS", "100"))
+        self.heartbeat = heartbeat or float(os.getenv("COLLECTOR_LIVE_HEARTBEAT_S", "15"))
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._pending = []
+        self._stats = {"rows_sent": 0, "rows_dropped": 0, "subscribers_total": 0}
+
+    # --- Escrita (thread do BatchWriter) ---
+
+    def hook(self, table):
+        """after_write do BatchWriter para `table`: guarda as linhas do lote até o commit"""
+        def stage(conn, rows, rowids=None):
+            if self._subscribers:
+                self._pending.append((table, rows))
+        return stage
+
+    def _format(self, table, rows):
+        """[(linha da API, texto JSON de attributes para os filtros)]"""
+        if table == "metrics":
+            describe = self.storage.series.describe
+            items = []
+            for ts, series_id, value in rows:
+                info = describe(series_id)
+                if info is None:
+                    continue
+                metric_name, service_name, unit, attributes, team = info
+                items.append(({"timestamp": to_iso(ts), "service_name": service_name, "metric_name": metric_name,
+                               # O SQLite grava NaN como NULL; mesmo valor que a API devolveria
+                               "value": None if value is None or value != value else value,
+                               "unit": unit, "attributes": attributes_fragment(attributes), "team": team},
+                              attributes))
+            return items
+        columns = ROW_COLUMNS[table]
+        items = []
+        for row in rows:
+            item = dict(zip(columns, row))
+            item["timestamp"] = to_iso(item["timestamp"])
+            attributes = item["attributes"]
+            item["attributes"] = attributes_fragment(attributes)
+            items.append((item, attributes))
+        return items
+
+    def publish(self):
+        """Chamado após o commit do lote (depois do dicionário de séries)"""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        attrs_cache = {}
+        for table, rows in pending:
+            items = self._format(table, rows)
+            for subscriber in subscribers:
+                matched = [(table, item) for item, attributes in items
+                           if subscriber.matches(table, item, attributes, attrs_cache)]
+                if matched:
+                    subscriber.offer(matched)
+
+    def discard(self):
+        self._pending = []
+
+    # --- Assinantes ---
+
+    def subscribe(self, role, tables, columns, attributes):
+        """Cria o assinante no event loop atual; None quando a role não enxerga nada"""
+        if role != ROLE_ADMIN and role not in ROLE_TEAMS:
+            return None
+        for table, filters in columns.items():
+            for column in filters:
+                if column not in COLUMN_FILTERS[table]:
+                    raise InvalidQuery(f"filtro {column} não suportado em {table}")
+        subscriber = Subscriber(asyncio.get_running_loop(), set(tables), ROLE_TEAMS.get(role),
+                                {table: columns.get(table, {}) for table in tables}, attributes, self.buffer_rows)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"limite de {self.max_subscribers} conexões de live tail atingido")
+            self._subscribers.add(subscriber)
+            self._stats["subscribers_total"] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    async def events(self, subscriber, is_disconnected):
+        """Gerador SSE de um assinante; encerra quando o cliente desconecta"""
+        try:
+            # retry: intervalo de reconexão sugerido ao EventSource do navegador
+            yield "retry: 3000\n\n"
+            while True:
+                await subscriber.wait(self.heartbeat)
+                if await is_disconnected():
+                    break
+                rows, dropped = subscriber.drain()
+                if dropped:
+                    with self._lock:
+                        self._stats["rows_dropped"] += dropped
+                    yield f"event: dropped\ndata: {json.dumps({'rows': dropped})}\n\n"
+                if not rows:
+                    yield ": ping\n\n"
+                    continue
+                by_table = {}
+                for table, item in rows:
+                    by_table.setdefault(table, []).append(item)
+                for table, items in by_table.items():
+                    yield f"event: {table}\ndata: {orjson.dumps(items).decode()}\n\n"
+                with self._lock:
+                    self._stats["rows_sent"] += len(rows)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "subscribers": len(self._subscribers),
+                "buffered_rows": sum(len(s._rows) for s in self._subscribers),
+                "buffer_rows": self.buffer_rows,
+                "max_subscribers": self.max_subscribers,
+            }
@@ -0,0 +1,186 @@
+"""
+Migrações versionadas do schema SQLite do collector
+
+A versão aplicada fica em PRAGMA user_version. Na inicialização, cada migração
+pendente roda em sua própria transação (junto com a atualização da versão),
+então um humainze_metrics.db antigo é atualizado no lugar, sem reconstruir
+tabelas. Bancos sem versão (user_version = 0) são os criados pelo init_db
+original e recebem todas as migrações, que são idempotentes.
+
+Cada passo é um SQL ou uma função que recebe a conexão de escrita. O schema
+histórico que cada migração cria fica escrito aqui, e a forma atual das
+tabelas é alcançada pelas migrações seguintes. Um passo já publicado só é
+alterado quando o resultado final é o mesmo para qualquer versão de partida:
+os rollups deixaram de ser preenchidos nas migrações 4 e 7 porque a migração 8
+os recria por inteiro a partir das partições, então um banco parado na versão
+4 ou 7 chega ao mesmo estado de um banco novo.
+"""
+
+import json
+import time
+
+from collector_rbac import resolve_team
+import collector_rollups
+from collector_partitions import migrate_timestamps_to_ns, migrate_to_partitions, partition_tables
+from collector_series import CREATE_STATEMENTS as SERIES_TABLES, migrate_metrics_to_series
+from collector_chunks import CREATE_STATEMENTS as CHUNK_TABLES
+from collector_sequence import CREATE_STATEMENTS as SEQUENCE_TABLES
+
+
+def _add_team_column(conn):
+    """Coluna team materializada + backfill das linhas existentes com as regras de collector_rbac"""
+    def team_of(service_name, attributes_json, metric_name=None):
+        try:
+            attrs = json.loads(attributes_json) if attributes_json else {}
+        except (TypeError, ValueError):
+            attrs = {}
+        if not isinstance(attrs, dict):
+            attrs = {}
+        return resolve_team(attrs.get("team"), service_name, metric_name,
+                            device_id=attrs.get("device.id"), module=attrs.get("module"))
+
+    conn.create_function("humainze_team", -1, team_of, deterministic=True)
+    for table in ("metrics", "traces", "logs"):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "team" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN team TEXT")
+    conn.execute("UPDATE metrics SET team = humainze_team(service_name, attributes, metric_name) WHERE team IS NULL")
+    conn.execute("UPDATE traces SET team = humainze_team(service_name, attributes) WHERE team IS NULL")
+    conn.execute("UPDATE logs SET team = humainze_team(service_name, attributes) WHERE team IS NULL")
+
+
+# Rollups da migração 4, chaveados pelo texto da série (antes do dicionário de séries)
+_LEGACY_ROLLUP_TABLES = [f"metrics_rollup_{resolution}" for resolution in ("1m", "5m", "1h")]
+
+
+def _legacy_rollup_statements():
+    statements = []
+    for table in _LEGACY_ROLLUP_TABLES:
+        statements.append(f'''CREATE TABLE IF NOT EXISTS {table}
+           (bucket INTEGER NOT NULL,
+            metric_name TEXT NOT NULL,
+            service_name TEXT NOT NULL,
+            attributes TEXT NOT NULL,
+            team TEXT,
+            unit TEXT,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            last REAL NOT NULL,
+            last_ts TEXT NOT NULL,
+            PRIMARY KEY (metric_name, service_name, attributes, bucket))''')
+        statements.append(f"CREATE INDEX IF NOT EXISTS idx_{table}_name_bucket ON {table} (metric_name, bucket)")
+        statements.append(f"CREATE INDEX IF NOT EXISTS idx_{table}_team_bucket ON {table} (team, bucket)")
+    return statements
+
+
+def _series_dictionary(conn):
+    """Partições de metrics passam a (timestamp, series_id, value) e os rollups são recriados por série"""
+    migrate_metrics_to_series(conn)
+    # Rollups recriados vazios: o backfill roda na migração 8, com os timestamps já em ns
+    collector_rollups.rebuild(conn, [])
+
+
+def _rebuild_rollups(conn):
+    collector_rollups.rebuild(conn, partition_tables(conn, "metrics"))
+
+
+MIGRATIONS = [
+    (1, "tabelas base metrics/traces/logs", [
+        # Tabela simples para armazenar métricas achatadas
+        '''CREATE TABLE IF NOT EXISTS metrics
+           (timestamp DATETIME,
+            service_name TEXT,
+            metric_name TEXT,
+            value REAL,
+            unit TEXT,
+            attributes TEXT)''',
+        # Tabela para Traces (Spans)
+        '''CREATE TABLE IF NOT EXISTS traces
+           (timestamp DATETIME,
+            trace_id TEXT,
+            span_id TEXT,
+            parent_span_id TEXT,
+            service_name TEXT,
+            operation_name TEXT,
+            duration_ms REAL,
+            status_code TEXT,
+            attributes TEXT)''',
+        # Tabela para Logs
+        '''CREATE TABLE IF NOT EXISTS logs
+           (timestamp DATETIME,
+            service_name TEXT,
+            severity_text TEXT,
+            body TEXT,
+            attributes TEXT)''',
+    ]),
+    (2, "índices secundários para as consultas do dashboard", [
+        "CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_metrics_name_ts ON metrics (metric_name, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_metrics_service_ts ON metrics (service_name, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_timestamp ON traces (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_trace_id ON traces (trace_id)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_service_ts ON traces (service_name, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_service_ts ON logs (service_name, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_severity_ts ON logs (severity_text, timestamp)",
+        "ANALYZE",
+    ]),
+    (3, "coluna team materializada para RBAC no SQL", [
+        _add_team_column,
+        "CREATE INDEX IF NOT EXISTS idx_metrics_team_ts ON metrics (team, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_team_ts ON traces (team, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_team_ts ON logs (team, timestamp)",
+        "ANALYZE",
+    ]),
+    # Os rollups são recalculados a partir das linhas brutas na migração 8
+    (4, "rollups contínuos de métricas (1m/5m/1h)", _legacy_rollup_statements()),
+    (5, "índices por bucket para a retenção dos rollups", [
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)" for table in _LEGACY_ROLLUP_TABLES
+    ]),
+    (6, "particionamento diário de metrics/traces/logs", [
+        migrate_to_partitions,
+        "ANALYZE",
+    ]),
+    (7, "dicionário de séries e registro de metadados das métricas", [
+        *SERIES_TABLES,
+        _series_dictionary,
+        "ANALYZE",
+    ]),
+    (8, "timestamps em nanossegundos (INTEGER, UTC)", [
+        migrate_timestamps_to_ns,
+        _rebuild_rollups,
+        "ANALYZE",
+    ]),
+    (9, "chunks comprimidos de métricas gauge (motor opcional)", CHUNK_TABLES),
+    (10, "sequência de ingestão (watermark) por sinal", SEQUENCE_TABLES),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(storage):
+    """Aplica as migrações pendentes; devolve a versão final do schema"""
+    with storage.writing() as conn:
+        version = current_version(conn)
+
+    for target, description, steps in MIGRATIONS:
+        if target <= version:
+            continue
+        start = time.perf_counter()
+        with storage.writing() as conn:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            # PRAGMA não aceita parâmetro; target vem da lista acima
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+        version = target
+        print(f"🗄️  Migração {target} aplicada ({description}) em {time.perf_counter() - start:.2f}s")
+    return version
@@ -0,0 +1,200 @@
+"""
+Particionamento por dia das tabelas brutas (metrics, traces, logs)
+
+Cada dia (UTC) vira uma tabela própria (metrics_p20250131, ...) com os mesmos
+índices da tabela original. O BatchWriter roteia cada linha para a partição do
+seu timestamp, criando-a na primeira escrita; as consultas só abrem as
+partições que cruzam o intervalo pedido; a retenção descarta um dia inteiro
+com DROP TABLE em vez de um DELETE por varredura.
+
+O conjunto de partições existentes fica em memória (PartitionSet), carregado do
+sqlite_master ao abrir o banco. Partições novas só ficam visíveis para as
+consultas depois do commit que as criou; partições descartadas saem do
+conjunto antes do DROP.
+"""
+
+import re
+import threading
+from datetime import date, datetime
+
+from collector_time import NS_PER_DAY, day_of, legacy_ns
+
+PARTITIONED = ("metrics", "traces", "logs")
+
+# Colunas e índices de cada partição (schema atual das tabelas brutas);
+# timestamp em ns desde a época, UTC (collector_time)
+COLUMNS = {
+    # Série (nome, serviço, atributos, time) fica no dicionário collector_series
+    "metrics": '''(timestamp INTEGER,
+            series_id INTEGER,
+            value REAL)''',
+    "traces": '''(timestamp INTEGER,
+            trace_id TEXT,
+            span_id TEXT,
+            parent_span_id TEXT,
+            service_name TEXT,
+            operation_name TEXT,
+            duration_ms REAL,
+            status_code TEXT,
+            attributes TEXT,
+            team TEXT)''',
+    "logs": '''(timestamp INTEGER,
+            service_name TEXT,
+            severity_text TEXT,
+            body TEXT,
+            attributes TEXT,
+            team TEXT)''',
+}
+
+INDEXES = {
+    "metrics": {"timestamp": "timestamp", "series_ts": "series_id, timestamp"},
+    "traces": {"timestamp": "timestamp", "trace_id": "trace_id",
+               "service_ts": "service_name, timestamp", "team_ts": "team, timestamp"},
+    "logs": {"timestamp": "timestamp", "service_ts": "service_name, timestamp",
+             "severity_ts": "severity_text, timestamp", "team_ts": "team, timestamp"},
+}
+
+_NAME = re.compile(r"^(metrics|traces|logs)_p(\d{8})$")
+
+
+def partition_name(table, day):
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def create_partition(conn, table, day, columns=None):
+    """Cria a partição do dia; `columns` sobrescreve o schema atual (migrações de bancos antigos)"""
+    name = partition_name(table, day)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {name} {columns or COLUMNS[table]}")
+    create_indexes(conn, table, name)
+    return name
+
+
+def create_indexes(conn, table, name):
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({name})")}
+    for suffix, columns in INDEXES[table].items():
+        if all(c.strip() in present for c in columns.split(",")):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_{suffix} ON {name} ({columns})")
+
+
+class PartitionSet:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {table: set() for table in PARTITIONED}
+
+    def load(self, conn):
+        days = {table: set() for table in PARTITIONED}
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            match = _NAME.match(name)
+            if match:
+                days[match.group(1)].add(datetime.strptime(match.group(2), "%Y%m%d").date())
+        with self._lock:
+            self._days = days
+
+    def has(self, table, day):
+        with self._lock:
+            return day in self._days[table]
+
+    def publish(self, created):
+        """Torna visíveis as partições criadas por uma transação já commitada"""
+        with self._lock:
+            for table, day in created:
+                self._days[table].add(day)
+
+    def forget(self, table, day):
+        with self._lock:
+            self._days[table].discard(day)
+
+    def days(self, table, start=None, end=None, newest_first=True):
+        """Dias com partição que cruzam [start, end] (ns ou None), em ordem"""
+        first = day_of(start) if start is not None else None
+        last = day_of(end) if end is not None else None
+        with self._lock:
+            days = [d for d in self._days[table]
+                    if (first is None or d >= first) and (last is None or d <= last)]
+        return sorted(days, reverse=newest_first)
+
+    def tables(self, table, start=None, end=None, newest_first=True):
+        return [partition_name(table, d) for d in self.days(table, start, end, newest_first)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                table: {"partitions": len(days),
+                        "oldest": min(days).isoformat() if days else None,
+                        "newest": max(days).isoformat() if days else None}
+                for table, days in self._days.items()
+            }
+
+
+def partition_tables(conn, table):
+    """Partições de `table` existentes no arquivo (direto do sqlite_master)"""
+    return sorted(name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                  if (match := _NAME.match(name)) and match.group(1) == table)
+
+
+def split_by_day(rows):
+    """Linhas (timestamp em ns na 1ª posição) -> {dia: [linhas]}"""
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row[0] // NS_PER_DAY, []).append(row)
+    return {day_of(number * NS_PER_DAY): day_rows for number, day_rows in by_day.items()}
+
+
+def migrate_to_partitions(conn):
+    """Migração: move as linhas das tabelas únicas para as partições diárias e as remove"""
+    for table in PARTITIONED:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if not exists:
+            continue
+        info = [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")]
+        column_list = ", ".join(name for name, _ in info)
+        # Mesmo schema da tabela de origem; a forma atual vem das migrações seguintes
+        ddl = "(" + ", ".join(f"{name} {kind}".strip() for name, kind in info) + ")"
+        days = [row[0] for row in conn.execute(f"SELECT DISTINCT substr(timestamp, 1, 10) FROM {table}")]
+        for text in days:
+            try:
+                day = date.fromisoformat(text) if text else date(1970, 1, 1)
+            except ValueError:
+                day = date(1970, 1, 1)
+            name = create_partition(conn, table, day, ddl)
+            if text is None:
+                conn.execute(f"INSERT INTO {name} ({column_list}) SELECT {column_list} FROM {table} WHERE timestamp IS NULL")
+            else:
+                conn.execute(f"INSERT INTO {name} ({column_list}) SELECT {column_list} FROM {table} "
+                             f"WHERE substr(timestamp, 1, 10) = ?", (text,))
+        conn.execute(f"DROP TABLE {table}")
+
+
+
+def migrate_timestamps_to_ns(conn):
+    """
+    Migração: timestamp DATETIME (texto em hora local) -> INTEGER em ns (UTC).
+    As linhas são redistribuídas pelas partições do dia UTC; o restante do
+    schema de cada partição é mantido.
+    """
+    conn.create_function("humainze_ns", 1, legacy_ns, deterministic=True)
+    for table in PARTITIONED:
+        legacy = []
+        for name in partition_tables(conn, table):
+            conn.execute(f"ALTER TABLE {name} RENAME TO {name}_legacy")
+            legacy.append(f"{name}_legacy")
+        created = set()
+        for name in legacy:
+            info = [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({name})")]
+            ddl = "(" + ", ".join(f"{column} {'INTEGER' if column == 'timestamp' else kind}".strip()
+                                  for column, kind in info) + ")"
+            others = [column for column, _ in info if column != "timestamp"]
+            column_list = ", ".join(["timestamp", *others])
+            select_list = ", ".join(["humainze_ns(timestamp)", *others])
+            days = [row[0] for row in conn.execute(f"SELECT DISTINCT humainze_ns(timestamp) / ? FROM {name}",
+                                                   (NS_PER_DAY,))]
+            for number in days:
+                target = partition_name(table, day_of(number * NS_PER_DAY))
+                # Índices só depois da carga (os nomes antigos ainda estão com a tabela _legacy)
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {target} {ddl}")
+                conn.execute(f"INSERT INTO {target} ({column_list}) SELECT {select_list} FROM {name} "
+                             f"WHERE humainze_ns(timestamp) / ? = ?", (NS_PER_DAY, number))
+                created.add(target)
+            conn.execute(f"DROP TABLE {name}")
+        for target in sorted(created):
+            create_indexes(conn, table, target)
@@ -0,0 +1,146 @@
+"""
+Pipeline de decodificação do collector OTLP
+
+O event loop do FastAPI só recebe os bytes e repassa para um pool de workers,
+que faz a descompressão e a decodificação (JSON/protobuf). Assim um lote grande
+não trava as outras requisições nem as leituras do dashboard.
+
+O volume de bytes em processamento é limitado (COLLECTOR_MAX_INFLIGHT_BYTES);
+acima disso a requisição é recusada com IngestRejected para o exporter tentar
+de novo mais tarde.
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_DECODE_MODE          thread | process (padrão: thread)
+  COLLECTOR_DECODE_WORKERS       número de workers (padrão: núcleos disponíveis, máx. 8)
+  COLLECTOR_MAX_INFLIGHT_BYTES   orçamento de bytes em decodificação (padrão: 64 MiB)
+  COLLECTOR_RETRY_AFTER_SECONDS  Retry-After sugerido quando há sobrecarga (padrão: 1)
+"""
+
+import asyncio
+import gzip
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from collector_decoder import decode
+from collector_responses import IngestRejected, InvalidPayload
+
+def decode_request(signal, body, content_encoding, content_type, submitted_at):
+    """Executa no worker: devolve linhas, rejeitados e o tempo de cada etapa (ms)"""
+    started = time.monotonic()
+    try:
+        if 'gzip' in content_encoding:
+            body = gzip.decompress(body)
+        decompressed = time.monotonic()
+        rows, rejected = decode(signal, body, content_type)
+    except Exception as e:
+        # Tudo que falha aqui depende só do corpo recebido
+        raise InvalidPayload(f"{type(e).__name__}: {e}") from e
+    done = time.monotonic()
+    timings = {
+        "queue_wait": (started - submitted_at) * 1000,
+        "decompress": (decompressed - started) * 1000,
+        "decode": (done - decompressed) * 1000,
+    }
+    return rows, rejected, timings
+
+
+class DecodePool:
+    def __init__(self, mode=None, workers=None, max_in_flight_bytes=None):
+        self.mode = (mode or os.getenv("COLLECTOR_DECODE_MODE", "thread")).lower()
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"COLLECTOR_DECODE_MODE inválido: {self.mode} (use thread ou process)")
+        self.workers = workers or int(os.getenv("COLLECTOR_DECODE_WORKERS", str(min(8, os.cpu_count() or 1))))
+        self.max_in_flight_bytes = max_in_flight_bytes or int(os.getenv("COLLECTOR_MAX_INFLIGHT_BYTES", str(64 * 1024 * 1024)))
+        self.retry_after = int(os.getenv("COLLECTOR_RETRY_AFTER_SECONDS", "1"))
+        self._executor = None
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._in_flight_bytes = 0
+        self._requests = 0
+        self._errors = 0
+        self._rejected_requests = 0
+        self._rejected_bytes = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="otlp-decode")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @property
+    def running(self):
+        return self._executor is not None
+
+    def has_room(self, nbytes):
+        """Checagem barata (ex.: pelo Content-Length) antes de ler o corpo"""
+        return self._in_flight_bytes == 0 or self._in_flight_bytes + nbytes <= self.max_in_flight_bytes
+
+    def reject(self, nbytes):
+        with self._lock:
+            self._rejected_requests += 1
+            self._rejected_bytes += nbytes
+        return IngestRejected(
+            f"collector sobrecarregado ({self._in_flight_bytes} bytes em decodificação)",
+            status_code=429,
+            retry_after=self.retry_after,
+        )
+
+    async def run(self, signal, body, content_encoding="", content_type=""):
+        """Decodifica fora do event loop; devolve (linhas, rejeitados, tempos por etapa em ms)"""
+        loop = asyncio.get_running_loop()
+        submitted_at = time.monotonic()
+        nbytes = len(body)
+        with self._lock:
+            # Uma requisição sozinha sempre passa, mesmo maior que o orçamento
+            if self._in_flight_bytes and self._in_flight_bytes + nbytes > self.max_in_flight_bytes:
+                admitted = False
+            else:
+                admitted = True
+                self._in_flight += 1
+                self._in_flight_bytes += nbytes
+                self._requests += 1
+                self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        if not admitted:
+            raise self.reject(nbytes)
+        try:
+            rows, rejected, timings = await loop.run_in_executor(
+                self._executor, decode_request, signal, body, content_encoding, content_type, submitted_at)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._in_flight_bytes -= nbytes
+        timings["total"] = (time.monotonic() - submitted_at) * 1000
+        return rows, rejected, timings
+
+    def queue_depth(self):
+        return self._in_flight
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "in_flight_bytes": self._in_flight_bytes,
+                "max_in_flight_bytes": self.max_in_flight_bytes,
+                "requests": self._requests,
+                "errors": self._errors,
+                "rejected_requests": self._rejected_requests,
+                "rejected_bytes": self._rejected_bytes,
+            }
@@ -0,0 +1,570 @@
+"""
+Consultas da API do dashboard sobre o SQLite
+
+Monta o SELECT de /api/metrics, /api/traces e /api/logs a partir da role e dos
+filtros da requisição. Tudo vira predicado SQL (sem filtragem em Python) e a
+paginação é por keyset: o cursor opaco carrega (timestamp, rowid) da última
+linha devolvida e a próxima página continua com
+`(timestamp, rowid) < (?, ?)`, sem OFFSET, usando os mesmos índices.
+
+Timestamps são comparados em ns (collector_time) e só viram texto ISO 8601
+(UTC) nas linhas devolvidas.
+
+Em metrics, role, metric_name, service_name e atributos são propriedades da
+série: build_select resolve os ids no dicionário em memória (SeriesRegistry)
+e lê os pontos pelo índice (series_id, timestamp) — uma consulta por série,
+unidas com UNION ALL e intercaladas pelo ORDER BY do SQLite (merge), sem
+varrer o índice de timestamp atrás de séries raras. Acima de MAX_SERIES_MERGE
+séries o filtro volta ao JOIN com `series`.
+
+As linhas saem com `attributes` como objeto JSON: o texto gravado na ingestão
+entra na resposta como orjson.Fragment, sem json.loads/json.dumps por linha.
+
+Leitura incremental: o rowid das partições é a sequência de ingestão do sinal
+(collector_sequence). Com `since`, a consulta devolve as linhas com
+`since < rowid <= watermark` em ordem de ingestão, e o próximo `since` é o
+watermark (ou o rowid da última linha, se a página encheu).
+
+Páginas acima de MAX_LIMIT são transmitidas sem carregar as linhas: uma
+primeira passada lê só as chaves ((timestamp, rowid) ou rowid) para achar o
+cursor/watermark dos headers, e a segunda percorre as partições com cursores
+do SQLite, entregando as linhas em lotes de STREAM_CHUNK_ROWS ao codificador
+(page_boundary/iter_page, since_boundary/iter_since). As duas passadas rodam
+no mesmo snapshot de leitura (Storage.snapshot).
+"""
+
+import base64
+import heapq
+import json
+import os
+import sqlite3
+from itertools import islice
+
+import orjson
+
+from collector_rbac import ROLE_TEAMS, role_filter
+from collector_rollups import RESOLUTIONS, pick_resolution, table_name as rollup_table
+from collector_time import NS_PER_SECOND, to_iso, to_ns
+
+# Filtros de coluna aceitos por tabela (parâmetro da API -> coluna)
+COLUMN_FILTERS = {
+    "metrics": ("service_name", "metric_name"),
+    "traces": ("service_name", "trace_id"),
+    "logs": ("service_name", "severity_text"),
+}
+
+MAX_LIMIT = 5000
+# Acima de MAX_LIMIT a resposta é transmitida em pedaços (sem cache), até este limite
+MAX_STREAM_LIMIT = int(os.getenv("COLLECTOR_MAX_STREAM_ROWS", "100000"))
+STREAM_CHUNK_ROWS = 2000
+# Séries unidas com UNION ALL numa consulta (o SQLite aceita até 500 SELECTs compostos)
+MAX_SERIES_MERGE = 200
+
+# Linhas devolvidas pela API; pontos de métrica recuperam a série pelo series_id
+SELECTS = {
+    "metrics": "SELECT r.rowid AS _rowid, r.timestamp, s.service_name, s.metric_name, r.value, s.unit, "
+               "s.attributes, s.team FROM {name} r JOIN series s ON s.id = r.series_id",
+    "traces": "SELECT r.rowid AS _rowid, r.* FROM {name} r",
+    "logs": "SELECT r.rowid AS _rowid, r.* FROM {name} r",
+}
+# Pontos de uma série pelo índice (series_id, timestamp); a série entra depois do merge
+SERIES_POINTS = "SELECT r.rowid AS _rowid, r.timestamp, r.series_id, r.value FROM {name} r WHERE r.series_id = ?"
+SERIES_MERGE = ("SELECT r._rowid, r.timestamp, s.service_name, s.metric_name, r.value, s.unit, s.attributes, s.team "
+                "FROM ({points} ORDER BY timestamp DESC, _rowid DESC LIMIT ?) r JOIN series s ON s.id = r.series_id "
+                "ORDER BY r.timestamp DESC, r._rowid DESC")
+
+
+class InvalidQuery(ValueError):
+    """Parâmetro de consulta inválido (vira HTTP 400 na API)"""
+
+
+def encode_cursor(timestamp, rowid):
+    raw = json.dumps([timestamp, rowid], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, rowid = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidQuery("cursor inválido")
+    if not isinstance(timestamp, int) or not isinstance(rowid, int):
+        raise InvalidQuery("cursor inválido")
+    return timestamp, rowid
+
+
+def parse_attribute_filters(items):
+    """["chave=valor", ...] -> [(chave, valor)]"""
+    filters = []
+    for item in items or ():
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            raise InvalidQuery(f"filtro de atributo inválido: {item!r} (use chave=valor)")
+        filters.append((key, value))
+    return filters
+
+
+def series_ids(series, role, columns, attributes):
+    """
+    ids das séries commitadas que passam nos filtros de série (role, colunas,
+    atributos), com a mesma regra dos predicados SQL sobre `series`
+    """
+    team = ROLE_TEAMS.get(role)
+    wanted = {column: value for column, value in columns.items() if value is not None}
+    ids = []
+    for series_id, (metric_name, service_name, _, attributes_json, series_team) in series.items():
+        if team is not None and series_team != team:
+            continue
+        if wanted.get("metric_name", metric_name) != metric_name or wanted.get("service_name", service_name) != service_name:
+            continue
+        if attributes:
+            try:
+                attrs = json.loads(attributes_json)
+            except (TypeError, ValueError):
+                attrs = None
+            if not isinstance(attrs, dict) or any(json_text(attrs.get(key)) != value for key, value in attributes):
+                continue
+        ids.append(series_id)
+    ids.sort()
+    return ids
+
+
+def build_select(table, role, partitions, start=None, end=None, columns=None, attributes=(), cursor=None,
+                 limit=100, since=None, upto=None, series=None):
+    """
+    Devolve [(sql, params)] — uma consulta por partição diária que cruza o
+    intervalo, da mais nova para a mais antiga — ou None quando a role não
+    enxerga nada (ou nenhuma série passa nos filtros). start/end são datetimes
+    (sem fuso = UTC).
+
+    columns: {coluna: valor} restrito a COLUMN_FILTERS[table];
+    attributes: [(chave, valor)] comparados com json_extract sobre attributes;
+    upto: watermark lido antes da consulta (linhas de lotes posteriores ficam de fora);
+    since: só linhas com rowid > since, em ordem de ingestão (ver fetch_since);
+    series: SeriesRegistry — em metrics, os filtros de série viram ids (series_ids).
+    """
+    predicate = role_filter(role)
+    if predicate is None:
+        return None
+    where, series_params = predicate
+    series_clauses = [where] if where else []
+
+    for column, value in (columns or {}).items():
+        if column not in COLUMN_FILTERS[table]:
+            raise InvalidQuery(f"filtro {column} não suportado em {table}")
+        if value is not None:
+            series_clauses.append(f"{column} = ?")
+            series_params.append(value)
+
+    for key, value in attributes:
+        # Chave entre aspas no path JSON: "device.id" não é um caminho aninhado
+        series_clauses.append("CAST(json_extract(attributes, ?) AS TEXT) = ?")
+        series_params.extend([_json_path(key), value])
+
+    clauses, params = [], []
+    if start is not None:
+        start = to_ns(start)
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        end = to_ns(end)
+        clauses.append("timestamp < ?")
+        params.append(end)
+
+    if upto is not None:
+        clauses.append("r.rowid <= ?")
+        params.append(upto)
+    if since is not None:
+        if cursor:
+            raise InvalidQuery("since e cursor não podem ser usados juntos")
+        clauses.append("r.rowid > ?")
+        params.append(since)
+
+    if cursor:
+        position = decode_cursor(cursor)
+        clauses.append("(r.timestamp, r.rowid) < (?, ?)")
+        params.extend(position)
+        # O cursor também limita as partições: nada mais novo que a última linha vista
+        end = min(end, position[0]) if end is not None else position[0]
+
+    limit = max(1, min(int(limit), MAX_STREAM_LIMIT))
+    tables = partitions.tables(table, start, end)
+    if table == "metrics" and series is not None and series_clauses:
+        ids = series_ids(series, role, columns or {}, attributes)
+        if not ids:
+            return None
+        if len(ids) <= MAX_SERIES_MERGE:
+            return _series_select(tables, ids, clauses, params, limit, since is not None)
+
+    clauses = series_clauses + clauses
+    params = series_params + params
+    where_clause = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    params.append(limit)
+    if since is not None:
+        return [
+            (f"{SELECTS[table].format(name=name)} {where_clause}ORDER BY r.rowid LIMIT ?", params)
+            for name in tables
+        ]
+    # rowid só é único dentro da partição, mas um mesmo timestamp nunca cruza partições
+    return [
+        (f"{SELECTS[table].format(name=name)} {where_clause}ORDER BY r.timestamp DESC, r.rowid DESC LIMIT ?", params)
+        for name in tables
+    ]
+
+
+def _series_select(tables, ids, clauses, params, limit, since):
+    """Consultas de build_select para metrics restritas às séries `ids` (mesmas colunas e ordem)"""
+    filters = "".join(f" AND {clause}" for clause in clauses)
+    if since:
+        # Em ordem de ingestão o índice útil é o rowid; as séries só filtram
+        marks = ", ".join("?" * len(ids))
+        return [
+            (f"{SELECTS['metrics'].format(name=name)} WHERE r.series_id IN ({marks}){filters} "
+             f"ORDER BY r.rowid LIMIT ?", [*ids, *params, limit])
+            for name in tables
+        ]
+    queries = []
+    for name in tables:
+        points = " UNION ALL ".join(SERIES_POINTS.format(name=name) + filters for _ in ids)
+        queries.append((SERIES_MERGE.format(points=points),
+                        [value for series_id in ids for value in (series_id, *params)] + [limit]))
+    return queries
+
+
+def attributes_fragment(text):
+    """Texto JSON de attributes (gravado pelo decoder) -> objeto na resposta, sem reparsear"""
+    return orjson.Fragment(text) if text else None
+
+
+def row_items(rows):
+    """Linhas do SELECT (com _rowid) -> dicts da API: timestamp ISO e attributes como objeto"""
+    for row in rows:
+        item = dict(row)
+        del item["_rowid"]
+        item["timestamp"] = to_iso(item["timestamp"])
+        item["attributes"] = attributes_fragment(item["attributes"])
+        yield item
+
+
+def batched(rows):
+    """Lotes de até STREAM_CHUNK_ROWS linhas de qualquer iterável (lista ou cursor)"""
+    iterator = iter(rows)
+    while batch := list(islice(iterator, STREAM_CHUNK_ROWS)):
+        yield batch
+
+
+def encode_chunks(rows):
+    """Gera o corpo JSON (lista) em pedaços de STREAM_CHUNK_ROWS linhas, sem montar a resposta inteira"""
+    yield b"["
+    first = True
+    for batch in batched(rows):
+        body = orjson.dumps(list(row_items(batch)))[1:-1]
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def page_rows(conn, queries):
+    """Percorre as partições até encher o limite; devolve (linhas cruas, próximo cursor ou None)"""
+    rows = []
+    limit = queries[0][1][-1] if queries else 0
+    for sql, params in queries:
+        remaining = limit - len(rows)
+        if remaining <= 0:
+            break
+        try:
+            rows.extend(conn.execute(sql, [*params[:-1], remaining]).fetchall())
+        except sqlite3.OperationalError as e:
+            # Partição descartada pela retenção entre o planejamento e a leitura
+            if "no such table" in str(e):
+                continue
+            raise
+    next_cursor = None
+    if rows and len(rows) >= limit:
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["_rowid"])
+    return rows, next_cursor
+
+
+def fetch_page(conn, queries):
+    rows, next_cursor = page_rows(conn, queries)
+    return list(row_items(rows)), next_cursor
+
+
+def _execute(conn, sql, params):
+    """Cursor da consulta, ou None se a partição foi descartada pela retenção"""
+    try:
+        return conn.execute(sql, params)
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            return None
+        raise
+
+
+def page_boundary(conn, queries):
+    """Próximo cursor de page_rows lendo só (timestamp, rowid) de cada linha da página"""
+    limit = queries[0][1][-1] if queries else 0
+    seen = 0
+    last = None
+    for sql, params in queries:
+        remaining = limit - seen
+        if remaining <= 0:
+            break
+        cursor = _execute(conn, f"SELECT timestamp, _rowid FROM ({sql})", [*params[:-1], remaining])
+        for last in cursor or ():
+            seen += 1
+    if last is None or seen < limit:
+        return None
+    return encode_cursor(last[0], last[1])
+
+
+def iter_page(conn, queries):
+    """Mesmas linhas de page_rows, partição por partição, sem materializar a página"""
+    limit = queries[0][1][-1] if queries else 0
+    seen = 0
+    for sql, params in queries:
+        remaining = limit - seen
+        if remaining <= 0:
+            return
+        for row in _execute(conn, sql, [*params[:-1], remaining]) or ():
+            seen += 1
+            yield row
+
+
+def since_rows(conn, queries, upto):
+    """
+    Junta as partições em ordem de rowid até o limite; devolve (linhas cruas,
+    novo watermark): o rowid da última linha se a página encheu, senão `upto`.
+    """
+    rows = []
+    limit = queries[0][1][-1] if queries else 0
+    for sql, params in queries:
+        try:
+            rows.extend(conn.execute(sql, params).fetchall())
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                continue
+            raise
+    rows.sort(key=lambda row: row["_rowid"])
+    watermark = upto
+    if len(rows) >= limit:
+        last = rows[limit - 1]["_rowid"]
+        if len(rows) > limit and rows[limit]["_rowid"] == last:
+            # Linhas anteriores à sequência repetem rowids entre partições: a página fecha num rowid inteiro
+            rows = [row for row in rows[:limit] if row["_rowid"] < last] or [
+                row for row in rows if row["_rowid"] == last]
+        else:
+            rows = rows[:limit]
+        watermark = rows[-1]["_rowid"]
+    return rows, watermark
+
+
+def fetch_since(conn, queries, upto):
+    rows, watermark = since_rows(conn, queries, upto)
+    return list(row_items(rows)), watermark
+
+
+def since_boundary(conn, queries, upto):
+    """
+    Watermark de since_rows lendo só os rowids (merge das partições em ordem
+    de rowid); a página é exatamente `since < rowid <= watermark`.
+    """
+    limit = queries[0][1][-1] if queries else 0
+    cursors = [cursor for sql, params in queries
+               if (cursor := _execute(conn, f"SELECT _rowid FROM ({sql})", params)) is not None]
+    count = 0
+    current = below = last = None
+    for (rowid,) in heapq.merge(*cursors, key=lambda row: row[0]):
+        count += 1
+        if count > limit:
+            # Rowid repetido na virada da página (linhas anteriores à sequência): fecha antes dele
+            if rowid == last and below is not None:
+                return below
+            return last
+        if rowid != current:
+            below, current = current, rowid
+        if count == limit:
+            last = rowid
+    return last if count >= limit else upto
+
+
+def iter_since(conn, queries, watermark):
+    """Linhas com rowid <= watermark em ordem de ingestão, intercalando os cursores das partições"""
+    cursors = [cursor for sql, params in queries if (cursor := _execute(conn, sql, params)) is not None]
+    for row in heapq.merge(*cursors, key=lambda row: row["_rowid"]):
+        if row["_rowid"] > watermark:
+            return
+        yield row
+
+
+# --- Agregação por janelas de tempo (/api/metrics/aggregate) ---
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+MAX_BUCKETS = 10_000
+
+
+def parse_duration(value):
+    """"30s", "5m", "1h", "7d" ou segundos -> segundos (int > 0)"""
+    text = str(value).strip().lower()
+    unit = DURATION_UNITS.get(text[-1:]) if text else None
+    number = text[:-1] if unit else text
+    try:
+        seconds = int(float(number) * (unit or 1))
+    except (ValueError, OverflowError):  # OverflowError: "inf"
+        raise InvalidQuery(f"duração inválida: {value!r} (use 30s, 5m, 1h, 7d)")
+    if seconds <= 0:
+        raise InvalidQuery(f"duração deve ser positiva: {value!r}")
+    return seconds
+
+
+def parse_percentiles(value):
+    """"50,90,99" -> [50.0, 90.0, 99.0]"""
+    result = []
+    for item in str(value or "").split(","):
+        if not item.strip():
+            continue
+        try:
+            p = float(item)
+        except ValueError:
+            raise InvalidQuery(f"percentil inválido: {item!r}")
+        if not 0 < p <= 100:
+            raise InvalidQuery(f"percentil fora de (0, 100]: {item!r}")
+        result.append(p)
+    return result
+
+
+def resolve_resolution(requested, step, span_seconds, wants_percentiles, raw_percentile_window):
+    """"auto" | "raw" | "1m" | "5m" | "1h" -> resolução do rollup ou None (tabela bruta)"""
+    if requested == "raw":
+        return None
+    if requested == "auto":
+        return pick_resolution(step, span_seconds, wants_percentiles, raw_percentile_window)
+    if requested not in RESOLUTIONS:
+        raise InvalidQuery(f"resolution inválida: {requested!r} (use auto, raw, {', '.join(RESOLUTIONS)})")
+    if step % RESOLUTIONS[requested]:
+        raise InvalidQuery(f"step deve ser múltiplo da resolução {requested}")
+    return requested
+
+
+def json_text(value):
+    """Valor de um atributo (JSON decodificado) -> mesmo texto de CAST(json_extract(...) AS TEXT)"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _json_path(key):
+    return '$."' + key.replace('"', '\\"') + '"'
+
+
+def _percentile_key(p):
+    return f"p{p:g}".replace(".", "_")
+
+
+def build_aggregate(role, metric_name, step, start, end, partitions, group_by=(), percentiles=(),
+                    service_name=None, attributes=(), resolution=None):
+    """
+    Devolve (sql, params) ou None quando a role (ou o intervalo) não tem dados.
+
+    Uma linha por (grupo, bucket) com avg/min/max/count/sum. Sem `resolution`
+    lê a tabela bruta e calcula percentis por nearest-rank no SQLite com funções
+    de janela (ROW_NUMBER sobre os valores ordenados de cada bucket e escolha do
+    rank ceil(q * n)). Com `resolution` ("1m", "5m", "1h") re-agrega os rollups
+    (sem percentis, com `last`). start/end são ns; os buckets são múltiplos de
+    `step` segundos desde a época. Na tabela bruta só as partições diárias que
+    cruzam [start, end) entram no UNION ALL.
+    """
+    predicate = role_filter(role)
+    if predicate is None:
+        return None
+    if (end - start) / NS_PER_SECOND / step > MAX_BUCKETS:
+        raise InvalidQuery(f"janela gera mais de {MAX_BUCKETS} buckets; aumente o step")
+
+    where, params = predicate
+    label_params = [_json_path(key) for key in group_by]
+    if resolution is None:
+        time_column = "timestamp"
+        range_params = [start, end]
+    else:
+        # Bucket do rollup que contém `start` entra inteiro
+        time_column = "bucket"
+        width = RESOLUTIONS[resolution]
+        start_s = start // NS_PER_SECOND
+        range_params = [start_s - start_s % width, -(-end // NS_PER_SECOND)]
+    clauses = ["metric_name = ?", f"{time_column} >= ?", f"{time_column} < ?"]
+    filter_params = [metric_name, *range_params]
+    if where:
+        clauses.append(where)
+        filter_params.extend(params)
+    if service_name is not None:
+        clauses.append("service_name = ?")
+        filter_params.append(service_name)
+    for key, value in attributes:
+        clauses.append("CAST(json_extract(attributes, ?) AS TEXT) = ?")
+        filter_params.extend([_json_path(key), value])
+
+    labels = [f"g{i}" for i in range(len(group_by))]
+    label_select = "".join(f"json_extract(attributes, ?) AS {g}, " for g in labels)
+    partition = ", ".join(labels + ["bucket"])
+    label_cols = "".join(f"{g}, " for g in labels)
+
+    if resolution is not None:
+        # last = `last` do rollup com maior last_ts dentro do bucket de saída
+        sql = (
+            f"WITH points AS (SELECT {label_select}(bucket / {int(step)}) * {int(step)} AS bucket, "
+            f"count, sum, min, max, last, last_ts FROM {rollup_table(resolution)} r "
+            f"JOIN series s ON s.id = r.series_id WHERE {' AND '.join(clauses)}), "
+            f"ranked AS (SELECT *, FIRST_VALUE(last) OVER (PARTITION BY {partition} ORDER BY last_ts DESC) AS latest "
+            f"FROM points) "
+            f"SELECT {label_cols}bucket AS timestamp, SUM(sum) / SUM(count) AS avg, "
+            f"MIN(min) AS min, MAX(max) AS max, SUM(count) AS count, SUM(sum) AS sum, MAX(latest) AS last "
+            f"FROM ranked GROUP BY {partition} ORDER BY {partition}"
+        )
+        return sql, label_params + filter_params
+
+    # q vem de parse_percentiles (float validado), seguro para interpolar
+    percentile_select = "".join(
+        f", MAX(CASE WHEN rn = MAX(1, CAST({p / 100!r} * n AS INTEGER) + ({p / 100!r} * n > CAST({p / 100!r} * n AS INTEGER))) "
+        f"THEN value END) AS {_percentile_key(p)}"
+        for p in percentiles
+    )
+
+    tables = partitions.tables("metrics", start, end)
+    if not tables:
+        return None
+    points = " UNION ALL ".join(
+        f"SELECT {label_select}(timestamp / {int(step) * NS_PER_SECOND}) * {int(step)} AS bucket, "
+        f"value FROM {name} r JOIN series s ON s.id = r.series_id WHERE {' AND '.join(clauses)}"
+        for name in tables
+    )
+    sql = (
+        f"WITH points AS ({points}), "
+        f"ranked AS (SELECT *, ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY value) AS rn, "
+        f"COUNT(*) OVER (PARTITION BY {partition}) AS n FROM points) "
+        f"SELECT {label_cols}bucket AS timestamp, AVG(value) AS avg, MIN(value) AS min, "
+        f"MAX(value) AS max, COUNT(*) AS count, SUM(value) AS sum{percentile_select} "
+        f"FROM ranked GROUP BY {partition} ORDER BY {partition}"
+    )
+    return sql, (label_params + filter_params) * len(tables)
+
+
+def fetch_aggregate(conn, sql, params, group_by=()):
+    """Agrupa as linhas do build_aggregate em séries: [{labels, points}]"""
+    series = []
+    current_key = object()
+    for row in conn.execute(sql, params):
+        item = dict(row)
+        item["timestamp"] = to_iso(item["timestamp"] * NS_PER_SECOND)
+        labels = {key: item.pop(f"g{i}") for i, key in enumerate(group_by)}
+        key = tuple(labels.values())
+        if key != current_key:
+            current_key = key
+            series.append({"labels": labels, "points": []})
+        series[-1]["points"].append(item)
+    return series
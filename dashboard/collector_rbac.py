@@ -0,0 +1,46 @@
+"""
+Regras de RBAC (Zero Trust) do collector
+
+O time dono de cada linha é resolvido uma única vez na ingestão e gravado na
+coluna indexada `team`; a API só aplica `WHERE team = ?` no SQL.
+
+Precedência da resolução: atributo `team` explícito (IOT/IA), depois o
+service.name (humainze-iot / humainze-ia), depois as heurísticas por sinal
+(nome da métrica, device.id e module dos logs).
+"""
+
+TEAMS = ("IOT", "IA")
+
+# Métricas de sensores físicos (ESP32) e de serviços de ML
+IOT_METRICS = frozenset(["temperature", "humidity", "air_quality_ppm", "luminosity_lux"])
+IA_METRICS = frozenset(["mobile_dashboard_views", "prediction_count", "anomalies_detected", "model_inference_duration_ms"])
+IA_LOG_MODULES = frozenset(["ml.inference", "api.mobile", "cache.manager", "db.connector"])
+
+# Role do dashboard -> time que ela enxerga (ROLE_ADMIN vê tudo)
+ROLE_ADMIN = "ROLE_ADMIN"
+ROLE_TEAMS = {"ROLE_IOT": "IOT", "ROLE_IA": "IA"}
+
+
+def resolve_team(team_attr, service_name, metric_name=None, device_id=None, module=None):
+    if team_attr in TEAMS:
+        return team_attr
+    service_name = service_name or ""
+    if "humainze-iot" in service_name:
+        return "IOT"
+    if "humainze-ia" in service_name:
+        return "IA"
+    if metric_name in IOT_METRICS or device_id:
+        return "IOT"
+    if metric_name in IA_METRICS or module in IA_LOG_MODULES:
+        return "IA"
+    return str(team_attr) if team_attr else ""
+
+
+def role_filter(role):
+    """Predicado SQL da role: ("", []) para admin, None para role desconhecida"""
+    if role == ROLE_ADMIN:
+        return "", []
+    team = ROLE_TEAMS.get(role)
+    if team is None:
+        return None
+    return "team = ?", [team]
@@ -0,0 +1,70 @@
+"""
+Respostas OTLP do collector (HTTP e gRPC)
+
+Monta os Export*ServiceResponse com partial_success e os google.rpc.Status de
+erro, codificados em protobuf ou JSON conforme o formato da requisição, como
+pede a especificação OTLP/HTTP.
+"""
+
+from google.protobuf.json_format import MessageToJson
+from google.rpc import code_pb2, status_pb2
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2
+from opentelemetry.proto.collector.logs.v1 import logs_service_pb2
+
+PROTOBUF = "application/x-protobuf"
+JSON = "application/json"
+
+# sinal -> (classe de resposta, campo de rejeitados no partial_success)
+RESPONSES = {
+    "metrics": (metrics_service_pb2.ExportMetricsServiceResponse, "rejected_data_points"),
+    "traces": (trace_service_pb2.ExportTraceServiceResponse, "rejected_spans"),
+    "logs": (logs_service_pb2.ExportLogsServiceResponse, "rejected_log_records"),
+}
+
+
+# Motivo informado no partial_success quando o decodificador descarta itens
+REJECTED_MESSAGES = {
+    "metrics": "pontos de tipos não suportados (summary/exponential_histogram) ou com valor NaN/±inf "
+               "foram descartados",
+    "traces": "spans sem trace_id ou span_id foram descartados",
+    "logs": "log records inválidos foram descartados",
+}
+
+
+class IngestRejected(Exception):
+    """Requisição recusada inteira por sobrecarga; o exporter deve tentar de novo"""
+
+    def __init__(self, message, status_code=429, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class InvalidPayload(Exception):
+    """Corpo que não pôde ser descomprimido ou decodificado; reenviar não adianta (400)"""
+
+
+def wants_json(content_type):
+    return content_type.startswith(JSON)
+
+
+def export_response(signal, rejected=0):
+    response_cls, rejected_field = RESPONSES[signal]
+    response = response_cls()
+    # partial_success só é preenchido quando algo foi descartado
+    if rejected:
+        setattr(response.partial_success, rejected_field, rejected)
+        response.partial_success.error_message = REJECTED_MESSAGES[signal]
+    return response
+
+
+def status_message(message, code=code_pb2.INVALID_ARGUMENT):
+    return status_pb2.Status(code=code, message=message)
+
+
+def encode(message, as_json):
+    """Serializa no mesmo formato da requisição; devolve (bytes, media type)"""
+    if as_json:
+        return MessageToJson(message, indent=None).encode(), JSON
+    return message.SerializeToString(), PROTOBUF
@@ -0,0 +1,269 @@
+"""
+Retenção (TTL) do armazenamento SQLite do collector
+
+Uma thread em segundo plano apaga, a cada `interval` segundos, o que passou do
+TTL de cada sinal. Partições diárias (collector_partitions) inteiramente
+expiradas são descartadas com DROP TABLE, em O(1); o que sobra dentro da
+partição do dia de corte é removido com DELETEs em pedaços de `chunk_rows` linhas,
+cada um na sua própria transação, com uma pausa curta entre eles: o lock de
+escrita nunca fica preso por muito tempo e o BatchWriter continua gravando
+entre os pedaços. Depois das remoções, PRAGMA incremental_vacuum devolve as
+páginas livres ao sistema de arquivos (também em pedaços).
+
+Configuração por variáveis de ambiente (dias; 0 = guardar para sempre):
+  COLLECTOR_RETENTION_METRICS_DAYS     métricas brutas (padrão: 7)
+  COLLECTOR_RETENTION_TRACES_DAYS      traces (padrão: 7)
+  COLLECTOR_RETENTION_LOGS_DAYS        logs sem TTL específico de severidade (padrão: 7)
+  COLLECTOR_RETENTION_LOGS_SEVERITY    TTL por severidade, ex.: "ERROR:30,FATAL:30,WARN:14"
+                                       (sem diferenciar maiúsculas: "error" usa o TTL de ERROR)
+  COLLECTOR_RETENTION_ROLLUP_1M_DAYS / _5M_DAYS / _1H_DAYS  rollups (padrão: 30 / 90 / 365)
+  COLLECTOR_RETENTION_INTERVAL_S       intervalo entre execuções (padrão: 300)
+  COLLECTOR_RETENTION_CHUNK_ROWS       linhas por DELETE (padrão: 5000)
+  COLLECTOR_RETENTION_VACUUM_PAGES     páginas liberadas por transação de vacuum (padrão: 2000)
+
+O incremental_vacuum só tem efeito em bancos com auto_vacuum=INCREMENTAL, o
+modo dos bancos novos (Storage.open). Bancos antigos reaproveitam as páginas
+livres nas próximas inserções; para convertê-los, rode VACUUM com o collector
+parado.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from collector_partitions import partition_name
+from collector_rollups import RESOLUTIONS, table_name as rollup_table
+from collector_time import NS_PER_DAY, NS_PER_SECOND, day_of, now_ns
+
+DEFAULT_ROLLUP_DAYS = {"1m": 30, "5m": 90, "1h": 365}
+
+
+def parse_severity_ttls(value):
+    """"ERROR:30,WARN:14" -> {"ERROR": 30.0, "WARN": 14.0}"""
+    ttls = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        severity, sep, days = item.partition(":")
+        if not sep:
+            raise ValueError(f"TTL de severidade inválido: {item!r} (use SEVERIDADE:dias)")
+        ttls[severity.strip().upper()] = float(days)
+    return ttls
+
+
+def policies_from_env():
+    return {
+        "metrics": float(os.getenv("COLLECTOR_RETENTION_METRICS_DAYS", "7")),
+        "traces": float(os.getenv("COLLECTOR_RETENTION_TRACES_DAYS", "7")),
+        "logs": float(os.getenv("COLLECTOR_RETENTION_LOGS_DAYS", "7")),
+        "logs_severity": parse_severity_ttls(os.getenv("COLLECTOR_RETENTION_LOGS_SEVERITY", "ERROR:30,FATAL:30")),
+        "rollups": {
+            resolution: float(os.getenv(f"COLLECTOR_RETENTION_ROLLUP_{resolution.upper()}_DAYS",
+                                        str(DEFAULT_ROLLUP_DAYS[resolution])))
+            for resolution in RESOLUTIONS
+        },
+    }
+
+
+class RetentionManager:
+    def __init__(self, storage, policies=None, interval=None, chunk_rows=None, vacuum_pages=None,
+                 chunk_pause=0.01, on_expire=None):
+        self.storage = storage
+        # on_expire(): chamado depois de uma passada que removeu linhas (ex.: limpar caches de consulta)
+        self.on_expire = on_expire
+        self.policies = policies or policies_from_env()
+        self.interval = interval or float(os.getenv("COLLECTOR_RETENTION_INTERVAL_S", "300"))
+        self.chunk_rows = chunk_rows or int(os.getenv("COLLECTOR_RETENTION_CHUNK_ROWS", "5000"))
+        self.vacuum_pages = vacuum_pages or int(os.getenv("COLLECTOR_RETENTION_VACUUM_PAGES", "2000"))
+        self.chunk_pause = chunk_pause
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Relatório exposto em /internal/stats
+        self.last_report = None
+        self.totals = {"runs": 0, "partitions_dropped": 0, "rows_deleted": 0, "pages_vacuumed": 0, "bytes_reclaimed": 0, "errors": 0}
+        self.last_error = None
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        # Primeira execução logo após subir, depois a cada `interval`
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Erro na retenção: {e}")
+                self.last_error = str(e)
+                with self._lock:
+                    self.totals["errors"] += 1
+            self._stop.wait(self.interval)
+
+    # --- Execução ---
+
+    def _targets(self, now):
+        """(nome, tabela, WHERE, params, corte em ns) de cada conjunto de linhas expiradas"""
+        targets = []
+
+        def cutoff(days):
+            return now - int(days * NS_PER_DAY)
+
+        for signal in ("metrics", "traces"):
+            days = self.policies[signal]
+            if days > 0:
+                targets.append((signal, signal, "timestamp < ?", [cutoff(days)], cutoff(days)))
+
+        severities = self.policies["logs_severity"]
+        for severity, days in severities.items():
+            if days > 0:
+                targets.append((f"logs[{severity}]", "logs", "UPPER(severity_text) = ? AND timestamp < ?",
+                                [severity, cutoff(days)], cutoff(days)))
+        days = self.policies["logs"]
+        if days > 0:
+            if severities:
+                marks = ", ".join("?" for _ in severities)
+                targets.append(("logs", "logs", f"UPPER(severity_text) NOT IN ({marks}) AND timestamp < ?",
+                                [*severities, cutoff(days)], cutoff(days)))
+            else:
+                targets.append(("logs", "logs", "timestamp < ?", [cutoff(days)], cutoff(days)))
+
+        # Chunks comprimidos (collector_chunks) seguem o TTL das métricas brutas, chunk inteiro
+        if self.policies["metrics"] > 0:
+            days = self.policies["metrics"]
+            targets.append(("metrics_chunks", "metrics_chunks", "end_ts < ?", [cutoff(days)], None))
+
+        for resolution, days in self.policies["rollups"].items():
+            if days > 0:
+                targets.append((rollup_table(resolution), rollup_table(resolution), "bucket < ?",
+                                [cutoff(days) // NS_PER_SECOND], None))
+        return targets
+
+    def _drop_cutoffs(self, now):
+        """{tabela: dia} — partições anteriores a este dia expiraram por todas as regras"""
+        cutoffs = {}
+        for signal in ("metrics", "traces"):
+            if self.policies[signal] > 0:
+                cutoffs[signal] = day_of(now - int(self.policies[signal] * NS_PER_DAY))
+        log_ttls = [self.policies["logs"], *self.policies["logs_severity"].values()]
+        if all(days > 0 for days in log_ttls):
+            cutoffs["logs"] = day_of(now - int(max(log_ttls) * NS_PER_DAY))
+        return cutoffs
+
+    def _drop_partitions(self, now):
+        dropped = []
+        partitions = self.storage.partitions
+        for table, day in self._drop_cutoffs(now).items():
+            for old_day in partitions.days(table, newest_first=False):
+                if old_day >= day or self._stop.is_set():
+                    break
+                # Sai do conjunto antes do DROP: consultas novas já não a enxergam
+                partitions.forget(table, old_day)
+                name = partition_name(table, old_day)
+                with self.storage.writing() as conn:
+                    conn.execute(f"DROP TABLE IF EXISTS {name}")
+                dropped.append(name)
+        return dropped
+
+    def _delete_chunked(self, table, where, params):
+        deleted = 0
+        while not self._stop.is_set():
+            with self.storage.writing() as conn:
+                n = conn.execute(
+                    f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                    (*params, self.chunk_rows),
+                ).rowcount
+            deleted += n
+            if n < self.chunk_rows:
+                break
+            # Solta o lock de escrita para o BatchWriter entre os pedaços
+            time.sleep(self.chunk_pause)
+        return deleted
+
+    def _vacuum(self):
+        pages = 0
+        while not self._stop.is_set():
+            with self.storage.writing() as conn:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free or conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    break
+                # O módulo sqlite3 dá um único step no PRAGMA, que libera uma página por step
+                step = min(free, self.vacuum_pages)
+                for _ in range(step):
+                    conn.execute("PRAGMA incremental_vacuum(1)")
+                pages += step
+            if free <= step:
+                break
+            time.sleep(self.chunk_pause)
+        return pages
+
+    def run_once(self):
+        """Uma passada completa; devolve e guarda o relatório do que foi recuperado"""
+        start = time.perf_counter()
+        before = self.storage.db_stats()
+        now = now_ns()
+        dropped = self._drop_partitions(now)
+        deleted = {}
+        for name, table, where, params, cutoff in self._targets(now):
+            if cutoff is None:
+                tables = [table]
+            else:
+                # Só as partições até o dia de corte podem ter linhas expiradas
+                tables = self.storage.partitions.tables(table, end=cutoff)
+            n = sum(self._delete_chunked(t, where, params) for t in tables)
+            if n:
+                deleted[name] = n
+        if (dropped or deleted) and self.on_expire is not None:
+            self.on_expire()
+        pages = self._vacuum()
+        after = self.storage.db_stats()
+
+        report = {
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "duration_s": round(time.perf_counter() - start, 3),
+            "partitions_dropped": dropped,
+            "rows_deleted": deleted,
+            "pages_vacuumed": pages,
+            "db_bytes_before": before["db_bytes"],
+            "db_bytes_after": after["db_bytes"],
+            "bytes_reclaimed": max(0, before["db_bytes"] - after["db_bytes"]),
+            "freelist_pages": after["freelist_count"],
+        }
+        with self._lock:
+            self.last_report = report
+            self.totals["runs"] += 1
+            self.totals["partitions_dropped"] += len(dropped)
+            self.totals["rows_deleted"] += sum(deleted.values())
+            self.totals["pages_vacuumed"] += pages
+            self.totals["bytes_reclaimed"] += report["bytes_reclaimed"]
+        self.last_error = None
+        if dropped or deleted or pages:
+            print(f"🧹 Retenção: {len(dropped)} partições descartadas, {sum(deleted.values())} linhas removidas {deleted}, "
+                  f"{report['bytes_reclaimed'] / 1024 / 1024:.1f} MB liberados em {report['duration_s']}s")
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval_s": self.interval,
+                "chunk_rows": self.chunk_rows,
+                "policies_days": self.policies,
+                "totals": dict(self.totals),
+                "last_run": self.last_report,
+                "last_error": self.last_error,
+            }
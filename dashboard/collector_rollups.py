@@ -0,0 +1,126 @@
+"""
+Rollups contínuos das métricas (1m / 5m / 1h)
+
+Cada série (series_id, ver collector_series) ganha, por resolução, uma
+linha por bucket com count, sum, min, max e last. As tabelas são atualizadas
+na mesma transação do lote bruto (BatchWriter), com UPSERT aditivo: o lote é
+pré-agregado em memória e cada bucket tocado vira um único
+INSERT ... ON CONFLICT DO UPDATE. Como count/sum/min/max são comutativos,
+pontos atrasados ou fora de ordem caem no bucket certo; `last` só é trocado
+quando o ponto novo tem timestamp >= last_ts.
+
+Buckets são segundos desde a época (UTC), o timestamp bruto em ns dividido por
+10^9; last_ts fica em ns, como nas partições.
+"""
+
+from math import isfinite
+
+from collector_time import NS_PER_SECOND
+
+# Resolução -> segundos (da mais fina para a mais grossa)
+RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+def table_name(resolution):
+    return f"metrics_rollup_{resolution}"
+
+
+def create_statements():
+    statements = []
+    for resolution in RESOLUTIONS:
+        table = table_name(resolution)
+        statements.append(f'''CREATE TABLE IF NOT EXISTS {table}
+           (bucket INTEGER NOT NULL,
+            series_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            last REAL NOT NULL,
+            last_ts INTEGER NOT NULL,
+            PRIMARY KEY (series_id, bucket))''')
+        statements.append(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)")
+    return statements
+
+
+def _upsert_statement(resolution):
+    return (
+        f"INSERT INTO {table_name(resolution)} (bucket, series_id, count, sum, min, max, last, last_ts) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        f"ON CONFLICT (series_id, bucket) DO UPDATE SET "
+        f"count = count + excluded.count, sum = sum + excluded.sum, "
+        f"min = MIN(min, excluded.min), max = MAX(max, excluded.max), "
+        f"last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END, "
+        f"last_ts = MAX(last_ts, excluded.last_ts)"
+    )
+
+
+UPSERTS = {resolution: _upsert_statement(resolution) for resolution in RESOLUTIONS}
+
+
+def aggregate_rows(rows):
+    """
+    Pontos (timestamp, series_id, value) ->
+    {resolução: {(series_id, bucket): [count, sum, min, max, last, last_ts]}}
+    """
+    result = {resolution: {} for resolution in RESOLUTIONS}
+    for ts, series_id, value in rows:
+        # NaN/±inf ficam fora: +inf e -inf no mesmo bucket dariam sum NaN (NULL)
+        if value is None or not isfinite(value):
+            continue
+        seconds = ts // NS_PER_SECOND
+        for resolution, width in RESOLUTIONS.items():
+            key = (series_id, seconds - seconds % width)
+            agg = result[resolution].get(key)
+            if agg is None:
+                result[resolution][key] = [1, value, value, value, value, ts]
+                continue
+            agg[0] += 1
+            agg[1] += value
+            if value < agg[2]:
+                agg[2] = value
+            if value > agg[3]:
+                agg[3] = value
+            if ts >= agg[5]:
+                agg[4] = value
+                agg[5] = ts
+    return result
+
+
+def apply_rollups(conn, rows):
+    """Atualiza os rollups dentro da transação corrente (chamado pelo BatchWriter)"""
+    for resolution, buckets in aggregate_rows(rows).items():
+        conn.executemany(UPSERTS[resolution], [
+            (bucket, series_id, *agg) for (series_id, bucket), agg in buckets.items()
+        ])
+
+
+def rebuild(conn, tables, chunk_rows=50_000):
+    """Recria os rollups a partir das partições brutas de metrics (migração)"""
+    for resolution in RESOLUTIONS:
+        conn.execute(f"DROP TABLE IF EXISTS {table_name(resolution)}")
+    for statement in create_statements():
+        conn.execute(statement)
+    for table in tables:
+        cursor = conn.execute(f"SELECT timestamp, series_id, value FROM {table}")
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            apply_rollups(conn, rows)
+
+
+def pick_resolution(step, span_seconds, wants_percentiles, raw_percentile_window):
+    """
+    Escolha automática da fonte da agregação: a resolução mais grossa que divide
+    o step; percentis só existem na tabela bruta, então ela é mantida para
+    janelas curtas (<= raw_percentile_window) quando eles são pedidos.
+    Devolve None para usar a tabela bruta.
+    """
+    if wants_percentiles and span_seconds <= raw_percentile_window:
+        return None
+    chosen = None
+    for resolution, width in RESOLUTIONS.items():
+        if step % width == 0:
+            chosen = resolution
+    return chosen
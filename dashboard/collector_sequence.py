@@ -0,0 +1,83 @@
+"""
+Sequência de ingestão (watermark) de metrics, traces e logs
+
+Cada linha gravada numa partição recebe do BatchWriter um rowid explícito
+tirado de um contador por sinal que só cresce, atravessando todas as
+partições diárias. Esse rowid é a sequência de ingestão da linha: o watermark
+de um sinal é o maior rowid já commitado, e `rowid > watermark` é uma busca
+pela chave primária de cada partição — sem coluna ou índice extra.
+
+O valor alto é salvo em `ingest_sequence` na mesma transação do lote, para o
+contador não voltar atrás se a retenção apagar as linhas mais novas. Linhas
+gravadas antes da sequência existir mantêm os rowids por partição, todos
+abaixo do primeiro watermark.
+
+Como os demais estados em memória, o watermark só avança depois do commit
+(publish); numa falha (discard) os números reservados são reaproveitados.
+"""
+
+import threading
+
+from collector_partitions import PARTITIONED, partition_tables
+
+CREATE_STATEMENTS = [
+    '''CREATE TABLE IF NOT EXISTS ingest_sequence
+       (signal TEXT PRIMARY KEY,
+        value INTEGER NOT NULL)''',
+]
+
+
+class IngestSequence:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._committed = {table: 0 for table in PARTITIONED}
+        self._reserved = dict(self._committed)   # thread de escrita
+
+    def load(self, conn):
+        values = {table: 0 for table in PARTITIONED}
+        for signal, value in conn.execute("SELECT signal, value FROM ingest_sequence"):
+            if signal in values:
+                values[signal] = value
+        for table in PARTITIONED:
+            for name in partition_tables(conn, table):
+                last = conn.execute(f"SELECT max(rowid) FROM {name}").fetchone()[0]
+                if last is not None and last > values[table]:
+                    values[table] = last
+        with self._lock:
+            self._committed = values
+        self._reserved = dict(values)
+
+    # --- Escrita (thread do BatchWriter, dentro da transação do lote) ---
+
+    def reserve(self, table, n):
+        """Primeiro de `n` números consecutivos para as próximas linhas de `table`"""
+        first = self._reserved[table] + 1
+        self._reserved[table] += n
+        return first
+
+    def persist(self, conn):
+        for table, value in self._reserved.items():
+            if value != self._committed[table]:
+                conn.execute("INSERT INTO ingest_sequence (signal, value) VALUES (?, ?) "
+                             "ON CONFLICT(signal) DO UPDATE SET value = excluded.value", (table, value))
+
+    def publish(self):
+        """Chamado após o commit do lote"""
+        with self._lock:
+            self._committed = dict(self._reserved)
+
+    def discard(self):
+        """Chamado quando o lote falha (rollback)"""
+        with self._lock:
+            self._reserved = dict(self._committed)
+
+    # --- Leitura ---
+
+    def watermark(self, table):
+        """Maior sequência commitada de `table`: toda linha com rowid <= watermark já está visível"""
+        with self._lock:
+            return self._committed[table]
+
+    def stats(self):
+        with self._lock:
+            return {"watermarks": dict(self._committed)}
@@ -0,0 +1,175 @@
+"""
+Dicionário de séries e registro de metadados das métricas
+
+Uma série é (metric_name, service_name, attributes): tudo o que se repete em
+todas as leituras de um mesmo sensor. Ela é gravada uma única vez na tabela
+`series` (chaveada por um hash de 64 bits) e cada ponto das partições de
+metrics guarda só (timestamp, series_id, value). unit, description e o tipo
+(gauge/sum/histogram) de cada métrica ficam em `metric_meta`, atualizados
+quando um exporter manda valores novos (vale o último não vazio).
+
+O decoder entrega cada ponto como (timestamp, value, chave da série), com a
+mesma tupla de chave reaproveitada pelos pontos de atributos iguais. O
+BatchWriter troca a chave pelo id (SeriesRegistry.intern_rows) dentro da
+transação do lote; o mapa em memória só recebe as séries novas depois do
+commit, como as partições.
+"""
+
+import hashlib
+import threading
+
+from collector_partitions import COLUMNS, create_indexes, partition_tables
+
+CREATE_STATEMENTS = [
+    '''CREATE TABLE IF NOT EXISTS series
+       (id INTEGER PRIMARY KEY,
+        hash INTEGER NOT NULL UNIQUE,
+        metric_name TEXT NOT NULL,
+        service_name TEXT NOT NULL,
+        unit TEXT,
+        attributes TEXT NOT NULL,
+        team TEXT)''',
+    "CREATE INDEX IF NOT EXISTS idx_series_name ON series (metric_name)",
+    "CREATE INDEX IF NOT EXISTS idx_series_team ON series (team)",
+    '''CREATE TABLE IF NOT EXISTS metric_meta
+       (metric_name TEXT PRIMARY KEY,
+        unit TEXT,
+        description TEXT,
+        type TEXT)''',
+]
+
+
+def series_hash(metric_name, service_name, attributes):
+    """Hash estável de 64 bits (com sinal, cabe no INTEGER do SQLite)"""
+    digest = hashlib.blake2b(
+        "\x1f".join((metric_name or "", service_name or "", attributes or "")).encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class SeriesRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}          # (metric_name, service_name, attributes) -> id
+        self._info = {}         # id -> (metric_name, service_name, unit, attributes, team)
+        self._meta = {}         # metric_name -> (unit, description, type) gravado em metric_meta
+        self._pending = {}
+        self._pending_info = {}
+        self._pending_meta = {}
+
+    def load(self, conn):
+        ids = {}
+        info = {}
+        for i, m, s, u, a, t in conn.execute("SELECT id, metric_name, service_name, unit, attributes, team FROM series"):
+            ids[(m, s, a)] = i
+            info[i] = (m, s, u, a, t)
+        meta = {m: (u, d, t) for m, u, d, t in conn.execute("SELECT metric_name, unit, description, type FROM metric_meta")}
+        with self._lock:
+            self._ids = ids
+            self._info = info
+            self._meta = meta
+
+    def _intern(self, conn, key):
+        metric_name, service_name, unit, attrs, team, description, kind = key
+        self._record_meta(conn, metric_name, (unit or None, description or None, kind or None))
+        ident = (metric_name, service_name, attrs)
+        series_id = self._ids.get(ident) or self._pending.get(ident)
+        if series_id is not None:
+            return series_id
+        h = series_hash(metric_name, service_name, attrs)
+        conn.execute(
+            "INSERT INTO series (hash, metric_name, service_name, unit, attributes, team) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (hash) DO NOTHING",
+            (h, metric_name, service_name, unit, attrs, team),
+        )
+        series_id, unit, team = conn.execute("SELECT id, unit, team FROM series WHERE hash = ?", (h,)).fetchone()
+        self._pending[ident] = series_id
+        self._pending_info[series_id] = (metric_name, service_name, unit, attrs, team)
+        return series_id
+
+    def _record_meta(self, conn, metric_name, values):
+        """UPSERT em metric_meta só quando (unit, description, type) muda; vazio não apaga o valor gravado"""
+        stored = self._pending_meta.get(metric_name) or self._meta.get(metric_name)
+        merged = values if stored is None else tuple(new or old for new, old in zip(values, stored))
+        if merged == stored:
+            return
+        conn.execute(
+            "INSERT INTO metric_meta (metric_name, unit, description, type) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (metric_name) DO UPDATE SET "
+            "unit = COALESCE(excluded.unit, unit), description = COALESCE(excluded.description, description), "
+            "type = COALESCE(excluded.type, type)",
+            (metric_name, *values),
+        )
+        self._pending_meta[metric_name] = merged
+
+    def intern_rows(self, conn, rows):
+        """(timestamp, value, chave) -> (timestamp, series_id, value); roda na thread de escrita"""
+        out = []
+        last_key = last_id = None
+        for ts, value, key in rows:
+            if key is not last_key:
+                last_key = key
+                last_id = self._intern(conn, key)
+            out.append((ts, last_id, value))
+        return out
+
+    def publish(self):
+        """Chamado após o commit do lote"""
+        with self._lock:
+            self._ids.update(self._pending)
+            self._info.update(self._pending_info)
+            self._meta.update(self._pending_meta)
+        self._pending = {}
+        self._pending_info = {}
+        self._pending_meta = {}
+
+    def discard(self):
+        """Chamado quando o lote falha (rollback): as séries novas não existem no banco"""
+        self._pending = {}
+        self._pending_info = {}
+        self._pending_meta = {}
+
+    def describe(self, series_id):
+        """(metric_name, service_name, unit, attributes, team) de uma série já commitada, ou None"""
+        return self._info.get(series_id)
+
+    def items(self):
+        """[(id, (metric_name, service_name, unit, attributes, team))] das séries já commitadas"""
+        with self._lock:
+            return list(self._info.items())
+
+    def stats(self):
+        with self._lock:
+            return {"series": len(self._ids), "metrics": len(self._meta)}
+
+
+def migrate_metrics_to_series(conn):
+    """
+    Migração: reescreve as partições de metrics no formato (timestamp, series_id, value),
+    populando series e metric_meta; devolve as partições de metrics existentes
+    """
+    conn.create_function("series_hash", 3, series_hash, deterministic=True)
+    metric, service, attrs = "COALESCE(m.metric_name, '')", "COALESCE(m.service_name, '')", "COALESCE(m.attributes, '{}')"
+    tables = partition_tables(conn, "metrics")
+    for name in tables:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({name})")}
+        if "series_id" in columns:
+            continue
+        conn.execute(
+            f"INSERT INTO series (hash, metric_name, service_name, unit, attributes, team) "
+            f"SELECT series_hash({metric}, {service}, {attrs}), {metric}, {service}, m.unit, {attrs}, m.team "
+            f"FROM {name} m WHERE true ON CONFLICT (hash) DO NOTHING"
+        )
+        conn.execute(
+            f"INSERT INTO metric_meta (metric_name, unit) SELECT {metric}, MAX(m.unit) FROM {name} m GROUP BY 1 "
+            f"ON CONFLICT (metric_name) DO UPDATE SET unit = COALESCE(unit, excluded.unit)"
+        )
+        conn.execute(f"CREATE TABLE {name}_new {COLUMNS['metrics']}")
+        conn.execute(
+            f"INSERT INTO {name}_new (timestamp, series_id, value) SELECT m.timestamp, s.id, m.value "
+            f"FROM {name} m JOIN series s ON s.hash = series_hash({metric}, {service}, {attrs})"
+        )
+        conn.execute(f"DROP TABLE {name}")
+        conn.execute(f"ALTER TABLE {name}_new RENAME TO {name}")
+        create_indexes(conn, "metrics", name)
+    return tables
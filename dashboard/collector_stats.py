@@ -0,0 +1,205 @@
+"""
+Auto-telemetria do collector OTLP
+
+Contadores, taxas (janela deslizante de 60s) e histogramas de latência por
+sinal, mantidos em memória com custo desprezível no caminho quente: cada
+registro é um incremento sob lock, sem alocação.
+
+Exposto em /internal/stats (JSON) e /metrics (formato texto do Prometheus).
+"""
+
+import bisect
+import threading
+import time
+
+SIGNALS = ("metrics", "traces", "logs")
+STAGES = ("queue_wait", "decompress", "decode", "insert", "total")
+
+# Limites superiores dos buckets em ms (o último bucket é +Inf)
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+RATE_WINDOW_S = 60
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimativa pelo limite superior do bucket (como histogram_quantile)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class RateMeter:
+    """Soma por segundo num anel de RATE_WINDOW_S posições"""
+
+    __slots__ = ("slots", "seconds")
+
+    def __init__(self):
+        self.slots = [0] * RATE_WINDOW_S
+        self.seconds = [0] * RATE_WINDOW_S
+
+    def add(self, n, now):
+        second = int(now)
+        i = second % RATE_WINDOW_S
+        if self.seconds[i] != second:
+            self.seconds[i] = second
+            self.slots[i] = 0
+        self.slots[i] += n
+
+    def rate(self, now):
+        # Só conta segundos completos dentro da janela
+        second = int(now)
+        total = sum(c for c, s in zip(self.slots, self.seconds) if second - RATE_WINDOW_S <= s < second)
+        return total / RATE_WINDOW_S
+
+
+class SignalStats:
+    __slots__ = ("requests", "rows", "bytes_in", "rejected_items", "rejected_requests", "errors",
+                 "request_rate", "row_rate", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self.bytes_in = 0
+        self.rejected_items = 0
+        self.rejected_requests = 0
+        self.errors = 0
+        self.request_rate = RateMeter()
+        self.row_rate = RateMeter()
+        self.latency = {stage: Histogram() for stage in STAGES}
+
+
+class CollectorStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.signals = {signal: SignalStats() for signal in SIGNALS}
+
+    # --- Registro (caminho quente) ---
+
+    def record_request(self, signal, nbytes, rows, rejected, timings):
+        now = time.time()
+        with self._lock:
+            s = self.signals[signal]
+            s.requests += 1
+            s.rows += rows
+            s.bytes_in += nbytes
+            s.rejected_items += rejected
+            s.request_rate.add(1, now)
+            s.row_rate.add(rows, now)
+            for stage, ms in timings.items():
+                s.latency[stage].observe(ms)
+
+    def record_insert(self, signal, rows, ms):
+        with self._lock:
+            self.signals[signal].latency["insert"].observe(ms)
+
+    def record_rejected_request(self, signal):
+        with self._lock:
+            self.signals[signal].rejected_requests += 1
+
+    def record_error(self, signal):
+        with self._lock:
+            self.signals[signal].errors += 1
+
+    # --- Leitura ---
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {
+                "uptime_s": round(now - self.started_at, 1),
+                "signals": {
+                    name: {
+                        "requests": s.requests,
+                        "rows": s.rows,
+                        "bytes_in": s.bytes_in,
+                        "rejected_items": s.rejected_items,
+                        "rejected_requests": s.rejected_requests,
+                        "errors": s.errors,
+                        "requests_per_s": round(s.request_rate.rate(now), 3),
+                        "rows_per_s": round(s.row_rate.rate(now), 3),
+                        "latency": {stage: h.snapshot() for stage, h in s.latency.items()},
+                    }
+                    for name, s in self.signals.items()
+                },
+            }
+
+    def prometheus(self, gauges):
+        """Formato texto do Prometheus; gauges: {nome: (valor, descrição)} medidos na hora"""
+        now = time.time()
+        prefix = "humainze_collector"
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            counters = (
+                ("requests_total", "requests", "Requisições OTLP aceitas"),
+                ("rows_total", "rows", "Linhas decodificadas e enfileiradas"),
+                ("received_bytes_total", "bytes_in", "Bytes recebidos (antes da descompressão)"),
+                ("rejected_items_total", "rejected_items", "Itens descartados (partial_success)"),
+                ("rejected_requests_total", "rejected_requests", "Requisições recusadas por sobrecarga"),
+                ("errors_total", "errors", "Requisições com erro de parsing"),
+            )
+            for name, attr, help_text in counters:
+                family(name, "counter", help_text)
+                for signal, s in self.signals.items():
+                    lines.append(f'{prefix}_{name}{{signal="{signal}"}} {getattr(s, attr)}')
+
+            family("requests_per_second", "gauge", f"Taxa de requisições (janela de {RATE_WINDOW_S}s)")
+            for signal, s in self.signals.items():
+                lines.append(f'{prefix}_requests_per_second{{signal="{signal}"}} {s.request_rate.rate(now):.3f}')
+            family("rows_per_second", "gauge", f"Taxa de linhas (janela de {RATE_WINDOW_S}s)")
+            for signal, s in self.signals.items():
+                lines.append(f'{prefix}_rows_per_second{{signal="{signal}"}} {s.row_rate.rate(now):.3f}')
+
+            family("stage_duration_seconds", "histogram", "Latência por etapa do pipeline")
+            for signal, s in self.signals.items():
+                for stage, h in s.latency.items():
+                    labels = f'signal="{signal}",stage="{stage}"'
+                    cumulative = 0
+                    for bound, c in zip(h.bounds, h.counts):
+                        cumulative += c
+                        lines.append(f'{prefix}_stage_duration_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {cumulative}')
+                    lines.append(f'{prefix}_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                    lines.append(f'{prefix}_stage_duration_seconds_sum{{{labels}}} {h.sum / 1000:.6f}')
+                    lines.append(f'{prefix}_stage_duration_seconds_count{{{labels}}} {h.count}')
+
+        for name, (value, help_text) in gauges.items():
+            family(name, "gauge", help_text)
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,226 @@
+"""
+Camada de armazenamento SQLite do collector OTLP
+
+Mantém conexões persistentes: uma conexão de escrita (serializada por lock) e um
+pool de conexões somente leitura para a API do dashboard. O banco roda em modo WAL,
+então leituras do dashboard não bloqueiam a ingestão e vice-versa.
+
+Configuração por variáveis de ambiente:
+  COLLECTOR_DB_PATH         caminho do arquivo SQLite (padrão: humainze_metrics.db)
+  COLLECTOR_SQLITE_PROFILE  durable | balanced | fast (padrão: balanced)
+  COLLECTOR_SQLITE_SYNCHRONOUS / _CACHE_SIZE / _MMAP_SIZE / _BUSY_TIMEOUT
+                            sobrescrevem valores individuais do perfil
+  COLLECTOR_READERS         tamanho do pool de leitura (padrão: 4)
+  COLLECTOR_MAX_STREAMS     respostas transmitidas simultâneas (padrão: 4)
+
+Com todas as conexões de leitura emprestadas por mais de `timeout` segundos,
+reader() levanta ReadersBusy (a API responde 503 + Retry-After).
+
+Respostas transmitidas (limit > MAX_LIMIT) não ocupam o pool: snapshot() abre
+uma conexão própria com uma transação de leitura, que vive enquanto o corpo é
+enviado e é fechada com ele (ReadSnapshot.close). No máximo
+COLLECTOR_MAX_STREAMS ficam abertas; além disso, ReadersBusy na hora.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from collector_migrations import migrate
+from collector_partitions import PartitionSet
+from collector_sequence import IngestSequence
+from collector_series import SeriesRegistry
+
+# Perfis de armazenamento: cache_size negativo é em KiB (convenção do SQLite)
+PROFILES = {
+    "durable": {"synchronous": "FULL", "cache_size": -16_000, "mmap_size": 0, "busy_timeout": 5000},
+    "balanced": {"synchronous": "NORMAL", "cache_size": -64_000, "mmap_size": 256 * 1024 * 1024, "busy_timeout": 5000},
+    "fast": {"synchronous": "OFF", "cache_size": -256_000, "mmap_size": 1024 * 1024 * 1024, "busy_timeout": 10000},
+}
+
+
+def profile_from_env():
+    name = os.getenv("COLLECTOR_SQLITE_PROFILE", "balanced").lower()
+    if name not in PROFILES:
+        raise ValueError(f"Perfil SQLite desconhecido: {name} (use {', '.join(PROFILES)})")
+    profile = dict(PROFILES[name])
+    for key in profile:
+        override = os.getenv(f"COLLECTOR_SQLITE_{key.upper()}")
+        if override is not None:
+            profile[key] = override if key == "synchronous" else int(override)
+    profile["name"] = name
+    return profile
+
+
+class ReadersBusy(Exception):
+    """Pool de leitura esgotado; o cliente deve tentar de novo em `retry_after` segundos"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ReadSnapshot:
+    """Conexão de leitura dedicada, presa a um snapshot (BEGIN) até close()"""
+
+    def __init__(self, conn, release):
+        self.conn = conn
+        self._release = release
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.close()
+        finally:
+            self.conn = None
+            self._release()
+
+
+class Storage:
+    def __init__(self, db_path=None, profile=None, readers=None):
+        self.db_path = db_path or os.getenv("COLLECTOR_DB_PATH", "humainze_metrics.db")
+        self.profile = profile or profile_from_env()
+        self.reader_count = readers or int(os.getenv("COLLECTOR_READERS", "4"))
+        self.stream_count = int(os.getenv("COLLECTOR_MAX_STREAMS", "4"))
+
+        self.schema_version = None
+        # Partições diárias existentes (metrics/traces/logs), ver collector_partitions
+        self.partitions = PartitionSet()
+        # Dicionário de séries das métricas (id por metric_name/service_name/attributes)
+        self.series = SeriesRegistry()
+        # Watermark de ingestão por sinal (rowids globais das partições), ver collector_sequence
+        self.sequence = IngestSequence()
+
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._readers = queue.Queue()
+        self._all_readers = []
+        self._streams = threading.BoundedSemaphore(self.stream_count)
+
+    # --- Ciclo de vida ---
+
+    def open(self):
+        if self._writer is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._writer = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._apply_pragmas(self._writer)
+        # Só vale para bancos novos (antes da primeira tabela); permite o incremental_vacuum da retenção
+        self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute(f"PRAGMA synchronous={self.profile['synchronous']}")
+        self.init_schema()
+
+        for _ in range(self.reader_count):
+            conn = self._open_reader()
+            self._all_readers.append(conn)
+            self._readers.put(conn)
+
+    def close(self):
+        for conn in self._all_readers:
+            conn.close()
+        self._all_readers = []
+        self._readers = queue.Queue()
+        if self._writer is not None:
+            with self._write_lock:
+                self._writer.close()
+                self._writer = None
+
+    def _open_reader(self, **kwargs):
+        """Leitores abrem o arquivo em modo somente leitura (após o schema existir)"""
+        uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, **kwargs)
+        self._apply_pragmas(conn)
+        conn.execute("PRAGMA query_only=ON")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _apply_pragmas(self, conn):
+        conn.execute(f"PRAGMA busy_timeout={int(self.profile['busy_timeout'])}")
+        conn.execute(f"PRAGMA cache_size={int(self.profile['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size={int(self.profile['mmap_size'])}")
+
+    # --- Schema ---
+
+    def init_schema(self):
+        """Cria ou atualiza o schema via migrações versionadas (PRAGMA user_version)"""
+        self.schema_version = migrate(self)
+        with self._write_lock:
+            self.partitions.load(self._writer)
+            self.series.load(self._writer)
+            self.sequence.load(self._writer)
+
+    def writable(self):
+        """Checagem O(1) para readiness: conexão aberta e arquivo gravável"""
+        return self._writer is not None and os.access(self.db_path, os.W_OK)
+
+    def db_stats(self):
+        """Tamanho do banco e do WAL (PRAGMAs baratos, sem varrer tabelas)"""
+        with self.reader() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        wal_path = self.db_path + "-wal"
+        wal_bytes = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return {
+            "schema_version": self.schema_version,
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "auto_vacuum": ("none", "full", "incremental")[auto_vacuum],
+            "db_bytes": page_size * page_count,
+            "wal_bytes": wal_bytes,
+        }
+
+    # --- Acesso às conexões ---
+
+    @contextmanager
+    def writing(self):
+        """Conexão de escrita com transação explícita; commit ao sair, rollback em erro"""
+        with self._write_lock:
+            conn = self._writer
+            conn.execute("BEGIN")
+            try:
+                yield conn
+                # Dentro do try: um COMMIT que falha (busy, I/O) não deixa a transação aberta
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    @contextmanager
+    def reader(self, timeout=5.0):
+        """Empresta uma conexão somente leitura do pool"""
+        try:
+            conn = self._readers.get(timeout=timeout)
+        except queue.Empty:
+            raise ReadersBusy(f"todas as {self.reader_count} conexões de leitura ocupadas há {timeout:g}s") from None
+        try:
+            yield conn
+        finally:
+            # Garante que nenhum snapshot de leitura fique aberto segurando o WAL
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def snapshot(self):
+        """
+        Conexão própria para uma resposta transmitida: as consultas feitas nela
+        veem o mesmo snapshot até close(), mesmo com a ingestão gravando no meio
+        """
+        if not self._streams.acquire(blocking=False):
+            raise ReadersBusy(f"{self.stream_count} respostas transmitidas em andamento")
+        try:
+            conn = self._open_reader(isolation_level=None)
+            conn.execute("BEGIN")
+        except BaseException:
+            self._streams.release()
+            raise
+        return ReadSnapshot(conn, self._streams.release)
@@ -0,0 +1,72 @@
+"""
+Timestamps do collector
+
+Todas as colunas timestamp guardam nanossegundos desde a época (UTC) em
+INTEGER: o decoder grava o time_unix_nano do OTLP como veio, sem criar um
+datetime por ponto; filtros de intervalo, cursor e retenção comparam inteiros;
+o dia da partição e o bucket dos rollups são divisões inteiras. A conversão
+para texto (ISO 8601 em UTC, sufixo Z) só acontece na borda da API, e
+datetimes sem fuso recebidos pela API são tratados como UTC — o mesmo
+resultado em qualquer container, independente do TZ local.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_DAY = 86_400 * NS_PER_SECOND
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_DAY = _EPOCH.date()
+
+
+def now_ns():
+    return time.time_ns()
+
+
+def to_ns(value):
+    """datetime (sem fuso = UTC) -> nanossegundos desde a época, sem passar por float"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * NS_PER_SECOND + delta.microseconds * 1000
+
+
+def to_datetime(ns):
+    """ns -> datetime em UTC (precisão de microssegundos)"""
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def to_iso(ns):
+    """ns -> "2025-01-31T12:00:00.123456Z"; None continua None"""
+    if ns is None:
+        return None
+    return to_datetime(ns).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def day_of(ns):
+    """Dia (UTC) de um timestamp em ns"""
+    return _EPOCH_DAY + timedelta(days=ns // NS_PER_DAY)
+
+
+def day_start(day):
+    """Primeiro ns do dia (UTC)"""
+    return (day - _EPOCH_DAY).days * NS_PER_DAY
+
+
+def legacy_ns(value):
+    """
+    Timestamp das colunas DATETIME antigas (texto do sqlite3 em hora local do
+    container, ex.: "2025-01-31 09:00:00.123456") -> ns; usado pela migração.
+    Inteiros passam direto; texto inválido ou NULL vira 0.
+    """
+    if isinstance(value, int):
+        return value
+    try:
+        local = datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return 0
+    if local.tzinfo is None:
+        # Mesma interpretação do datetime.fromtimestamp que gravou o texto
+        local = local.astimezone()
+    return to_ns(local)
@@ -0,0 +1,274 @@
+"""
+Escritor em lote (write-behind) do collector OTLP
+
+Os handlers HTTP apenas enfileiram linhas já decodificadas; uma thread dedicada
+drena a fila e grava tudo com executemany, uma transação por lote, usando a
+conexão de escrita do Storage. As tabelas brutas são particionadas por dia:
+cada linha vai para a partição do seu timestamp, criada na primeira escrita.
+`before_write` transforma as linhas antes da gravação (ex.: troca a chave da
+série pelo id) e tabelas derivadas (rollups) são atualizadas pelos callbacks
+de `after_write`, tudo dentro da mesma transação do lote. Cada linha
+particionada recebe como rowid o próximo número da sequência de ingestão do
+sinal (collector_sequence), que vira o watermark depois do commit; os
+callbacks recebem esses rowids junto com as linhas.
+O lote é descarregado quando atinge `max_batch_rows` linhas ou quando a linha
+mais antiga da fila passa de `flush_interval` segundos. Se a transação do lote
+falhar, cada envio (submit) do lote é regravado na própria transação: só o
+envio com a linha problemática é descartado, não os de outros clientes que já
+receberam 200.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+from collector_partitions import PARTITIONED, create_partition, partition_name, split_by_day
+
+
+class BatchWriter:
+    def __init__(self, storage, statements, max_batch_rows=2000, flush_interval=0.25, max_queue_rows=200_000,
+                 on_insert=None, before_write=None, after_write=None, participants=()):
+        # statements: {"metrics": "INSERT INTO {table} (rowid, ...) VALUES (?, ...)", ...};
+        # {table} recebe o nome da partição do dia e o 1º parâmetro é a sequência de ingestão
+        # on_insert(tabela, linhas, ms): chamado a cada executemany gravado
+        # before_write: {"metrics": fn(conn, linhas) -> linhas gravadas} na transação do lote
+        # after_write: {"metrics": fn(conn, linhas gravadas, rowids)} na transação do lote; rowids[i] é
+        # o rowid de linhas[i] (range da sequência de ingestão, None em tabela não particionada)
+        # participants: estado em memória dos hooks (publish() após o commit, discard() na falha)
+        self.storage = storage
+        self.on_insert = on_insert
+        self.before_write = before_write or {}
+        self.after_write = after_write or {}
+        self.participants = [storage.series, storage.sequence, *participants]
+        self.statements = statements
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval = flush_interval
+        self.max_queue_rows = max_queue_rows
+
+        self._pending = deque()          # (tabela, [linhas], instante de chegada)
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self.last_error = None           # erro do último lote (None se gravou com sucesso)
+
+        # Estatísticas expostas em /internal/stats
+        self._stats = {
+            "rows_written": 0,
+            "batches_flushed": 0,
+            "rows_dropped": 0,
+            "last_batch_rows": 0,
+            "max_batch_rows_seen": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "flush_errors": 0,
+        }
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="otlp-batch-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Para a thread garantindo que tudo que está na fila seja gravado"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --- API usada pelos handlers ---
+
+    def submit(self, table, rows, timeout=1.0):
+        """Enfileira linhas para gravação; levanta queue.Full se a fila não esvaziar a tempo"""
+        if not rows:
+            return
+        n = len(rows)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending_rows + n > self.max_queue_rows and self._pending_rows > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    self._stats["rows_dropped"] += n
+                    raise queue.Full(f"fila de escrita cheia ({self._pending_rows} linhas pendentes)")
+                self._cond.wait(remaining)
+            was_empty = not self._pending
+            self._pending.append((table, rows, time.monotonic()))
+            self._pending_rows += n
+            # Acorda o escritor para iniciar a contagem do intervalo ou descarregar o lote cheio
+            if was_empty or self._pending_rows >= self.max_batch_rows:
+                self._cond.notify_all()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopping
+
+    def queue_depth(self):
+        return self._pending_rows
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s["queue_rows"] = self._pending_rows
+        batches = s["batches_flushed"]
+        s["avg_batch_rows"] = round(s["rows_written"] / batches, 1) if batches else 0.0
+        total_flush_ms = s.pop("total_flush_ms")
+        s["avg_flush_ms"] = round(total_flush_ms / batches, 3) if batches else 0.0
+        s["max_batch_rows"] = self.max_batch_rows
+        s["flush_interval_ms"] = self.flush_interval * 1000
+        s["max_queue_rows"] = self.max_queue_rows
+        return s
+
+    # --- Thread de escrita ---
+
+    def _take_batch(self):
+        """Bloqueia até haver um lote pronto (por tamanho ou por tempo) e o remove da fila"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    if self._stopping or self._pending_rows >= self.max_batch_rows:
+                        break
+                    waited = time.monotonic() - self._pending[0][2]
+                    if waited >= self.flush_interval:
+                        break
+                    self._cond.wait(self.flush_interval - waited)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+            submissions = []
+            taken = 0
+            while self._pending and taken < self.max_batch_rows:
+                table, rows, _ = self._pending.popleft()
+                submissions.append((table, rows))
+                taken += len(rows)
+            self._pending_rows -= taken
+            # Libera produtores bloqueados em submit()
+            self._cond.notify_all()
+            return submissions, taken
+
+    def _run(self):
+        while True:
+            item = self._take_batch()
+            if item is None:
+                break
+            submissions, taken = item
+            batch = {}
+            for table, rows in submissions:
+                batch.setdefault(table, []).extend(rows)
+            try:
+                self._flush(batch, taken, submissions)
+            except Exception as e:
+                # A thread não pode morrer: sem ela a fila só enche e toda ingestão vira 429
+                print(f"❌ Erro inesperado no escritor em lote ({taken} linhas): {e}")
+                self.last_error = str(e)
+
+    def _insert(self, conn, table, rows, created):
+        """Grava as linhas; devolve (linhas na ordem gravada, rowids atribuídos)"""
+        if table not in PARTITIONED:
+            conn.executemany(self.statements[table].format(table=table), rows)
+            return rows, None
+        partitions = self.storage.partitions
+        first = seq = self.storage.sequence.reserve(table, len(rows))
+        by_day = split_by_day(rows)
+        written = rows if len(by_day) == 1 else []
+        for day, day_rows in by_day.items():
+            if not partitions.has(table, day) and (table, day) not in created:
+                create_partition(conn, table, day)
+                created.append((table, day))
+            conn.executemany(self.statements[table].format(table=partition_name(table, day)),
+                             [(seq + i, *row) for i, row in enumerate(day_rows)])
+            seq += len(day_rows)
+            if written is not rows:
+                written.extend(day_rows)
+        return written, range(first, seq)
+
+    def _commit(self, batch):
+        """Grava `batch` ({tabela: linhas}) numa transação; levanta a exceção depois do discard()"""
+        inserts = []
+        created = []
+        try:
+            with self.storage.writing() as conn:
+                for table, rows in batch.items():
+                    t0 = time.perf_counter()
+                    prepare = self.before_write.get(table)
+                    if prepare is not None:
+                        rows = prepare(conn, rows)
+                    rows, rowids = self._insert(conn, table, rows, created)
+                    derived = self.after_write.get(table)
+                    if derived is not None:
+                        derived(conn, rows, rowids)
+                    inserts.append((table, len(rows), (time.perf_counter() - t0) * 1000))
+                self.storage.sequence.persist(conn)
+        except Exception:
+            for participant in self.participants:
+                participant.discard()
+            raise
+        # Partições, séries e buffers novos só aparecem para as consultas depois do commit.
+        # O lote já está no banco: uma falha aqui é registrada, mas não desfaz nem repete a escrita
+        try:
+            self.storage.partitions.publish(created)
+        except Exception as e:
+            print(f"❌ Erro ao publicar partições novas: {e}")
+        for participant in self.participants:
+            try:
+                participant.publish()
+            except Exception as e:
+                print(f"❌ Erro ao publicar {type(participant).__name__}: {e}")
+        return inserts
+
+    def _flush(self, batch, taken, submissions=None):
+        start = time.perf_counter()
+        try:
+            inserts = self._commit(batch)
+        except Exception as e:
+            self.last_error = str(e)
+            with self._cond:
+                self._stats["flush_errors"] += 1
+            if submissions is None or len(submissions) < 2:
+                print(f"Erro ao gravar lote de {taken} linhas: {e}")
+                self._dropped(taken)
+                return
+            # Um envio ruim não pode levar junto os demais: cada um na própria transação
+            print(f"Erro ao gravar lote de {taken} linhas: {e}; regravando {len(submissions)} envios separadamente")
+            written = 0
+            inserts = []
+            for table, rows in submissions:
+                try:
+                    inserts.extend(self._commit({table: rows}))
+                    written += len(rows)
+                except Exception as e:
+                    print(f"Erro ao gravar envio de {len(rows)} linhas em {table}: {e}")
+                    self.last_error = str(e)
+                    self._dropped(len(rows))
+            if not written:
+                return
+            taken = written
+        else:
+            self.last_error = None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._cond:
+            s = self._stats
+            s["rows_written"] += taken
+            s["batches_flushed"] += 1
+            s["last_batch_rows"] = taken
+            s["max_batch_rows_seen"] = max(s["max_batch_rows_seen"], taken)
+            s["last_flush_ms"] = round(elapsed_ms, 3)
+            s["max_flush_ms"] = round(max(s["max_flush_ms"], elapsed_ms), 3)
+            s["total_flush_ms"] += elapsed_ms
+        if self.on_insert is not None:
+            for table, n, ms in inserts:
+                self.on_insert(table, n, ms)
+
+    def _dropped(self, n):
+        with self._cond:
+            self._stats["rows_dropped"] += n
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos chunks comprimidos de gauges (dashboard/collector_chunks.py)
+
+Grava as mesmas séries de sensores (temperature, humidity, air_quality_ppm,
+luminosity_lux, uma por dispositivo) pelo caminho real do collector
+(BatchWriter + dicionário de séries) nas partições brutas de metrics e nos
+chunks, e compara:
+  - bytes por ponto (tabela + índices, via dbstat do SQLite);
+  - velocidade de varredura de uma série inteira para arrays NumPy.
+
+Uso: python scripts/bench_chunks.py [dispositivos] [pontos_por_serie]
+"""
+
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard"))
+
+import numpy as np
+
+from collector_chunks import ChunkStore
+from collector_rollups import apply_rollups
+from collector_storage import Storage
+from collector_writer import BatchWriter
+
+DEVICES = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+POINTS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+BATCH_ROWS = 2000
+PERIOD_NS = 5_000_000_000  # uma leitura a cada 5 s por sensor
+
+INSERT = {"metrics": "INSERT INTO {table} (rowid, timestamp, series_id, value) VALUES (?, ?, ?, ?)"}
+
+# métrica -> (unidade, base, amplitude, casas decimais do sensor)
+SENSORS = {
+    "temperature": ("celsius", 24.0, 3.0, 1),
+    "humidity": ("percent", 55.0, 10.0, 1),
+    "air_quality_ppm": ("ppm", 420.0, 80.0, 0),
+    "luminosity_lux": ("lux", 300.0, 250.0, 0),
+}
+
+
+def build_rows():
+    """Pontos no formato do decoder: (timestamp ns, valor, chave da série), intercalados por dispositivo"""
+    rng = random.Random(42)
+    start = time.time_ns() - POINTS * PERIOD_NS
+    series = []
+    for device in range(DEVICES):
+        attrs = f'{{"service.name": "humainze-iot", "device.id": "ESP32-{device:04d}"}}'
+        for name, (unit, base, amplitude, digits) in SENSORS.items():
+            key = (name, "humainze-iot", unit, attrs, "IOT", "", "gauge")
+            series.append((key, base + rng.uniform(-1, 1), amplitude, digits, rng.uniform(0, math.tau)))
+    rows = []
+    for i in range(POINTS):
+        for key, base, amplitude, digits, phase in series:
+            # Variação lenta ao longo do dia + ruído do sensor, arredondado como o sensor envia
+            value = base + amplitude * math.sin(phase + i * PERIOD_NS / 86_400e9 * math.tau) + rng.gauss(0, amplitude / 50)
+            ts = start + i * PERIOD_NS + int(rng.gauss(0, 1_000_000))  # jitter de ~1 ms
+            rows.append((ts, round(value, digits) if digits else float(round(value)), key))
+    return rows, len(series)
+
+
+def table_bytes(conn, prefixes):
+    total = 0
+    for name, size in conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"):
+        if name.startswith(prefixes):
+            total += size
+    return total
+
+
+def main():
+    rows, n_series = build_rows()
+    print(f"{n_series} séries x {POINTS} pontos = {len(rows):,} pontos")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, "bench.db"))
+        storage.open()
+        chunks = ChunkStore(metrics=list(SENSORS))
+        writer = BatchWriter(storage, INSERT, before_write={"metrics": storage.series.intern_rows},
+                             participants=[chunks],
+                             after_write={"metrics": lambda conn, r, _: (apply_rollups(conn, r), chunks.append(conn, r))})
+        start = time.perf_counter()
+        for i in range(0, len(rows), BATCH_ROWS):
+            batch = rows[i:i + BATCH_ROWS]
+            writer._flush({"metrics": batch}, len(batch))
+        chunks.flush(storage)
+        print(f"ingestão (partições + rollups + chunks): {time.perf_counter() - start:.2f}s")
+
+        with storage.reader() as conn:
+            try:
+                raw_bytes = table_bytes(conn, ("metrics_p", "idx_metrics_p"))
+                chunk_bytes = table_bytes(conn, ("metrics_chunks", "idx_metrics_chunks"))
+            except Exception as e:
+                raw_bytes = chunk_bytes = None
+                print(f"dbstat indisponível neste SQLite ({e}); bytes por ponto não medidos")
+            series_ids = [row[0] for row in conn.execute("SELECT id FROM series ORDER BY id")]
+            partitions = storage.partitions.tables("metrics", newest_first=False)
+
+            def scan_raw(series_id):
+                data = []
+                for name in partitions:
+                    data.extend(conn.execute(
+                        f"SELECT timestamp, value FROM {name} WHERE series_id = ? ORDER BY timestamp", (series_id,)))
+                arr = np.array(data, dtype=np.float64).reshape(-1, 2)
+                return np.array([r[0] for r in data], dtype=np.int64), arr[:, 1]
+
+            def scan_chunks(series_id):
+                return chunks.read(conn, series_id)
+
+            # Mesmo conteúdo nos dois caminhos
+            ts_raw, v_raw = scan_raw(series_ids[0])
+            ts_chunk, v_chunk = scan_chunks(series_ids[0])
+            assert np.array_equal(ts_raw, ts_chunk) and np.array_equal(v_raw, v_chunk), "chunks divergem da tabela bruta"
+
+            print(f"{'armazenamento':<24} {'bytes/ponto':>12} {'varredura (pontos/s)':>22}")
+            for label, size, scan in (("metrics (linhas)", raw_bytes, scan_raw),
+                                      ("metrics_chunks (gorilla)", chunk_bytes, scan_chunks)):
+                begin = time.perf_counter()
+                points = sum(len(scan(series_id)[0]) for series_id in series_ids)
+                elapsed = time.perf_counter() - begin
+                per_point = f"{size / len(rows):.2f}" if size is not None else "n/d"
+                print(f"{label:<24} {per_point:>12} {points / elapsed:>22,.0f}")
+        stats = chunks.stats()
+        print(f"chunks selados: {stats['chunks_sealed']} ({stats['bytes_per_point']} bytes/ponto só no BLOB)")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos formatos de resposta da API de consulta (dashboard/collector_formats.py)
+
+Grava pontos de sensores pelo caminho real do collector (BatchWriter +
+dicionário de séries), lê uma página grande de /api/metrics direto do SQLite
+(mesmo SELECT da API) e compara, para json, columns e arrow:
+  - tempo de serialização no collector;
+  - tamanho do corpo;
+  - tempo para o cliente montar um pandas.DataFrame a partir dos bytes.
+
+Uso: python scripts/bench_formats.py [dispositivos] [pontos_por_serie]
+"""
+
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard"))
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from collector_formats import encode_rows
+from collector_query import MAX_STREAM_LIMIT, build_select, page_rows
+from collector_rbac import ROLE_ADMIN
+from collector_storage import Storage
+from collector_writer import BatchWriter
+
+DEVICES = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+POINTS = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+BATCH_ROWS = 2000
+PERIOD_NS = 5_000_000_000
+REPEAT = 3
+
+INSERT = {"metrics": "INSERT INTO {table} (rowid, timestamp, series_id, value) VALUES (?, ?, ?, ?)"}
+
+SENSORS = {"temperature": "celsius", "humidity": "percent", "air_quality_ppm": "ppm", "luminosity_lux": "lux"}
+
+
+def build_rows():
+    """Pontos no formato do decoder: (timestamp ns, valor, chave da série)"""
+    rng = random.Random(42)
+    start = time.time_ns() - POINTS * PERIOD_NS
+    keys = []
+    for device in range(DEVICES):
+        attrs = f'{{"service.name": "humainze-iot", "device.id": "ESP32-{device:04d}"}}'
+        for name, unit in SENSORS.items():
+            keys.append((name, "humainze-iot", unit, attrs, "IOT", "", "gauge"))
+    rows = []
+    for i in range(POINTS):
+        for j, key in enumerate(keys):
+            rows.append((start + i * PERIOD_NS + j, round(100 * math.sin(i / 50 + j) + rng.gauss(0, 1), 2), key))
+    return rows
+
+
+def to_frame(fmt, body):
+    """O que o dashboard ou um notebook faria com o corpo recebido"""
+    if fmt == "arrow":
+        return pa.ipc.open_stream(io.BytesIO(body)).read_pandas()
+    df = pd.DataFrame(orjson.loads(body))
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df
+
+
+def best(fn):
+    elapsed = []
+    for _ in range(REPEAT):
+        begin = time.perf_counter()
+        result = fn()
+        elapsed.append(time.perf_counter() - begin)
+    return result, min(elapsed)
+
+
+def main():
+    rows = build_rows()
+    limit = min(len(rows), MAX_STREAM_LIMIT)
+    print(f"{DEVICES * len(SENSORS)} séries x {POINTS} pontos = {len(rows):,} pontos (consulta de {limit:,})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, "bench.db"))
+        storage.open()
+        writer = BatchWriter(storage, INSERT, before_write={"metrics": storage.series.intern_rows})
+        for i in range(0, len(rows), BATCH_ROWS):
+            batch = rows[i:i + BATCH_ROWS]
+            writer._flush({"metrics": batch}, len(batch))
+
+        query = build_select("metrics", ROLE_ADMIN, storage.partitions, limit=limit)
+        with storage.reader() as conn:
+            page, read_s = best(lambda: page_rows(conn, query)[0])
+        print(f"leitura do SQLite: {read_s * 1000:.0f} ms")
+
+        print(f"{'formato':<8} {'encode (ms)':>12} {'corpo (MB)':>11} {'DataFrame (ms)':>15}")
+        for fmt in ("json", "columns", "arrow"):
+            body, encode_s = best(lambda: encode_rows("metrics", page, fmt))
+            df, frame_s = best(lambda: to_frame(fmt, body))
+            assert len(df) == len(page)
+            print(f"{fmt:<8} {encode_s * 1000:>12.0f} {len(body) / 1e6:>11.2f} {frame_s * 1000:>15.0f}")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ingestão: OTLP/gRPC (4317) vs OTLP/HTTP protobuf (4318)
+
+Envia o mesmo ExportMetricsServiceRequest pelos dois transportes contra um
+collector em execução e compara requests/s e pontos/s.
+
+Uso: python scripts/bench_grpc_vs_http.py [requests] [pontos_por_request] [concorrencia]
+Variáveis: COLLECTOR_URL (padrão http://localhost:4318), COLLECTOR_GRPC (padrão localhost:4317)
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+import requests
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2, metrics_service_pb2_grpc
+from opentelemetry.proto.common.v1 import common_pb2
+
+COLLECTOR_URL = os.getenv("COLLECTOR_URL", "http://localhost:4318")
+COLLECTOR_GRPC = os.getenv("COLLECTOR_GRPC", "localhost:4317")
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+POINTS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+
+def kv(key, value):
+    attr = common_pb2.KeyValue(key=key)
+    attr.value.string_value = value
+    return attr
+
+
+def build_request(n):
+    req = metrics_service_pb2.ExportMetricsServiceRequest()
+    rm = req.resource_metrics.add()
+    rm.resource.attributes.extend([kv("service.name", "humainze-iot"), kv("team", "IOT"), kv("device.id", "ESP32-BENCH")])
+    metric = rm.scope_metrics.add().metrics.add(name="temperature", unit="celsius")
+    now = time.time_ns()
+    for i in range(n):
+        dp = metric.gauge.data_points.add(time_unix_nano=now + i, as_double=20.0 + (i % 50) / 10)
+        dp.attributes.extend([kv("sensor.type", "DHT22")])
+    return req
+
+
+def run(label, send):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        errors = sum(1 for ok in pool.map(lambda _: send(), range(REQUESTS)) if not ok)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<16} {elapsed:>8.2f}s {REQUESTS / elapsed:>10,.0f} req/s "
+          f"{REQUESTS * POINTS / elapsed:>12,.0f} pontos/s  erros={errors}")
+
+
+def main():
+    message = build_request(POINTS)
+    body = message.SerializeToString()
+    print(f"{REQUESTS} requests x {POINTS} pontos, concorrência {CONCURRENCY} ({len(body)} bytes/request)")
+
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=CONCURRENCY))
+
+    def send_http():
+        r = session.post(f"{COLLECTOR_URL}/v1/metrics", data=body,
+                         headers={"Content-Type": "application/x-protobuf"})
+        return r.ok
+
+    channel = grpc.insecure_channel(COLLECTOR_GRPC)
+    stub = metrics_service_pb2_grpc.MetricsServiceStub(channel)
+
+    def send_grpc():
+        try:
+            stub.Export(message, timeout=10)
+            return True
+        except grpc.RpcError:
+            return False
+
+    # Aquecimento das conexões
+    send_http()
+    send_grpc()
+
+    run("HTTP/protobuf", send_http)
+    run("gRPC", send_grpc)
+    channel.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do decodificador OTLP do collector (dashboard/collector_decoder.py)
+
+Mede pontos/s para metrics, traces e logs em três caminhos:
+  - protobuf nativo (decode_*_proto)
+  - OTLP/JSON camelCase (json.loads + decode_*_json)
+  - caminho antigo: ParseFromString + MessageToDict + walk do dict
+
+Uso: python scripts/bench_otlp_decoder.py [pontos_por_request] [repeticoes]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboard"))
+
+from google.protobuf.json_format import MessageToDict
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2
+from opentelemetry.proto.collector.logs.v1 import logs_service_pb2
+from opentelemetry.proto.common.v1 import common_pb2
+
+import collector_decoder as dec
+
+POINTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def kv(key, value):
+    attr = common_pb2.KeyValue(key=key)
+    if isinstance(value, bool):
+        attr.value.bool_value = value
+    elif isinstance(value, int):
+        attr.value.int_value = value
+    elif isinstance(value, float):
+        attr.value.double_value = value
+    else:
+        attr.value.string_value = value
+    return attr
+
+
+RESOURCE = [("service.name", "humainze-iot"), ("team", "IOT"), ("device.id", "ESP32-1234"), ("location", "office_1")]
+
+
+def build_metrics(n):
+    req = metrics_service_pb2.ExportMetricsServiceRequest()
+    rm = req.resource_metrics.add()
+    rm.resource.attributes.extend(kv(k, v) for k, v in RESOURCE)
+    metric = rm.scope_metrics.add().metrics.add(name="temperature", unit="celsius")
+    now = time.time_ns()
+    for i in range(n):
+        dp = metric.gauge.data_points.add(time_unix_nano=now + i, as_double=20.0 + (i % 50) / 10)
+        dp.attributes.extend([kv("sensor.type", "DHT22"), kv("sensor.index", i % 4)])
+    return req
+
+
+def build_traces(n):
+    req = trace_service_pb2.ExportTraceServiceRequest()
+    rs = req.resource_spans.add()
+    rs.resource.attributes.extend(kv(k, v) for k, v in RESOURCE)
+    scope = rs.scope_spans.add()
+    now = time.time_ns()
+    for i in range(n):
+        span = scope.spans.add(trace_id=os.urandom(16), span_id=os.urandom(8), name="sensor.read",
+                               start_time_unix_nano=now, end_time_unix_nano=now + 2_000_000)
+        span.attributes.extend([kv("http.method", "POST"), kv("retries", i % 3), kv("cached", i % 2 == 0)])
+    return req
+
+
+def build_logs(n):
+    req = logs_service_pb2.ExportLogsServiceRequest()
+    rl = req.resource_logs.add()
+    rl.resource.attributes.extend(kv(k, v) for k, v in RESOURCE)
+    scope = rl.scope_logs.add()
+    now = time.time_ns()
+    for i in range(n):
+        record = scope.log_records.add(time_unix_nano=now + i, severity_text="INFO")
+        record.body.string_value = f"leitura {i} concluída"
+        record.attributes.extend([kv("module", "sensor.reader")])
+    return req
+
+
+def bench(fn, arg):
+    fn(arg)  # aquecimento
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(arg)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def main():
+    signals = [
+        ("metrics", build_metrics, metrics_service_pb2.ExportMetricsServiceRequest,
+         dec.decode_metrics_proto, dec.decode_metrics_json),
+        ("traces", build_traces, trace_service_pb2.ExportTraceServiceRequest,
+         dec.decode_traces_proto, dec.decode_traces_json),
+        ("logs", build_logs, logs_service_pb2.ExportLogsServiceRequest,
+         dec.decode_logs_proto, dec.decode_logs_json),
+    ]
+
+    print(f"{POINTS} pontos por request, {REPEAT} repetições")
+    print(f"{'sinal':<8} {'caminho':<22} {'ms/request':>11} {'pontos/s':>12}")
+    for name, build, message_cls, decode_proto, decode_json in signals:
+        msg = build(POINTS)
+        proto_body = msg.SerializeToString()
+        # OTLP/JSON usa camelCase, que é o padrão do MessageToDict
+        json_body = json.dumps(MessageToDict(msg)).encode()
+
+        def legacy(body):
+            req = message_cls()
+            req.ParseFromString(body)
+            return decode_json(MessageToDict(req, preserving_proto_field_name=True))
+
+        paths = [
+            ("protobuf nativo", decode_proto, proto_body),
+            ("json camelCase", lambda b: decode_json(json.loads(b)), json_body),
+            ("protobuf MessageToDict", legacy, proto_body),
+        ]
+        for label, fn, body in paths:
+            elapsed = bench(fn, body)
+            print(f"{name:<8} {label:<22} {elapsed * 1000:>11.2f} {POINTS / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()